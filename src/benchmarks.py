@@ -0,0 +1,174 @@
+import copy
+import json
+import time
+import argparse
+import tempfile
+import overpass
+import openrouteservice
+
+from pathlib import Path
+from datetime import date
+
+from .route_generator import (
+    ORS_BASE_URL,
+    MAX_IN_FLIGHT_ORS_REQUESTS,
+    NUM_DAYS_TO_SIMULATE,
+    OUTPUT_FORMATS,
+    generate_population,
+)
+from .lib.generating_routes import generate_daily_routes_parallel, decode_route_geometry
+from .lib.async_routing import generate_daily_routes_async
+from .lib.polyline import decode_polyline
+from .lib.output import RECORD_TYPE_DAILY_ROUTE
+from .lib.columnar_store import ColumnarRouteReader
+from .lib.segment_store import SegmentRouteReader
+
+EXAMPLE_ROUTE_FILE_PATH = "openrouteservice_example_route.json"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks for the route generation")
+    parser.add_argument("benchmark", choices=["engines", "polyline", "output"])
+    parser.add_argument("--days", type=int, default=NUM_DAYS_TO_SIMULATE)
+    parser.add_argument("--max-in-flight", type=int, default=MAX_IN_FLIGHT_ORS_REQUESTS)
+    parser.add_argument("--route-file", default=EXAMPLE_ROUTE_FILE_PATH)
+    parser.add_argument("--repetitions", type=int, default=1000)
+    parser.add_argument(
+        "--route-store", help="Columnar route store with the routes for the output benchmark"
+    )
+    args = parser.parse_args()
+
+    if args.benchmark == "engines":
+        benchmark_engines(args.days, args.max_in_flight)
+    elif args.benchmark == "polyline":
+        benchmark_polyline_decoding(args.route_file, args.repetitions)
+    elif args.benchmark == "output":
+        if args.route_store is None:
+            parser.error("The output benchmark needs a --route-store")
+        benchmark_output_formats(args.route_store)
+
+
+def benchmark_engines(num_days_to_simulate: int, max_in_flight_requests: int):
+    # Compare the asyncio engine against the process based one on the same population.
+    # NOTE: No directions cache is used, so both engines have to ask ORS for every route
+    generated_people = generate_population(overpass.API())
+    start_date = date.today()
+
+    people_for_processes = copy.deepcopy(generated_people)
+    start_time = time.perf_counter()
+    generate_daily_routes_parallel(
+        start_date,
+        num_days_to_simulate,
+        people_for_processes,
+        openrouteservice.Client(base_url=ORS_BASE_URL),
+    )
+    processes_duration_seconds = time.perf_counter() - start_time
+
+    people_for_asyncio = copy.deepcopy(generated_people)
+    start_time = time.perf_counter()
+    generate_daily_routes_async(
+        start_date, num_days_to_simulate, people_for_asyncio, ORS_BASE_URL, max_in_flight_requests
+    )
+    asyncio_duration_seconds = time.perf_counter() - start_time
+
+    num_person_days = len(generated_people) * num_days_to_simulate
+    print(f"{len(generated_people)} people, {num_days_to_simulate} days:")
+    for engine_name, duration_seconds in [
+        ("Processes", processes_duration_seconds),
+        (f"Asyncio ({max_in_flight_requests} requests in flight)", asyncio_duration_seconds),
+    ]:
+        print(
+            f"{engine_name}: {duration_seconds:.2f}s "
+            f"({num_person_days / duration_seconds:.1f} person-days/s)"
+        )
+
+
+def benchmark_polyline_decoding(route_file_path: str, num_repetitions: int):
+    # Compare the pure Python decoder of openrouteservice against the vectorised one, and against
+    # requesting GeoJSON, where the coordinates only have to be converted to an array
+    with open(route_file_path, "r") as route_file:
+        encoded_geometry = json.load(route_file)["routes"][0]["geometry"]
+    geojson_coordinates = openrouteservice.convert.decode_polyline(encoded_geometry)["coordinates"]
+    if decode_polyline(encoded_geometry).tolist() != geojson_coordinates:
+        raise RuntimeError("The decoders don't return the same coordinates")
+
+    decoders = [
+        (
+            "openrouteservice",
+            lambda: openrouteservice.convert.decode_polyline(encoded_geometry)["coordinates"],
+        ),
+        ("Vectorised", lambda: decode_polyline(encoded_geometry)),
+        ("GeoJSON (no decoding)", lambda: decode_route_geometry(geojson_coordinates)),
+    ]
+    print(f"{len(geojson_coordinates)} waypoints, {num_repetitions} repetitions:")
+    for decoder_name, decode in decoders:
+        start_time = time.perf_counter()
+        for _ in range(num_repetitions):
+            decode()
+        duration_seconds = time.perf_counter() - start_time
+        print(f"{decoder_name}: {duration_seconds / num_repetitions * 1e6:.1f}µs per geometry")
+
+
+def _read_json_lines_routes(file_path: Path) -> list:
+    with open(file_path, "r") as json_lines_file:
+        return [
+            record
+            for record in map(json.loads, json_lines_file)
+            if record["type"] == RECORD_TYPE_DAILY_ROUTE
+        ]
+
+
+def _read_route_store_routes(route_reader_class, directory_path: Path) -> list:
+    # Copies the columns, as the columnar store would only return views of its memory-mapped files
+    return [
+        {column_name: column.copy() for column_name, column in trajectory.items()}
+        for _, _, trajectory in route_reader_class(directory_path).iter_trajectories()
+    ]
+
+
+def _get_size_bytes(path: Path) -> int:
+    if path.is_dir():
+        return sum(file_path.stat().st_size for file_path in path.iterdir())
+    return path.stat().st_size
+
+
+def benchmark_output_formats(route_store_path: str):
+    # Writes the routes of an existing columnar route store in every output format and reads all
+    # daily routes back from it
+    route_reader = ColumnarRouteReader(route_store_path)
+    people = route_reader.get_people()
+    daily_routes = [
+        (person_id, day_index, route_reader.get_daily_route(person_id, day_index))
+        for person_id, day_index, _ in route_reader.iter_trajectories()
+    ]
+    route_readers = {
+        "jsonl": _read_json_lines_routes,
+        "columnar": lambda path: _read_route_store_routes(ColumnarRouteReader, path),
+        "segments": lambda path: _read_route_store_routes(SegmentRouteReader, path),
+    }
+
+    num_waypoints = sum(len(daily_route) for _, _, daily_route in daily_routes)
+    print(f"{len(people)} people, {len(daily_routes)} daily routes, {num_waypoints} waypoints:")
+    with tempfile.TemporaryDirectory() as temporary_directory_path:
+        for output_format, (_, route_writer_class, _, _) in OUTPUT_FORMATS.items():
+            output_path = Path(temporary_directory_path) / output_format
+            start_time = time.perf_counter()
+            with route_writer_class(output_path) as route_writer:
+                for person_info in people:
+                    route_writer.write_person_info(person_info)
+                for person_id, day_index, daily_route in daily_routes:
+                    route_writer.write_daily_route(person_id, day_index, daily_route)
+            write_duration_seconds = time.perf_counter() - start_time
+
+            start_time = time.perf_counter()
+            route_readers[output_format](output_path)
+            read_duration_seconds = time.perf_counter() - start_time
+            print(
+                f"{output_format}: {_get_size_bytes(output_path) / 1024:.1f}KiB, "
+                f"writing {write_duration_seconds * 1000:.1f}ms, "
+                f"reading {read_duration_seconds * 1000:.1f}ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+import random
+
+from ..models import Place, Workplace
+
+
+class FenwickTree:
+    # Prefix sums over integer weights, where both updating a weight and finding the index that
+    # belongs to a prefix sum take O(log n)
+    def __init__(self, weights: list):
+        self._size = len(weights)
+        self._tree = [0] * (self._size + 1)
+        self._weights = [0] * self._size
+        for index, weight in enumerate(weights):
+            self.set_weight(index, weight)
+
+    def __len__(self):
+        return self._size
+
+    def get_weight(self, index: int) -> int:
+        return self._weights[index]
+
+    def set_weight(self, index: int, weight: int):
+        delta = weight - self._weights[index]
+        self._weights[index] = weight
+        tree_index = index + 1
+        while tree_index <= self._size:
+            self._tree[tree_index] += delta
+            tree_index += tree_index & -tree_index
+
+    def total(self) -> int:
+        total_weight = 0
+        tree_index = self._size
+        while tree_index > 0:
+            total_weight += self._tree[tree_index]
+            tree_index -= tree_index & -tree_index
+        return total_weight
+
+    def find(self, value: int) -> int:
+        # The smallest index whose prefix sum (including itself) is greater than the value
+        tree_index = 0
+        step = 1 << self._size.bit_length()
+        while step > 0:
+            next_tree_index = tree_index + step
+            if next_tree_index <= self._size and self._tree[next_tree_index] <= value:
+                tree_index = next_tree_index
+                value -= self._tree[next_tree_index]
+            step >>= 1
+        return tree_index
+
+
+class WorkplaceAllocator:
+    # Randomly picks workplaces that still have capacity without shuffling or scanning all of them.
+    # By default, every workplace with capacity left is equally likely, just like picking the first
+    # non-full one from a shuffled list. Alternatively, they can be weighted by their remaining capacity
+    def __init__(
+        self,
+        workplaces: list,
+        weight_by_remaining_capacity: bool = False,
+        random_generator: random.Random = None,
+    ):
+        self.workplaces = workplaces
+        self.weight_by_remaining_capacity = weight_by_remaining_capacity
+        # The global random state is used by default
+        self.random_generator = random_generator or random
+        self._weights = FenwickTree([self._get_weight(workplace) for workplace in self.workplaces])
+
+    def _get_weight(self, workplace: Workplace) -> int:
+        remaining_capacity = max(0, workplace.max_workers - workplace.current_people)
+        if self.weight_by_remaining_capacity:
+            return remaining_capacity
+        return 1 if remaining_capacity > 0 else 0
+
+    def allocate(self) -> Workplace:
+        # Returns None if all workplaces are full
+        total_weight = self._weights.total()
+        if total_weight == 0:
+            return None
+        workplace_index = self._weights.find(self.random_generator.randrange(total_weight))
+        workplace = self.workplaces[workplace_index]
+        workplace.current_people += 1
+        self._weights.set_weight(workplace_index, self._get_weight(workplace))
+        return workplace
+
+
+def iter_random_indexes(num_indexes: int, random_generator: random.Random = None):
+    # Yields all indexes from 0 to num_indexes - 1 in a random order, one at a time. This is a lazy
+    # Fisher-Yates shuffle, so taking only the first k of them costs O(k) instead of O(num_indexes)
+    random_generator = random_generator or random
+    swapped_indexes = dict()
+    for i in range(num_indexes):
+        j = random_generator.randrange(i, num_indexes)
+        chosen_index = swapped_indexes.get(j, j)
+        swapped_indexes[j] = swapped_indexes.get(i, i)
+        yield chosen_index
+
+
+def choose_random_places(
+    places: list,
+    num_places: int,
+    excluded_place: Place = None,
+    random_generator: random.Random = None,
+) -> list:
+    # Uniformly chooses up to num_places different places, none of which equals the excluded place
+    chosen_places = list()
+    if num_places <= 0:
+        return chosen_places
+    for place_index in iter_random_indexes(len(places), random_generator):
+        place = places[place_index]
+        if excluded_place is not None and place == excluded_place:
+            continue
+        chosen_places.append(place)
+        if len(chosen_places) == num_places:
+            break
+    return chosen_places
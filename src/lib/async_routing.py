@@ -0,0 +1,314 @@
+import asyncio
+import aiohttp
+
+from tqdm import tqdm
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from ..models import Person
+from ..lib.directions_cache import DirectionsCache
+from ..lib.retries import call_with_retries_async
+from ..lib.schedule import generate_schedule
+from ..lib.geojson_directions import (
+    GEOMETRY_FORMAT_POLYLINE,
+    convert_geojson_directions,
+    get_ors_response_format,
+)
+from ..lib.generating_routes import (
+    DIRECTIONS_PREFERENCE,
+    DIRECTIONS_UNITS,
+    print_failed_task,
+    check_directions_response,
+    get_directions_profile,
+    plan_daily_route_for_person,
+    route_template_from_directions,
+)
+
+DEFAULT_MAX_IN_FLIGHT_REQUESTS = 32
+DEFAULT_REQUEST_TIMEOUT_SECONDS = 60
+KEEP_ALIVE_TIMEOUT_SECONDS = 30
+# Daily routes are started as others finish, so that neither they nor their results pile up in
+# memory. Enough of them wait for a request slot to keep all slots busy
+MAX_PENDING_DAILY_ROUTES_PER_REQUEST = 4
+
+
+class AsyncORSClient:
+    # A small asynchronous counterpart to openrouteservice.Client that only supports directions.
+    # All requests share one pool of keep-alive connections and at most "max_in_flight_requests"
+    # requests are sent to ORS at the same time
+    def __init__(
+        self,
+        base_url: str,
+        max_in_flight_requests: int = DEFAULT_MAX_IN_FLIGHT_REQUESTS,
+        timeout_seconds: float = DEFAULT_REQUEST_TIMEOUT_SECONDS,
+        geometry_format: str = GEOMETRY_FORMAT_POLYLINE,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.max_in_flight_requests = max_in_flight_requests
+        self.timeout_seconds = timeout_seconds
+        self.geometry_format = geometry_format
+
+        self._session = None
+        self._in_flight_requests = None
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(
+            limit=self.max_in_flight_requests, keepalive_timeout=KEEP_ALIVE_TIMEOUT_SECONDS
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout_seconds)
+        )
+        self._in_flight_requests = asyncio.Semaphore(self.max_in_flight_requests)
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self._session.close()
+        self._session = None
+
+    async def directions(self, coords, profile: str, preference: str, units: str) -> dict:
+        # Same endpoint and parameters that openrouteservice.Client uses
+        response_format = get_ors_response_format(self.geometry_format)
+        request_body = {
+            "coordinates": [list(coord) for coord in coords],
+            "preference": preference,
+            "units": units,
+        }
+        async with self._in_flight_requests:
+            async with self._session.post(
+                f"{self.base_url}/v2/directions/{profile}/{response_format}", json=request_body
+            ) as response:
+                response.raise_for_status()
+                # GeoJSON is sent as "application/geo+json"
+                return convert_geojson_directions(await response.json(content_type=None))
+
+
+async def calculate_directions_async(
+    ors_client: AsyncORSClient,
+    coords,
+    use_cycling_profile=True,
+    directions_cache: DirectionsCache = None,
+    cache_executor: ThreadPoolExecutor = None,
+) -> dict:
+    # cache_executor: Runs the blocking SQLite calls of the cache, so that they don't hold up the
+    #   other requests. It must only have one thread, as the connection of the cache can't be used
+    #   by several threads at the same time. Without it, the calls are made in the event loop
+    profile_to_use = get_directions_profile(use_cycling_profile)
+    loop = asyncio.get_running_loop()
+
+    async def run_cache_call(function, *args):
+        if cache_executor is None:
+            return function(*args)
+        return await loop.run_in_executor(cache_executor, function, *args)
+
+    if directions_cache:
+        cached_directions = await run_cache_call(
+            directions_cache.get, profile_to_use, DIRECTIONS_PREFERENCE, DIRECTIONS_UNITS, coords
+        )
+        if cached_directions is not None:
+            return cached_directions
+
+    # Overloaded or restarting ORS instances are asked again after a while
+    directions = await call_with_retries_async(
+        _request_directions_async, ors_client, coords, profile_to_use
+    )
+
+    if directions_cache:
+        await run_cache_call(
+            directions_cache.put,
+            profile_to_use,
+            DIRECTIONS_PREFERENCE,
+            DIRECTIONS_UNITS,
+            coords,
+            directions,
+        )
+    return directions
+
+
+async def _request_directions_async(ors_client: AsyncORSClient, coords, profile: str) -> dict:
+    directions = await ors_client.directions(
+        coords, profile=profile, preference=DIRECTIONS_PREFERENCE, units=DIRECTIONS_UNITS
+    )
+    # Broken responses must not end up in the cache
+    check_directions_response(directions)
+    return directions
+
+
+async def _get_route_template_async(
+    person: Person,
+    coords: list,
+    ors_client: AsyncORSClient,
+    directions_cache: DirectionsCache,
+    cache_executor: ThreadPoolExecutor,
+    pending_route_templates: dict,
+):
+    route_template = person.get_route_template(coords)
+    if route_template:
+        return route_template
+
+    # Other days of the same person might already be waiting for this exact template
+    template_key = (person.id, tuple(coords))
+    pending_route_template = pending_route_templates.get(template_key)
+    if not pending_route_template:
+        pending_route_template = asyncio.ensure_future(
+            calculate_directions_async(
+                ors_client,
+                coords,
+                use_cycling_profile=False,
+                directions_cache=directions_cache,
+                cache_executor=cache_executor,
+            )
+        )
+        pending_route_templates[template_key] = pending_route_template
+    try:
+        calculated_route_info = await pending_route_template
+    finally:
+        # A failed request is only shared by the days that were already waiting for it, later days
+        # send a new one
+        if pending_route_templates.get(template_key) is pending_route_template:
+            del pending_route_templates[template_key]
+
+    route_template = person.get_route_template(coords)
+    if not route_template:
+        route_template = route_template_from_directions(
+            person.home_location, len(coords) - 1, calculated_route_info
+        )
+        person.set_route_template(coords, route_template)
+    return route_template
+
+
+async def _generate_all_daily_routes_async(
+    start_date: datetime.date,
+    num_days_to_simulate: int,
+    generated_people: list,
+    ors_client: AsyncORSClient,
+    directions_cache: DirectionsCache,
+    completed_tasks: set,
+    on_daily_route,
+    on_task_failed,
+    seed: int,
+):
+    pending_route_templates = dict()
+    # One thread for all calls to the directions cache, see calculate_directions_async
+    cache_executor = ThreadPoolExecutor(max_workers=1) if directions_cache else None
+
+    # NOTE: All random decisions are made up front by the schedule before anything is awaited
+    schedule = generate_schedule(generated_people, start_date, num_days_to_simulate, seed)
+
+    async def generate_daily_route(person: Person, person_index: int, day_index: int):
+        # A failing daily route doesn't take the others with it
+        try:
+            coords, stay_durations_seconds, start_of_day_timestamp = plan_daily_route_for_person(
+                person, schedule, person_index, day_index
+            )
+            route_template = await _get_route_template_async(
+                person,
+                coords,
+                ors_client,
+                directions_cache,
+                cache_executor,
+                pending_route_templates,
+            )
+        except Exception as error:
+            return person, day_index, None, f"{type(error).__name__}: {error}"
+        return (
+            person,
+            day_index,
+            route_template.to_daily_route(start_of_day_timestamp, stay_durations_seconds),
+            None,
+        )
+
+    num_tasks = sum(
+        (person.id, day_index) not in completed_tasks
+        for person in generated_people
+        for day_index in range(num_days_to_simulate)
+    )
+    new_daily_route_tasks = (
+        (person, person_index, day_index)
+        for person_index, person in enumerate(generated_people)
+        for day_index in range(num_days_to_simulate)
+        if (person.id, day_index) not in completed_tasks
+    )
+    max_pending_daily_routes = (
+        MAX_PENDING_DAILY_ROUTES_PER_REQUEST * ors_client.max_in_flight_requests
+    )
+    # Without a callback, the people get their daily routes at the end, in the order of the days
+    daily_routes_by_task = dict()
+    pending_daily_routes = set()
+    try:
+        with tqdm(total=num_tasks) as progress_bar:
+            while True:
+                while len(pending_daily_routes) < max_pending_daily_routes:
+                    daily_route_task = next(new_daily_route_tasks, None)
+                    if daily_route_task is None:
+                        break
+                    pending_daily_routes.add(
+                        asyncio.ensure_future(generate_daily_route(*daily_route_task))
+                    )
+                if not pending_daily_routes:
+                    break
+
+                finished_daily_routes, pending_daily_routes = await asyncio.wait(
+                    pending_daily_routes, return_when=asyncio.FIRST_COMPLETED
+                )
+                for finished_daily_route in finished_daily_routes:
+                    person, day_index, daily_route, error_message = finished_daily_route.result()
+                    if error_message is not None:
+                        on_task_failed(person, day_index, error_message)
+                    elif on_daily_route:
+                        on_daily_route(person, day_index, daily_route)
+                    else:
+                        daily_routes_by_task[(person.id, day_index)] = daily_route
+                    progress_bar.update(1)
+    finally:
+        for pending_daily_route in pending_daily_routes:
+            pending_daily_route.cancel()
+        if cache_executor is not None:
+            cache_executor.shutdown()
+
+    for person in generated_people:
+        for day_index in range(num_days_to_simulate):
+            daily_route = daily_routes_by_task.pop((person.id, day_index), None)
+            if daily_route is not None:
+                person.add_route(daily_route)
+
+
+def generate_daily_routes_async(
+    start_date: datetime.date,
+    num_days_to_simulate: int,
+    generated_people: list,
+    ors_base_url: str,
+    max_in_flight_requests: int = DEFAULT_MAX_IN_FLIGHT_REQUESTS,
+    directions_cache: DirectionsCache = None,
+    completed_tasks: set = None,
+    on_daily_route=None,
+    on_task_failed=None,
+    seed: int = None,
+    geometry_format: str = GEOMETRY_FORMAT_POLYLINE,
+) -> list:
+    # Runs all person-days concurrently in this single process, which suits the I/O bound work well.
+    # NOTE: Only the default (densified) mode is supported, which needs one request per route template
+    # completed_tasks: (person id, day index) pairs that are skipped. The people only get the routes
+    #   of the other days then
+    # on_daily_route: Called with (person, day index, daily route) as soon as a daily route is done.
+    #   The people don't keep their daily routes then
+    # on_task_failed: Called with (person, day index, error message) if a daily route failed even
+    #   after retrying its requests. The person doesn't get a route for that day then
+    async def run():
+        async with AsyncORSClient(
+            ors_base_url, max_in_flight_requests, geometry_format=geometry_format
+        ) as ors_client:
+            await _generate_all_daily_routes_async(
+                start_date,
+                num_days_to_simulate,
+                generated_people,
+                ors_client,
+                directions_cache,
+                completed_tasks or set(),
+                on_daily_route,
+                on_task_failed or print_failed_task,
+                seed,
+            )
+
+    asyncio.run(run())
+    print(f"Successfully generated daily routes for all people.")
+    return generated_people
@@ -0,0 +1,107 @@
+import os
+import pickle
+import sqlite3
+
+from array import array
+from pathlib import Path
+from datetime import date
+
+from ..models import DailyRoute
+
+DEFAULT_CHECKPOINT_DIRECTORY = "checkpoints"
+WORLD_FILE_NAME = "world.pickle"
+DAILY_ROUTES_FILE_NAME = "daily_routes.sqlite"
+
+
+class CheckpointStore:
+    # Keeps everything that is needed to continue an interrupted run:
+    # - "world.pickle": The generated people (and their places), the start date, number of days
+    #   and seed
+    # - "daily_routes.sqlite": Every finished daily route, committed as soon as it arrives
+    def __init__(self, directory_path: str = DEFAULT_CHECKPOINT_DIRECTORY):
+        self.directory_path = Path(directory_path)
+        self.directory_path.mkdir(parents=True, exist_ok=True)
+        # Autocommit mode, so that each daily route is on disk right after it was added
+        self._connection = sqlite3.connect(
+            self.directory_path / DAILY_ROUTES_FILE_NAME, timeout=60, isolation_level=None
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS daily_routes ("
+            "person INTEGER NOT NULL, day INTEGER NOT NULL, "
+            "latitudes BLOB NOT NULL, longitudes BLOB NOT NULL, timestamps BLOB NOT NULL, "
+            "PRIMARY KEY (person, day))"
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self._connection.close()
+
+    def has_run(self) -> bool:
+        return (self.directory_path / WORLD_FILE_NAME).exists()
+
+    def start_run(
+        self, people: list, start_date: date, num_days_to_simulate: int, seed: int = None
+    ):
+        # Discards the daily routes of any previous run
+        self._connection.execute("DELETE FROM daily_routes")
+        world_file_path = self.directory_path / WORLD_FILE_NAME
+        # Written to a temporary file first, so that a crash can't leave a broken world behind
+        temporary_file_path = world_file_path.with_suffix(".tmp")
+        with open(temporary_file_path, "wb") as world_file:
+            pickle.dump(
+                {
+                    "people": people,
+                    "start_date": start_date,
+                    "num_days_to_simulate": num_days_to_simulate,
+                    "seed": seed,
+                },
+                world_file,
+                protocol=pickle.HIGHEST_PROTOCOL,
+            )
+        os.replace(temporary_file_path, world_file_path)
+
+    def load_run(self) -> (list, date, int, int):
+        # Returns the people, the start date, the number of days and the seed (or None)
+        with open(self.directory_path / WORLD_FILE_NAME, "rb") as world_file:
+            world_info = pickle.load(world_file)
+        return (
+            world_info["people"],
+            world_info["start_date"],
+            world_info["num_days_to_simulate"],
+            world_info.get("seed"),
+        )
+
+    def add_daily_route(self, person_id: int, day_index: int, daily_route: DailyRoute):
+        self._connection.execute(
+            "INSERT OR REPLACE INTO daily_routes VALUES (?, ?, ?, ?, ?)",
+            (
+                person_id,
+                day_index,
+                daily_route.get_latitudes().tobytes(),
+                daily_route.get_longitudes().tobytes(),
+                daily_route.get_timestamps().tobytes(),
+            ),
+        )
+
+    def get_completed_tasks(self) -> set:
+        # (person id, day index) of all daily routes that are done
+        return set(self._connection.execute("SELECT person, day FROM daily_routes").fetchall())
+
+    def iter_daily_routes(self):
+        # Yields (person id, day index, daily route) sorted by person and day
+        for person_id, day_index, latitudes, longitudes, timestamps in self._connection.execute(
+            "SELECT person, day, latitudes, longitudes, timestamps FROM daily_routes "
+            "ORDER BY person, day"
+        ):
+            daily_route = DailyRoute()
+            daily_route.add_waypoints(
+                array("d", latitudes), array("d", longitudes), array("d", timestamps)
+            )
+            yield person_id, day_index, daily_route
@@ -0,0 +1,283 @@
+import abc
+import sys
+import json
+import numpy as np
+
+from array import array
+from pathlib import Path
+
+from ..models import Person, DailyRoute
+
+# Layout of a route store directory:
+# - "meta.json": Format version, data type of the columns and number of waypoints
+# - "people.jsonl": One JSON line with the information about each person
+# - "latitudes.bin", "longitudes.bin", "timestamps.bin": All waypoints of all daily routes,
+#   one raw float64 column each. A daily route is a contiguous range of rows
+# - "index.npy": One row per daily route (person id, day index, first row, row after the last row),
+#   sorted by person id and day index
+STORE_FORMAT_VERSION = 1
+META_FILE_NAME = "meta.json"
+PEOPLE_FILE_NAME = "people.jsonl"
+INDEX_FILE_NAME = "index.npy"
+COLUMN_FILE_NAMES = {
+    "latitudes": "latitudes.bin",
+    "longitudes": "longitudes.bin",
+    "timestamps": "timestamps.bin",
+}
+INDEX_DTYPE = np.dtype([("person", "<i8"), ("day", "<i8"), ("start", "<i8"), ("stop", "<i8")])
+
+
+def save_route_index(
+    directory_path: Path, persons: array, days: array, starts: array, num_rows: int
+):
+    # persons, days, starts: One value per daily route in the order they were written. A daily route
+    # ends where the next one starts, the last one at num_rows
+    index = np.empty(len(persons), dtype=INDEX_DTYPE)
+    index["person"] = np.frombuffer(persons, dtype=np.int64)
+    index["day"] = np.frombuffer(days, dtype=np.int64)
+    index["start"] = np.frombuffer(starts, dtype=np.int64)
+    index["stop"] = np.append(index["start"][1:], num_rows)
+    # The routes were written in the order they were done, but are looked up by person and day
+    index = index[np.lexsort((index["day"], index["person"]))]
+    np.save(directory_path / INDEX_FILE_NAME, index)
+
+
+class ColumnarRouteWriter:
+    # Same interface as JsonLinesRouteWriter. The waypoint columns are appended to while generating,
+    # only the (small) index is written at the end
+    def __init__(self, directory_path: str):
+        self.directory_path = Path(directory_path)
+        self.directory_path.mkdir(parents=True, exist_ok=True)
+        self._people_file = open(self.directory_path / PEOPLE_FILE_NAME, "w")
+        self._column_files = {
+            column_name: open(self.directory_path / file_name, "wb")
+            for column_name, file_name in COLUMN_FILE_NAMES.items()
+        }
+        self._index_persons = array("q")
+        self._index_days = array("q")
+        self._index_starts = array("q")
+        self._num_waypoints = 0
+        self._is_closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write_person(self, person: Person):
+        self.write_person_info(person.to_dict())
+
+    def write_person_info(self, person_info: dict):
+        # person_info: As returned by Person.to_dict
+        self._people_file.write(json.dumps(person_info))
+        self._people_file.write("\n")
+
+    def write_daily_route(self, person_id: int, day_index: int, daily_route: DailyRoute):
+        # The arrays of the daily route are written as they are, without converting them first
+        self.write_trajectory(
+            person_id,
+            day_index,
+            daily_route.get_latitudes(),
+            daily_route.get_longitudes(),
+            daily_route.get_timestamps(),
+        )
+
+    def write_trajectory(self, person_id: int, day_index: int, latitudes, longitudes, timestamps):
+        # The columns can be anything with the buffer protocol that contains float64 values
+        self._column_files["latitudes"].write(latitudes)
+        self._column_files["longitudes"].write(longitudes)
+        self._column_files["timestamps"].write(timestamps)
+
+        self._index_persons.append(person_id)
+        self._index_days.append(day_index)
+        self._index_starts.append(self._num_waypoints)
+        self._num_waypoints += len(latitudes)
+
+    def close(self):
+        if self._is_closed:
+            return
+        self._is_closed = True
+        self._people_file.close()
+        for column_file in self._column_files.values():
+            column_file.close()
+
+        save_route_index(
+            self.directory_path,
+            self._index_persons,
+            self._index_days,
+            self._index_starts,
+            self._num_waypoints,
+        )
+
+        meta_info = {
+            "version": STORE_FORMAT_VERSION,
+            # The columns are written in the native byte order of this machine
+            "dtype": "<f8" if sys.byteorder == "little" else ">f8",
+            "num_waypoints": self._num_waypoints,
+        }
+        with open(self.directory_path / META_FILE_NAME, "w") as meta_file:
+            json.dump(meta_info, meta_file)
+
+
+class RouteStoreReader(abc.ABC):
+    # Looks up the daily routes of a route store by person and day, the same for every format of
+    # store. Subclasses read the trajectory of an index entry in _read_trajectory
+    def __init__(self, directory_path: str):
+        self.directory_path = Path(directory_path)
+        self._index = np.load(self.directory_path / INDEX_FILE_NAME, mmap_mode="r")
+        self._people = None
+
+    def __len__(self):
+        return len(self._index)
+
+    def get_people(self) -> list:
+        # Only loaded when needed
+        if self._people is None:
+            with open(self.directory_path / PEOPLE_FILE_NAME, "r") as people_file:
+                self._people = [json.loads(line) for line in people_file if line.strip()]
+        return self._people
+
+    def get_day_indexes(self) -> np.ndarray:
+        return np.unique(self._index["day"])
+
+    def get_days(self, person_id: int) -> np.ndarray:
+        first_row, last_row = self._get_rows_of_person(person_id)
+        return np.asarray(self._index["day"][first_row:last_row])
+
+    def _get_rows_of_person(self, person_id: int) -> (int, int):
+        persons = self._index["person"]
+        return (
+            int(np.searchsorted(persons, person_id, side="left")),
+            int(np.searchsorted(persons, person_id, side="right")),
+        )
+
+    def _find_row(self, person_id: int, day_index: int) -> int:
+        first_row, last_row = self._get_rows_of_person(person_id)
+        row = first_row + int(
+            np.searchsorted(self._index["day"][first_row:last_row], day_index, side="left")
+        )
+        if row >= last_row or self._index["day"][row] != day_index:
+            raise KeyError(f"No daily route for person {person_id} on day {day_index}")
+        return row
+
+    @abc.abstractmethod
+    def _read_trajectory(self, index_entry) -> dict:
+        pass
+
+    def get_trajectory(self, person_id: int, day_index: int) -> dict:
+        # {"latitudes": ..., "longitudes": ..., "timestamps": ...} as float64 arrays
+        return self._read_trajectory(self._index[self._find_row(person_id, day_index)])
+
+    def get_daily_route(self, person_id: int, day_index: int) -> DailyRoute:
+        trajectory = self.get_trajectory(person_id, day_index)
+        daily_route = DailyRoute()
+        daily_route.add_waypoints(
+            trajectory["latitudes"], trajectory["longitudes"], trajectory["timestamps"]
+        )
+        return daily_route
+
+    def iter_trajectories(self):
+        # Yields (person id, day index, trajectory) sorted by person and day
+        for index_entry in self._index:
+            yield (
+                int(index_entry["person"]),
+                int(index_entry["day"]),
+                self._read_trajectory(index_entry),
+            )
+
+
+class ColumnarRouteReader(RouteStoreReader):
+    # Memory-maps a route store, so that reading one daily route only touches that part of the files
+    def __init__(self, directory_path: str):
+        super().__init__(directory_path)
+        with open(self.directory_path / META_FILE_NAME, "r") as meta_file:
+            meta_info = json.load(meta_file)
+        if meta_info["version"] != STORE_FORMAT_VERSION:
+            raise ValueError(f"Unsupported route store version: {meta_info['version']}")
+
+        self._columns = dict()
+        for column_name, file_name in COLUMN_FILE_NAMES.items():
+            if meta_info["num_waypoints"] == 0:
+                # Empty files can't be memory-mapped
+                self._columns[column_name] = np.empty(0, dtype=meta_info["dtype"])
+            else:
+                self._columns[column_name] = np.memmap(
+                    self.directory_path / file_name,
+                    dtype=meta_info["dtype"],
+                    mode="r",
+                    shape=(meta_info["num_waypoints"],),
+                )
+
+    def _read_trajectory(self, index_entry) -> dict:
+        # Read-only views into the memory-mapped columns, nothing is copied
+        waypoint_slice = slice(int(index_entry["start"]), int(index_entry["stop"]))
+        return {
+            column_name: column[waypoint_slice] for column_name, column in self._columns.items()
+        }
+
+
+def convert_route_store_to_dataset(
+    route_reader: RouteStoreReader, output_file_path: str, num_days: int = None
+):
+    # Produces the same single JSON file layout as convert_json_lines_to_dataset, with the same
+    # days: num_days of them, or up to the last one with a daily route by default
+    people = route_reader.get_people()
+    if num_days is None:
+        day_indexes = route_reader.get_day_indexes()
+        num_days = int(day_indexes[-1]) + 1 if len(day_indexes) > 0 else 0
+
+    Path(output_file_path).parent.mkdir(parents=True, exist_ok=True)
+    with open(output_file_path, "w") as out_file:
+        out_file.write('{"people": ')
+        out_file.write(json.dumps(people))
+        out_file.write(', "daily_routes": [')
+        for day_index in range(num_days):
+            if day_index > 0:
+                out_file.write(", ")
+            out_file.write("[")
+            is_first_route = True
+            for person_info in people:
+                try:
+                    daily_route = route_reader.get_daily_route(person_info["id"], day_index)
+                except KeyError:
+                    continue
+                daily_route_info = daily_route.to_dict()
+                daily_route_info["person"] = person_info["id"]
+                if not is_first_route:
+                    out_file.write(", ")
+                out_file.write(json.dumps(daily_route_info))
+                is_first_route = False
+            out_file.write("]")
+        out_file.write("]}")
+
+
+def convert_columnar_store_to_dataset(
+    directory_path: str, output_file_path: str, num_days: int = None
+):
+    convert_route_store_to_dataset(ColumnarRouteReader(directory_path), output_file_path, num_days)
+
+
+def merge_route_stores(
+    route_reader_class, route_writer_class, directory_paths: list, output_directory_path: str
+):
+    # Combines the route stores of several shards into one
+    with route_writer_class(output_directory_path) as route_writer:
+        for directory_path in directory_paths:
+            route_reader = route_reader_class(directory_path)
+            for person_info in route_reader.get_people():
+                route_writer.write_person_info(person_info)
+            for person_id, day_index, trajectory in route_reader.iter_trajectories():
+                route_writer.write_trajectory(
+                    person_id,
+                    day_index,
+                    np.ascontiguousarray(trajectory["latitudes"], dtype=np.float64),
+                    np.ascontiguousarray(trajectory["longitudes"], dtype=np.float64),
+                    np.ascontiguousarray(trajectory["timestamps"], dtype=np.float64),
+                )
+
+
+def merge_columnar_stores(directory_paths: list, output_directory_path: str):
+    merge_route_stores(
+        ColumnarRouteReader, ColumnarRouteWriter, directory_paths, output_directory_path
+    )
@@ -0,0 +1,220 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+
+from pathlib import Path
+
+DEFAULT_CACHE_FILE_PATH = "cache/directions_cache.sqlite"
+DEFAULT_MAX_SIZE_BYTES = 2 * 1024**3
+# 6 decimal places are roughly 10cm, which is far below what makes a difference to the routing
+DEFAULT_COORDINATE_PRECISION = 6
+# When the cache is too big, evict down to this fraction of the maximum size so that not every
+# single insert has to evict something
+EVICTION_TARGET_RATIO = 0.9
+# Reads don't write to the database, so that workers with a warm cache don't have to wait for each
+# other's write lock. The hit and miss counts are written after this many lookups instead, and the
+# time an entry was last used is only updated once it is older than this (the eviction only needs a
+# rough order)
+STATS_FLUSH_INTERVAL_LOOKUPS = 100
+LAST_ACCESSED_UPDATE_INTERVAL_SECONDS = 60 * 60
+
+
+class DirectionsCache:
+    def __init__(
+        self,
+        file_path: str = DEFAULT_CACHE_FILE_PATH,
+        max_size_bytes: int = DEFAULT_MAX_SIZE_BYTES,
+        coordinate_precision: int = DEFAULT_COORDINATE_PRECISION,
+    ):
+        self.file_path = file_path
+        self.max_size_bytes = max_size_bytes
+        self.coordinate_precision = coordinate_precision
+        # Counters for this process only. The totals of all processes are kept in the database
+        self.hits = 0
+        self.misses = 0
+        # Not written to the database yet. NOTE: They are lost if a process ends without calling
+        # flush or close, so the totals in the database are only approximate
+        self._unflushed_hits = 0
+        self._unflushed_misses = 0
+        # Key -> time of the last lookup, for entries whose stored time is outdated
+        self._unflushed_accesses = dict()
+
+        self._connection = None
+        self._connection_pid = None
+        # Set up the file before any worker process opens it. Switching a new file to WAL mode in
+        # several processes at once fails instead of waiting for the busy timeout
+        self._get_connection()
+
+    def __getstate__(self):
+        # SQLite connections can't be shared between processes. Each worker opens its own one
+        state = self.__dict__.copy()
+        state["_connection"] = None
+        state["_connection_pid"] = None
+        # Every process only writes its own counts
+        state["_unflushed_hits"] = 0
+        state["_unflushed_misses"] = 0
+        state["_unflushed_accesses"] = dict()
+        return state
+
+    def _get_connection(self) -> sqlite3.Connection:
+        if self._connection is None or self._connection_pid != os.getpid():
+            Path(self.file_path).parent.mkdir(parents=True, exist_ok=True)
+            # Autocommit mode, transactions are started explicitly. The connection may be used by
+            # another thread than the one that opened it, as long as only one thread uses it at a
+            # time, e.g. the thread of the async engine that makes all calls to the cache
+            connection = sqlite3.connect(
+                self.file_path, timeout=60, isolation_level=None, check_same_thread=False
+            )
+            # WAL allows readers in other processes while one of them is writing
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS directions ("
+                "key TEXT PRIMARY KEY, response TEXT NOT NULL, "
+                "size INTEGER NOT NULL, last_accessed REAL NOT NULL)"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS directions_last_accessed ON directions (last_accessed)"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL)"
+            )
+            connection.execute(
+                "INSERT OR IGNORE INTO stats (name, value) "
+                "VALUES ('hits', 0), ('misses', 0), ('total_size', 0)"
+            )
+            self._connection = connection
+            self._connection_pid = os.getpid()
+        return self._connection
+
+    def make_key(self, profile: str, preference: str, units: str, coords) -> str:
+        rounded_coords = [
+            [round(lon, self.coordinate_precision), round(lat, self.coordinate_precision)]
+            for lon, lat in coords
+        ]
+        key_info = json.dumps([profile, preference, units, rounded_coords], separators=(",", ":"))
+        return hashlib.sha256(key_info.encode("utf-8")).hexdigest()
+
+    def get(self, profile: str, preference: str, units: str, coords):
+        key = self.make_key(profile, preference, units, coords)
+        # A plain read, which doesn't block or wait for any other process
+        row = (
+            self._get_connection()
+            .execute("SELECT response, last_accessed FROM directions WHERE key = ?", (key,))
+            .fetchone()
+        )
+        now = time.time()
+        if row is None:
+            self.misses += 1
+            self._unflushed_misses += 1
+        else:
+            self.hits += 1
+            self._unflushed_hits += 1
+            # Remember when this entry was last used to evict the least recently used ones first
+            if now - row[1] >= LAST_ACCESSED_UPDATE_INTERVAL_SECONDS:
+                self._unflushed_accesses[key] = now
+        if self._unflushed_hits + self._unflushed_misses >= STATS_FLUSH_INTERVAL_LOOKUPS:
+            self.flush()
+
+        if row is None:
+            return None
+        return json.loads(row[0])
+
+    def _write_unflushed(self, connection: sqlite3.Connection):
+        # Has to be called inside of a write transaction
+        connection.execute(
+            "UPDATE stats SET value = value + ? WHERE name = 'hits'", (self._unflushed_hits,)
+        )
+        connection.execute(
+            "UPDATE stats SET value = value + ? WHERE name = 'misses'", (self._unflushed_misses,)
+        )
+        connection.executemany(
+            "UPDATE directions SET last_accessed = MAX(last_accessed, ?) WHERE key = ?",
+            [(accessed, key) for key, accessed in self._unflushed_accesses.items()],
+        )
+        self._unflushed_hits = 0
+        self._unflushed_misses = 0
+        self._unflushed_accesses.clear()
+
+    def flush(self):
+        # Writes the counts and access times of the lookups of this process to the database
+        if not (self._unflushed_hits or self._unflushed_misses or self._unflushed_accesses):
+            return
+        connection = self._get_connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            self._write_unflushed(connection)
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    def put(self, profile: str, preference: str, units: str, coords, response: dict):
+        key = self.make_key(profile, preference, units, coords)
+        serialized_response = json.dumps(response, separators=(",", ":"))
+        size = len(serialized_response)
+        if size > self.max_size_bytes:
+            return
+
+        connection = self._get_connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            previous_entry = connection.execute(
+                "SELECT size FROM directions WHERE key = ?", (key,)
+            ).fetchone()
+            size_difference = size - (previous_entry[0] if previous_entry else 0)
+            connection.execute(
+                "INSERT OR REPLACE INTO directions (key, response, size, last_accessed) "
+                "VALUES (?, ?, ?, ?)",
+                (key, serialized_response, size, time.time()),
+            )
+            connection.execute(
+                "UPDATE stats SET value = value + ? WHERE name = 'total_size'", (size_difference,)
+            )
+            # This process holds the write lock anyway
+            self._write_unflushed(connection)
+            self._evict_if_necessary(connection)
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    def _evict_if_necessary(self, connection: sqlite3.Connection):
+        total_size = connection.execute(
+            "SELECT value FROM stats WHERE name = 'total_size'"
+        ).fetchone()[0]
+        if total_size <= self.max_size_bytes:
+            return
+
+        target_size = int(self.max_size_bytes * EVICTION_TARGET_RATIO)
+        evicted_keys = list()
+        for key, size in connection.execute(
+            "SELECT key, size FROM directions ORDER BY last_accessed ASC"
+        ):
+            if total_size <= target_size:
+                break
+            evicted_keys.append((key,))
+            total_size -= size
+        connection.executemany("DELETE FROM directions WHERE key = ?", evicted_keys)
+        connection.execute(
+            "UPDATE stats SET value = ? WHERE name = 'total_size'",
+            (total_size,),
+        )
+
+    def get_stats(self) -> dict:
+        # The totals across all processes that used this cache file, including earlier runs
+        self.flush()
+        connection = self._get_connection()
+        stats = dict(connection.execute("SELECT name, value FROM stats").fetchall())
+        stats["entries"] = connection.execute("SELECT COUNT(*) FROM directions").fetchone()[0]
+        return stats
+
+    def close(self):
+        if self._connection is not None and self._connection_pid == os.getpid():
+            self.flush()
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+            self._connection_pid = None
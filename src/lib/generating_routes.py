@@ -1,295 +1,701 @@
-import random
+import os
+import math
+import itertools
+import numpy as np
 import openrouteservice
 
 from tqdm import tqdm
-from datetime import datetime, timedelta
-from multiprocessing import Process, Queue, Pipe
-
-from ..models import Person, Position, DailyRoute
-from ..lib.random_time import get_random_time_in_timeframe
+from datetime import datetime
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+
+from ..models import Person, Position, DailyRoute, RouteTemplate
+from ..lib.geometry import haversine_distances_m
+from ..lib.polyline import decode_polyline
+from ..lib.directions_cache import DirectionsCache
+from ..lib.retries import MalformedResponseError, call_with_retries
+from ..lib.schedule import Schedule, generate_schedule
+from ..lib.world_state import WorldState, temporary_world_state
+
+DIRECTIONS_PREFERENCE = "fastest"
+DIRECTIONS_UNITS = "m"
+
+# Number of requests a single ORS instance is assumed to handle at the same time if not known better
+DEFAULT_ORS_CAPACITY = 8
+# Upper bound for the automatically chosen number of worker processes, as they mostly wait for ORS
+MAX_PROCESSES_PER_CPU = 8
+# Split the work into roughly this many chunks per worker process to balance the load
+CHUNKS_PER_PROCESS = 4
+MAX_PENDING_CHUNKS_PER_PROCESS = 2
+# Tasks that fail (after the retries of single ORS requests) or whose worker crashes are tried again
+# this often in total. Then they are reported as failed instead
+MAX_TASK_ATTEMPTS = 3
+
+
+def get_directions_profile(use_cycling_profile=True) -> str:
+    if use_cycling_profile:
+        return "cycling-regular"
+    return "driving-car"
 
 
 def calculate_directions(
-    ors_client: openrouteservice.Client, coords, use_cycling_profile=True
+    ors_client: openrouteservice.Client,
+    coords,
+    use_cycling_profile=True,
+    directions_cache: DirectionsCache = None,
 ) -> dict:
-    if use_cycling_profile:
-        profile_to_use = "cycling-regular"
-    else:
-        profile_to_use = "driving-car"
-
-    return ors_client.directions(
-        coords,
-        profile=profile_to_use,
-        preference="fastest",
-        units="m",
+    # NOTE: The ORS client can be any routing backend with the same "directions" method,
+    # e.g. a LocalRoutingEngine
+    profile_to_use = get_directions_profile(use_cycling_profile)
+    preference = DIRECTIONS_PREFERENCE
+    units = DIRECTIONS_UNITS
+
+    if directions_cache:
+        cached_directions = directions_cache.get(profile_to_use, preference, units, coords)
+        if cached_directions is not None:
+            return cached_directions
+
+    # Overloaded or restarting ORS instances are asked again after a while
+    directions = call_with_retries(
+        _request_directions, ors_client, coords, profile_to_use, preference, units
     )
 
+    if directions_cache:
+        directions_cache.put(profile_to_use, preference, units, coords, directions)
+    return directions
+
+
+def _request_directions(
+    ors_client: openrouteservice.Client, coords, profile: str, preference: str, units: str
+) -> dict:
+    directions = ors_client.directions(coords, profile=profile, preference=preference, units=units)
+    # Broken responses must not end up in the cache
+    check_directions_response(directions)
+    return directions
+
+
+def check_directions_response(directions: dict):
+    if not isinstance(directions, dict) or not directions.get("routes"):
+        raise MalformedResponseError(f"Directions response without routes: {directions}"[:500])
+
 
 def generate_daily_routes_sequentially(
     start_date: datetime.date,
     num_days_to_simulate: int,
     generated_people: list,
     ors_client: openrouteservice.Client,
+    high_fidelity: bool = False,
+    directions_cache: DirectionsCache = None,
+    seed: int = None,
 ):
-    for person in tqdm(generated_people):
-        current_date = start_date
+    schedule = generate_schedule(generated_people, start_date, num_days_to_simulate, seed)
+    for person_index, person in enumerate(tqdm(generated_people)):
         for day in range(num_days_to_simulate):
             daily_route_for_person = generate_daily_route_for_person(
-                person, current_date, ors_client
+                person,
+                schedule,
+                person_index,
+                day,
+                ors_client,
+                high_fidelity,
+                directions_cache,
             )
             person.add_route(daily_route_for_person)
             # print("Daily route for person:")
             # print(daily_route_for_person)
-            current_date += timedelta(days=1)
 
 
 def generate_daily_route_for_person(
-    person: Person, current_date, ors_client: openrouteservice.Client
+    person: Person,
+    schedule: Schedule,
+    person_index: int,
+    day_index: int,
+    ors_client: openrouteservice.Client,
+    high_fidelity: bool = False,
+    directions_cache: DirectionsCache = None,
 ) -> DailyRoute:
-    # print(f"Generating traffic data for '{current_date}'...")
-    daily_route_for_person = DailyRoute()
+    # person_index: Index of the person in the schedule
+    coords, stay_durations_seconds, start_of_day_timestamp = plan_daily_route_for_person(
+        person, schedule, person_index, day_index
+    )
 
-    # Handle weekdays and weekends differently to make it more realistic
-    is_weekend = current_date.weekday() >= 5
+    # The geometry of this chain of routes is the same on every day, only the timing differs
+    route_template = person.get_route_template(coords)
+    if not route_template:
+        route_template = build_route_template(
+            person.home_location, coords, ors_client, high_fidelity, directions_cache
+        )
+        person.set_route_template(coords, route_template)
+
+    return route_template.to_daily_route(start_of_day_timestamp, stay_durations_seconds)
+
+
+def plan_daily_route_for_person(
+    person: Person, schedule: Schedule, person_index: int, day_index: int
+) -> (list, list, float):
+    # Turns the scheduled day of this person into the chain of routes, the stay durations (seconds)
+    # and the time they leave home (seconds since the epoch). All random decisions were made by the
+    # schedule already
+    free_time_place_id = int(schedule.free_time_place_ids[person_index, day_index])
+    if free_time_place_id < 0:
+        raise ValueError(f"Person {person.id} has no favorite free time places")
 
     # Calculate a route from their home to their workplace, then to a route to a random free time place and back home
     # This is done in one step and the data is then separated for the sake of this simulation
     home_location = person.home_location
-    workplace = person.workplace
-    random_free_time_place = random.choice(person.favorite_free_time_places)
-
-    stay_duration_free_time_hours = (
-        random_free_time_place.typical_stay_duration_hours + random.uniform(0.0, 1.0)
+    free_time_place_latitude, free_time_place_longitude = person.place_registry.get_location(
+        free_time_place_id
+    )
+    stay_duration_free_time_seconds = float(
+        schedule.free_time_stay_durations_seconds[person_index, day_index]
     )
 
-    if is_weekend:
+    # Handle weekdays and weekends differently to make it more realistic
+    if schedule.is_weekend[day_index]:
         # TODO: Multiple free time activities?
         coords = [
             (home_location.lon, home_location.lat),
-            (random_free_time_place.longitude, random_free_time_place.latitude),
+            (free_time_place_longitude, free_time_place_latitude),
             (home_location.lon, home_location.lat),
         ]
-        stay_durations = [stay_duration_free_time_hours]
-
-        # Randomly choose a time to start their day on the weekend
-        start_of_day_time = get_random_time_in_timeframe(8, 18)
+        stay_durations_seconds = [stay_duration_free_time_seconds]
     else:
+        workplace_latitude, workplace_longitude = person.place_registry.get_location(
+            person.workplace_id
+        )
         coords = [
             (home_location.lon, home_location.lat),
-            (workplace.longitude, workplace.latitude),
-            (random_free_time_place.longitude, random_free_time_place.latitude),
+            (workplace_longitude, workplace_latitude),
+            (free_time_place_longitude, free_time_place_latitude),
             (home_location.lon, home_location.lat),
         ]
-        # Let the stay durations vary a bit from day to day
-        stay_duration_work_hours = 8.0 + random.uniform(-1.0, 1.0)
-
         # NOTE: The index of a stay duration has to match the index of that location inside "coords"
         # starting with index 1 until the second last index -> So index 0 -> e.g. the workplace (on a weekday)
         # But obviously the first and last location are excluded - e.g. the day is over anyways at the last location
-        stay_durations = [stay_duration_work_hours, stay_duration_free_time_hours]
+        stay_durations_seconds = [
+            float(schedule.work_stay_durations_seconds[person_index, day_index]),
+            stay_duration_free_time_seconds,
+        ]
+
+    return (
+        coords,
+        stay_durations_seconds,
+        float(schedule.start_of_day_timestamps[person_index, day_index]),
+    )
 
-        # A small time delta to the start of day time to mimic slight variations in a set schedule
-        # Randomly choose a time to start their day based on their workplace
-        start_of_day_time = get_random_time_in_timeframe(
-            workplace.start_time_from, workplace.start_time_to
-        )
 
-    current_time_for_person = datetime.strptime(
-        f"{current_date} {start_of_day_time}", r"%Y-%m-%d %H:%M"
+def build_route_template(
+    home_location: Position,
+    coords: list,
+    ors_client: openrouteservice.Client,
+    high_fidelity: bool = False,
+    directions_cache: DirectionsCache = None,
+) -> RouteTemplate:
+    calculated_route_info = calculate_directions(
+        ors_client, coords, use_cycling_profile=False, directions_cache=directions_cache
+    )
+    return route_template_from_directions(
+        home_location,
+        len(coords) - 1,
+        calculated_route_info,
+        high_fidelity,
+        ors_client,
+        directions_cache,
     )
 
+
+def route_template_from_directions(
+    home_location: Position,
+    num_routes: int,
+    calculated_route_info: dict,
+    high_fidelity: bool = False,
+    ors_client: openrouteservice.Client = None,
+    directions_cache: DirectionsCache = None,
+) -> RouteTemplate:
+    # NOTE: Only the high fidelity mode needs to send further requests to ORS
+    # The route is calculated as if it started at time 0 without any stays in between, so the
+    # timestamps are the passed travel time
+    current_travel_time_seconds = 0.0
+    daily_route_for_person = DailyRoute()
+    route_end_indices = list()
+
     # The home location is the first waypoint
-    current_position = Position(home_location.lat, home_location.lon, current_time_for_person)
-    daily_route_for_person.add_waypoint(current_position)
+    daily_route_for_person.add_waypoints(
+        [home_location.lat], [home_location.lon], [current_travel_time_seconds]
+    )
 
-    calculated_route_info = calculate_directions(ors_client, coords, use_cycling_profile=False)
     route = calculated_route_info["routes"][0]
-    decoded_geometry_waypoints = openrouteservice.convert.decode_polyline(route["geometry"])[
-        "coordinates"
-    ]
+    # NOTE: The decoded geometry is in (lon, lat) order
+    decoded_geometry_waypoints = decode_route_geometry(route["geometry"])
+    geometry_latitudes = decoded_geometry_waypoints[:, 1]
+    geometry_longitudes = decoded_geometry_waypoints[:, 0]
+    if not high_fidelity:
+        # Distance from each waypoint of the geometry to the next one
+        geometry_distances = haversine_distances_m(geometry_latitudes, geometry_longitudes)
 
     previous_waypoint_index = 0
 
-    num_routes = len(coords) - 1
     for route_index in range(num_routes):
-        route_steps = route["segments"][route_index][
-            "steps"
-        ]  # e.g. all steps from home -> workplace
-        # print(f"Segment {route_index}:")
-        for step_i, step in enumerate(route_steps):
-            # print(f"Step {step_i}:")
-            # e.g. waypoints from index 0 to 14 in the full LineString
-            step_waypoints_from_idx = step["way_points"][0]
-            step_waypoints_to_idx = step["way_points"][1]
-
-            # If both indexes are the same, we are at a destination and the distance is obviously 0. We can skip this one
-            if step_waypoints_from_idx == step_waypoints_to_idx:
-                continue
-
-            # The last waypoint index counts as well. The slice has to be inclusive
-            for current_waypoint_index in range(step_waypoints_from_idx, step_waypoints_to_idx + 1):
-                if current_waypoint_index == previous_waypoint_index:
-                    continue
+        route_segment = route["segments"][route_index]  # e.g. all steps from home -> workplace
+        if high_fidelity:
+            current_travel_time_seconds, previous_waypoint_index = _add_sub_routed_waypoints(
+                daily_route_for_person,
+                route_segment,
+                decoded_geometry_waypoints,
+                current_travel_time_seconds,
+                previous_waypoint_index,
+                ors_client,
+                directions_cache,
+            )
+        else:
+            current_travel_time_seconds = _add_densified_waypoints(
+                daily_route_for_person,
+                route_segment,
+                geometry_latitudes,
+                geometry_longitudes,
+                geometry_distances,
+                current_travel_time_seconds,
+            )
+        route_end_indices.append(len(daily_route_for_person))
+
+    latitudes = daily_route_for_person.get_latitudes()
+    longitudes = daily_route_for_person.get_longitudes()
+    travel_times = daily_route_for_person.get_timestamps()
+    route_template = RouteTemplate()
+    route_start_index = 0
+    for route_end_index in route_end_indices:
+        route_template.add_waypoints(
+            latitudes[route_start_index:route_end_index],
+            longitudes[route_start_index:route_end_index],
+            travel_times[route_start_index:route_end_index],
+        )
+        route_template.end_route()
+        route_start_index = route_end_index
+    return route_template
+
+
+def decode_route_geometry(geometry) -> np.ndarray:
+    # One (lon, lat) row per waypoint. The geometry is either an encoded polyline or, if it was
+    # requested as GeoJSON, already a list of coordinates
+    if isinstance(geometry, str):
+        return decode_polyline(geometry)
+    return np.fromiter(
+        itertools.chain.from_iterable(geometry), dtype=np.float64, count=2 * len(geometry)
+    ).reshape(-1, 2)
+
+
+def _get_step_arrays(steps: list) -> (np.ndarray, np.ndarray, np.ndarray):
+    # The first and last waypoint index and the duration of every step, as columns
+    step_info = np.array(
+        [(step["way_points"][0], step["way_points"][1], step["duration"]) for step in steps],
+        dtype=np.float64,
+    ).reshape(-1, 3)
+    return (
+        step_info[:, 0].astype(np.int64),
+        step_info[:, 1].astype(np.int64),
+        step_info[:, 2],
+    )
 
-                # print(
-                #    f"From index {previous_waypoint_index} to {current_waypoint_index}..."
-                # )
 
-                current_waypoint = decoded_geometry_waypoints[current_waypoint_index]
-                previous_waypoint = decoded_geometry_waypoints[previous_waypoint_index]
+def _add_densified_waypoints(
+    daily_route_for_person: DailyRoute,
+    route_segment: dict,
+    geometry_latitudes: np.ndarray,
+    geometry_longitudes: np.ndarray,
+    geometry_distances: np.ndarray,
+    current_travel_time_seconds: float,
+) -> float:
+    # Derive the timed waypoints locally from the full route response instead of asking ORS again.
+    # Each step knows its travel duration and which part of the geometry it covers, so that duration
+    # is spread over the geometry's waypoints proportionally to the distance between them.
+    # All steps of the segment are handled at once
+    step_from_indexes, step_to_indexes, step_durations = _get_step_arrays(route_segment["steps"])
+    # If both indexes are the same, we are at a destination and the distance is obviously 0
+    # NOTE: Indexes beyond the geometry are cut off
+    step_to_indexes = np.minimum(step_to_indexes, len(geometry_latitudes) - 1)
+    num_step_waypoints = np.maximum(step_to_indexes - step_from_indexes, 0)
+    is_moving_step = num_step_waypoints > 0
+    step_from_indexes = step_from_indexes[is_moving_step]
+    step_durations = step_durations[is_moving_step]
+    num_step_waypoints = num_step_waypoints[is_moving_step]
+    if len(num_step_waypoints) == 0:
+        return current_travel_time_seconds
+
+    # The geometry index of every waypoint of every step, except the first waypoint of each step,
+    # which is where the previous step ended
+    first_step_positions = np.cumsum(num_step_waypoints) - num_step_waypoints
+    waypoint_indexes = (
+        np.arange(num_step_waypoints.sum())
+        - np.repeat(first_step_positions, num_step_waypoints)
+        + np.repeat(step_from_indexes, num_step_waypoints)
+        + 1
+    )
+    waypoint_distances = geometry_distances[waypoint_indexes - 1]
+    total_step_distances = np.add.reduceat(waypoint_distances, first_step_positions)
+
+    # e.g. A step that only consists of duplicate coordinates spreads its duration evenly
+    waypoint_durations_seconds = np.repeat(step_durations / num_step_waypoints, num_step_waypoints)
+    has_distance = np.repeat(total_step_distances > 0, num_step_waypoints)
+    waypoint_durations_seconds[has_distance] = (
+        np.repeat(step_durations, num_step_waypoints)[has_distance]
+        * waypoint_distances[has_distance]
+        / np.repeat(total_step_distances, num_step_waypoints)[has_distance]
+    )
+    # The time passes even if a waypoint is skipped, so that the total duration matches the step
+    travel_times_seconds = current_travel_time_seconds + np.cumsum(waypoint_durations_seconds)
 
-                # Calculate the distance between each waypoint
-                coords = [
-                    (previous_waypoint[0], previous_waypoint[1]),
-                    (current_waypoint[0], current_waypoint[1]),
-                ]
+    waypoint_latitudes = geometry_latitudes[waypoint_indexes]
+    waypoint_longitudes = geometry_longitudes[waypoint_indexes]
+    is_new_waypoint = daily_route_for_person.get_new_waypoint_mask(
+        waypoint_latitudes, waypoint_longitudes
+    )
+    daily_route_for_person.add_waypoints(
+        waypoint_latitudes[is_new_waypoint],
+        waypoint_longitudes[is_new_waypoint],
+        travel_times_seconds[is_new_waypoint],
+    )
+    return float(travel_times_seconds[-1])
 
-                calculated_sub_route_info = calculate_directions(
-                    ors_client, coords, use_cycling_profile=False
-                )
 
-                sub_route = calculated_sub_route_info["routes"][0]
-                sub_decoded_geometry_waypoints = openrouteservice.convert.decode_polyline(
-                    sub_route["geometry"]
-                )["coordinates"]
-                sub_route_steps = sub_route["segments"][0]["steps"]
-
-                sub_route_summary = sub_route.get("summary")
-                # e.g. Two neighboring waypoint indexes point to the exact same coordinates -> Route with no distance
-                if not sub_route_summary:
-                    # with open("troubleshooting_sub_route.json", "w") as f:
-                    #    json.dump(calculated_sub_route_info, f)
-                    # with open("troubleshooting_route.json", "w") as f:
-                    #    json.dump(calculated_route_info, f)
-                    # with open("troubleshooting_route_waypoints.json", "w") as f:
-                    #    json.dump(decoded_geometry_waypoints, f)
-                    # print(f"From: {step_waypoints_from_idx}")
-                    # print(f"To: {step_waypoints_to_idx}")
-                    # print(f"Current: {current_waypoint_index}")
-                    # print(f"Previous: {previous_waypoint_index}")
-                    # print("Saved logs and skipped this one.")
-                    # Skip this pair and keep the previous waypoint index as the last "valid" one before the duplicates began
-                    continue
-
-                sub_route_total_duration_seconds = sub_route_summary["duration"]
-
-                for sub_route_step_info in sub_route_steps:
-                    waypoint_idx_to_use = sub_route_step_info["way_points"][1]
-                    waypoint_pos = Position(
-                        sub_decoded_geometry_waypoints[waypoint_idx_to_use][1],
-                        sub_decoded_geometry_waypoints[waypoint_idx_to_use][0],
-                    )
-                    if not daily_route_for_person.is_roughly_equal_to_last_waypoint(waypoint_pos):
-                        # print(f"Waypoint index {waypoint_idx_to_use}: {waypoint_pos}")
-
-                        # NOTE: This is the passed time since the last time step
-                        sub_route_step_duration_seconds = sub_route_step_info["duration"]
-                        current_time_for_person += timedelta(
-                            seconds=sub_route_step_duration_seconds
-                        )
-                        waypoint_pos.timestamp = current_time_for_person.timestamp()
-                        # print(
-                        #    f"Sub route step duration: {sub_route_step_duration_seconds} seconds"
-                        # )
-
-                        daily_route_for_person.add_waypoint(waypoint_pos)
-                # Preparation for the next iteration
-                previous_waypoint_index = current_waypoint_index
-        # NOTE: The last route back home needs no stay duration - It's the end of the day
-        if route_index < num_routes - 1:
-            current_time_for_person += timedelta(hours=stay_durations[route_index])
-    return daily_route_for_person
-
-
-def generate_all_daily_routes_for_person_parallel(
-    pid: int,
-    start_date: datetime.date,
-    num_days_to_simulate: int,
+def _add_sub_routed_waypoints(
+    daily_route_for_person: DailyRoute,
+    route_segment: dict,
+    decoded_geometry_waypoints: np.ndarray,
+    current_travel_time_seconds: float,
+    previous_waypoint_index: int,
     ors_client: openrouteservice.Client,
-    job_queue: Queue,
-    connection_send,
-):
-    generated_subset_of_people = list()
-    while True:
-        person = job_queue.get()
-        if not person:
-            # Signal the other processes to exit
-            job_queue.put(None)
-            break
-        # print(f"Process {pid}: Got a new person from the job queue")
-        current_date = start_date
-        for _ in range(num_days_to_simulate):
+    directions_cache: DirectionsCache = None,
+) -> (float, int):
+    # High fidelity mode: Every pair of neighboring waypoints in the geometry is routed on its own,
+    # which costs one request to ORS per pair
+    route_steps = route_segment["steps"]
+    for step_i, step in enumerate(route_steps):
+        # print(f"Step {step_i}:")
+        # e.g. waypoints from index 0 to 14 in the full LineString
+        step_waypoints_from_idx = step["way_points"][0]
+        step_waypoints_to_idx = step["way_points"][1]
+
+        # If both indexes are the same, we are at a destination and the distance is obviously 0. We can skip this one
+        if step_waypoints_from_idx == step_waypoints_to_idx:
+            continue
+
+        # The last waypoint index counts as well. The slice has to be inclusive
+        for current_waypoint_index in range(step_waypoints_from_idx, step_waypoints_to_idx + 1):
+            if current_waypoint_index == previous_waypoint_index:
+                continue
+
             # print(
-            #    f"Process {pid}: Generating a daily route for the person - Current date: {current_date}"
+            #    f"From index {previous_waypoint_index} to {current_waypoint_index}..."
             # )
-            daily_route_for_person = generate_daily_route_for_person(
-                person, current_date, ors_client
+
+            current_waypoint = decoded_geometry_waypoints[current_waypoint_index]
+            previous_waypoint = decoded_geometry_waypoints[previous_waypoint_index]
+
+            # Calculate the distance between each waypoint
+            coords = [
+                (float(previous_waypoint[0]), float(previous_waypoint[1])),
+                (float(current_waypoint[0]), float(current_waypoint[1])),
+            ]
+
+            calculated_sub_route_info = calculate_directions(
+                ors_client, coords, use_cycling_profile=False, directions_cache=directions_cache
             )
-            # print(f"Process {pid}: Generated daily route for the person -> {person}")
-            person.add_route(daily_route_for_person)
 
-            current_date += timedelta(days=1)
+            sub_route = calculated_sub_route_info["routes"][0]
+
+            # e.g. Two neighboring waypoint indexes point to the exact same coordinates -> Route with no distance
+            if not sub_route.get("summary"):
+                # Skip this pair and keep the previous waypoint index as the last "valid" one before the duplicates began
+                continue
+
+            # The end of every step of the sub route becomes a waypoint
+            sub_decoded_geometry_waypoints = decode_route_geometry(sub_route["geometry"])
+            _, sub_route_step_to_indexes, sub_route_step_durations = _get_step_arrays(
+                sub_route["segments"][0]["steps"]
+            )
+            waypoint_latitudes = sub_decoded_geometry_waypoints[sub_route_step_to_indexes, 1]
+            waypoint_longitudes = sub_decoded_geometry_waypoints[sub_route_step_to_indexes, 0]
+            is_new_waypoint = daily_route_for_person.get_new_waypoint_mask(
+                waypoint_latitudes, waypoint_longitudes
+            )
+            # NOTE: The duration of a step is the passed time since the last step. Only the steps
+            # that end at a new waypoint count
+            travel_times_seconds = current_travel_time_seconds + np.cumsum(
+                sub_route_step_durations[is_new_waypoint]
+            )
+            daily_route_for_person.add_waypoints(
+                waypoint_latitudes[is_new_waypoint],
+                waypoint_longitudes[is_new_waypoint],
+                travel_times_seconds,
+            )
+            if len(travel_times_seconds) > 0:
+                current_travel_time_seconds = float(travel_times_seconds[-1])
+            # Preparation for the next iteration
+            previous_waypoint_index = current_waypoint_index
+    return current_travel_time_seconds, previous_waypoint_index
 
-        generated_subset_of_people.append(person)
 
-    # After this worker process got a signal to exit, it will hand off the data
-    for person in generated_subset_of_people:
-        connection_send.send(person)
-    # All done!
-    connection_send.send(None)
+def get_default_num_processes(ors_capacity: int = None) -> int:
+    # The workers mostly wait for ORS, so there is no point in having more of them than ORS can serve
+    # requests at the same time. But each of them still needs a bit of CPU time
+    if not ors_capacity:
+        ors_capacity = DEFAULT_ORS_CAPACITY
+    num_cpus = os.cpu_count() or 1
+    return max(1, min(ors_capacity, MAX_PROCESSES_PER_CPU * num_cpus))
 
 
-def generate_daily_routes_parallel(
+def get_default_chunk_size(num_people: int, num_days_to_simulate: int, num_processes: int) -> int:
+    # Small enough so that the last chunks don't stall the run, but ideally a chunk contains all days
+    # of one person, so that the route templates of that person can be reused
+    num_tasks = num_people * num_days_to_simulate
+    chunk_size = math.ceil(num_tasks / (num_processes * CHUNKS_PER_PROCESS))
+    return max(1, min(num_days_to_simulate, chunk_size))
+
+
+# The state of a worker process, which is set up once by _initialize_worker
+_worker_state = dict()
+
+
+def _initialize_worker(
+    world_state_directory_path: str,
+    ors_client: openrouteservice.Client,
+    high_fidelity: bool,
+    directions_cache: DirectionsCache,
+):
+    # All workers map the same files instead of getting their own copy of the people, places and
+    # their schedule
+    _worker_state["world_state"] = WorldState(world_state_directory_path)
+    _worker_state["ors_client"] = ors_client
+    _worker_state["high_fidelity"] = high_fidelity
+    _worker_state["directions_cache"] = directions_cache
+
+
+def _generate_daily_routes_for_tasks(tasks: list) -> list:
+    # A task is a (person index, day index) pair. A failing task doesn't take the others with it,
+    # its error is sent back instead of a daily route
+    generated_daily_routes = list()
+    for person_index, day_index in tasks:
+        try:
+            world_state = _worker_state["world_state"]
+            daily_route_for_person = generate_daily_route_for_person(
+                world_state.get_person(person_index),
+                world_state.schedule,
+                person_index,
+                day_index,
+                _worker_state["ors_client"],
+                _worker_state["high_fidelity"],
+                _worker_state["directions_cache"],
+            )
+        except Exception as error:
+            # Not every exception can be pickled, so only its description is sent
+            generated_daily_routes.append(
+                (person_index, day_index, None, f"{type(error).__name__}: {error}")
+            )
+        else:
+            generated_daily_routes.append((person_index, day_index, daily_route_for_person, None))
+    # Once per chunk instead of once per lookup, workers don't close the cache
+    if _worker_state["directions_cache"] is not None:
+        _worker_state["directions_cache"].flush()
+    return generated_daily_routes
+
+
+def print_failed_task(person: Person, day_index: int, error_message: str):
+    print(
+        f"Failed to generate the daily route of person {person.id} on day {day_index}: "
+        f"{error_message}"
+    )
+
+
+def iter_daily_routes_parallel(
     start_date: datetime.date,
     num_days_to_simulate: int,
     generated_people_without_daily_routes: list,
     ors_client: openrouteservice.Client,
+    high_fidelity: bool = False,
+    directions_cache: DirectionsCache = None,
+    num_processes: int = None,
+    chunk_size: int = None,
+    completed_tasks: set = None,
+    on_task_failed=None,
+    seed: int = None,
 ):
-    # TODO: Determine appropriately
-    num_processes = 8
-    # Leave some headroom for when workers are faster than the main process (scheduling order)
-    job_queue = Queue(maxsize=int(1.5 * num_processes))
+    # Yields (person, day index, daily route) as soon as a worker is done with it, in no particular order
+    # completed_tasks: (person id, day index) pairs that are skipped, e.g. from a checkpoint
+    # on_task_failed: Called with (person, day index, error message) for every task that failed
+    #   MAX_TASK_ATTEMPTS times. Its daily route is missing then. Prints the error by default
+    # seed: Makes every daily route reproducible, no matter which process generates it
+    if not num_processes:
+        num_processes = get_default_num_processes()
+    if not chunk_size:
+        chunk_size = get_default_chunk_size(
+            len(generated_people_without_daily_routes), num_days_to_simulate, num_processes
+        )
+    if on_task_failed is None:
+        on_task_failed = print_failed_task
+
+    if completed_tasks is None:
+        completed_tasks = set()
+    all_tasks = (
+        (person_index, day_index)
+        for person_index, person in enumerate(generated_people_without_daily_routes)
+        for day_index in range(num_days_to_simulate)
+        if (person.id, day_index) not in completed_tasks
+    )
+    new_task_chunks = iter(lambda: list(itertools.islice(all_tasks, chunk_size)), [])
+    # (tasks, number of attempts so far) of chunks that have to be tried again
+    retried_task_chunks = deque()
+    # (task, number of attempts so far) of tasks that were being worked on when a worker crashed.
+    # Any of them could have caused it, so they are run on their own until the culprit is found
+    suspected_tasks = deque()
+
+    def retry_or_fail(tasks: list, num_attempts: int, error_message: str, retried_tasks: deque):
+        for task in tasks:
+            if num_attempts < MAX_TASK_ATTEMPTS:
+                retried_tasks.append(([task], num_attempts))
+            else:
+                person_index, day_index = task
+                on_task_failed(
+                    generated_people_without_daily_routes[person_index], day_index, error_message
+                )
 
-    # Processes are used to get around the GIL limitation that applies to threads in Python
-    worker_processes = list()
-    receiving_pipe_connections = list()
-    for pid in range(num_processes):
-        connection_recv, connection_send = Pipe()
-        receiving_pipe_connections.append(connection_recv)
-        process = Process(
-            target=generate_all_daily_routes_for_person_parallel,
-            args=(
-                pid,
-                start_date,
-                num_days_to_simulate,
-                ors_client,
-                job_queue,
-                connection_send,
-            ),
+    def create_executor() -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(
+            max_workers=num_processes,
+            initializer=_initialize_worker,
+            initargs=(world_state_directory_path, ors_client, high_fidelity, directions_cache),
         )
-        worker_processes.append(process)
-        process.start()
 
-    for person in tqdm(generated_people_without_daily_routes):
-        job_queue.put(person)
+    # The schedule of all people and days is generated up front in one go
+    schedule = generate_schedule(
+        generated_people_without_daily_routes, start_date, num_days_to_simulate, seed
+    )
+
+    # Processes are used to get around the GIL limitation that applies to threads in Python
+    # NOTE: The people, places and the schedule are written once to memory-mapped files that all
+    # workers share. A task is just two indexes
+    with temporary_world_state(
+        generated_people_without_daily_routes, schedule
+    ) as world_state_directory_path:
+        executor = create_executor()
+        try:
+            # Submitted chunks -> (tasks, number of attempts before this one)
+            pending_chunks = dict()
+            while True:
+                if suspected_tasks:
+                    # Suspected tasks run all alone, so that a crash can only be caused by them
+                    if not pending_chunks:
+                        tasks, num_attempts = suspected_tasks.popleft()
+                        pending_chunks[executor.submit(_generate_daily_routes_for_tasks, tasks)] = (
+                            tasks,
+                            num_attempts,
+                        )
+                else:
+                    # Only keep a few chunks per worker queued up, so that idle workers pick up the
+                    # next one. Chunks that are tried again go first
+                    while len(pending_chunks) < MAX_PENDING_CHUNKS_PER_PROCESS * num_processes:
+                        if retried_task_chunks:
+                            tasks, num_attempts = retried_task_chunks.popleft()
+                        else:
+                            tasks, num_attempts = next(new_task_chunks, None), 0
+                            if tasks is None:
+                                break
+                        pending_chunks[executor.submit(_generate_daily_routes_for_tasks, tasks)] = (
+                            tasks,
+                            num_attempts,
+                        )
+                if not pending_chunks:
+                    break
+
+                finished_chunks, _ = wait(pending_chunks, return_when=FIRST_COMPLETED)
+                is_executor_broken = False
+                for finished_chunk in finished_chunks:
+                    try:
+                        daily_route_results = finished_chunk.result()
+                    except BrokenProcessPool:
+                        is_executor_broken = True
+                        continue
+                    tasks, num_attempts = pending_chunks.pop(finished_chunk)
+                    for person_index, day_index, daily_route, error_message in daily_route_results:
+                        if error_message is None:
+                            yield (
+                                generated_people_without_daily_routes[person_index],
+                                day_index,
+                                daily_route,
+                            )
+                        else:
+                            retry_or_fail(
+                                [(person_index, day_index)],
+                                num_attempts + 1,
+                                error_message,
+                                retried_task_chunks,
+                            )
+
+                if is_executor_broken:
+                    # All unfinished chunks of the executor are lost. If only one task was running,
+                    # it crashed the worker. Otherwise, all of its tasks are suspected
+                    crashed_task_chunks = list(pending_chunks.values())
+                    if len(crashed_task_chunks) == 1 and len(crashed_task_chunks[0][0]) == 1:
+                        tasks, num_attempts = crashed_task_chunks[0]
+                        retry_or_fail(
+                            tasks, num_attempts + 1, "The worker process crashed", suspected_tasks
+                        )
+                    else:
+                        for tasks, num_attempts in crashed_task_chunks:
+                            suspected_tasks.extend(([task], num_attempts) for task in tasks)
+                    pending_chunks.clear()
+                    executor.shutdown(wait=True, cancel_futures=True)
+                    print("A worker process crashed. Restarting the worker processes...")
+                    # The requests that the dead workers had in flight are never released
+                    if hasattr(ors_client, "reset_outstanding_requests"):
+                        ors_client.reset_outstanding_requests()
+                    executor = create_executor()
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
 
-    # Signal the end, let it cascade
-    job_queue.put(None)
 
-    generated_people = list()
-    for i, (process, connection_recv) in enumerate(
-        zip(worker_processes, receiving_pipe_connections)
+def generate_daily_routes_parallel(
+    start_date: datetime.date,
+    num_days_to_simulate: int,
+    generated_people_without_daily_routes: list,
+    ors_client: openrouteservice.Client,
+    high_fidelity: bool = False,
+    directions_cache: DirectionsCache = None,
+    num_processes: int = None,
+    chunk_size: int = None,
+    seed: int = None,
+):
+    daily_routes_by_person = defaultdict(dict)
+    failed_tasks = list()
+    for person, day_index, daily_route_for_person in tqdm(
+        iter_daily_routes_parallel(
+            start_date,
+            num_days_to_simulate,
+            generated_people_without_daily_routes,
+            ors_client,
+            high_fidelity,
+            directions_cache,
+            num_processes,
+            chunk_size,
+            on_task_failed=lambda person, day_index, error_message: failed_tasks.append(
+                (person.id, day_index, error_message)
+            ),
+            seed=seed,
+        ),
+        total=len(generated_people_without_daily_routes) * num_days_to_simulate,
     ):
-        # print(f"Getting results from process {i}...")
-        # Extract and merge all generated data about peoples' daily routes into one list
-        while True:
-            generated_person = connection_recv.recv()
-            if not generated_person:
-                # print(f"Process {i} is all done sending its data!")
-                break
-            generated_people.append(generated_person)
-        # print(f"Joining process {i}...")
-        process.join()
+        daily_routes_by_person[person.id][day_index] = daily_route_for_person
+
+    if failed_tasks:
+        raise RuntimeError(
+            f"Failed to generate {len(failed_tasks)} daily routes, "
+            f"e.g. of person {failed_tasks[0][0]} on day {failed_tasks[0][1]}: {failed_tasks[0][2]}"
+        )
+
+    # The routes arrive in any order, but each person's routes have to be sorted by day
+    for person in generated_people_without_daily_routes:
+        for day_index in range(num_days_to_simulate):
+            person.add_route(daily_routes_by_person[person.id][day_index])
 
     print(f"Successfully generated daily routes for all people.")
-    return generated_people
+    return generated_people_without_daily_routes
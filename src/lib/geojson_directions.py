@@ -0,0 +1,53 @@
+import openrouteservice
+
+# How the routing backend returns the geometry of a route: As an encoded polyline (the default of
+# ORS) or as GeoJSON coordinates, which are bigger but don't have to be decoded
+GEOMETRY_FORMAT_POLYLINE = "polyline"
+GEOMETRY_FORMAT_GEOJSON = "geojson"
+GEOMETRY_FORMATS = (GEOMETRY_FORMAT_POLYLINE, GEOMETRY_FORMAT_GEOJSON)
+
+
+def get_ors_response_format(geometry_format: str) -> str:
+    # The format in the path of the ORS directions endpoint, e.g. /v2/directions/<profile>/geojson
+    if geometry_format == GEOMETRY_FORMAT_GEOJSON:
+        return "geojson"
+    return "json"
+
+
+def convert_geojson_directions(directions: dict) -> dict:
+    # Turns a GeoJSON directions response into the layout of the JSON format, with the list of
+    # (lon, lat) coordinates as the geometry of a route instead of an encoded polyline.
+    # Responses that already have that layout are returned as they are, e.g. of a LocalRoutingEngine
+    if not isinstance(directions, dict) or "features" not in directions:
+        return directions
+    routes = list()
+    for feature in directions["features"]:
+        route = dict(feature.get("properties") or {})
+        route["geometry"] = (feature.get("geometry") or {}).get("coordinates", [])
+        if "bbox" in feature:
+            route["bbox"] = feature["bbox"]
+        routes.append(route)
+    converted_directions = {
+        key: value for key, value in directions.items() if key not in ("type", "features")
+    }
+    converted_directions["routes"] = routes
+    return converted_directions
+
+
+class GeoJSONDirectionsClient:
+    # Wraps a client with the "directions" method of openrouteservice.Client (e.g. a
+    # LoadBalancedORSClient) and asks it for GeoJSON geometries instead of encoded polylines
+    def __init__(self, ors_client: openrouteservice.Client):
+        self.ors_client = ors_client
+
+    def directions(self, coords, profile: str, preference: str, units: str = "m", **kwargs) -> dict:
+        kwargs["format"] = get_ors_response_format(GEOMETRY_FORMAT_GEOJSON)
+        return convert_geojson_directions(
+            self.ors_client.directions(
+                coords, profile=profile, preference=preference, units=units, **kwargs
+            )
+        )
+
+    def reset_outstanding_requests(self):
+        if hasattr(self.ors_client, "reset_outstanding_requests"):
+            self.ors_client.reset_outstanding_requests()
@@ -0,0 +1,26 @@
+import numpy as np
+
+from math import radians, sin, cos, asin, sqrt
+
+EARTH_RADIUS_METERS = 6371008.8
+
+
+def haversine_distance_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    # Great-circle distance between two points, which is more than accurate enough at city scale
+    lat1_rad, lat2_rad = radians(lat1), radians(lat2)
+    delta_lat = lat2_rad - lat1_rad
+    delta_lon = radians(lon2 - lon1)
+    a = sin(delta_lat / 2) ** 2 + cos(lat1_rad) * cos(lat2_rad) * sin(delta_lon / 2) ** 2
+    return 2 * EARTH_RADIUS_METERS * asin(sqrt(a))
+
+
+def haversine_distances_m(latitudes: np.ndarray, longitudes: np.ndarray) -> np.ndarray:
+    # The distances between all neighboring points at once, one less than there are points
+    latitudes_rad = np.radians(latitudes)
+    delta_lats = np.diff(latitudes_rad)
+    delta_lons = np.radians(np.diff(longitudes))
+    a = (
+        np.sin(delta_lats / 2) ** 2
+        + np.cos(latitudes_rad[:-1]) * np.cos(latitudes_rad[1:]) * np.sin(delta_lons / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_METERS * np.arcsin(np.sqrt(a))
@@ -0,0 +1,264 @@
+import math
+import time
+import requests
+import multiprocessing
+import openrouteservice
+
+from openrouteservice import exceptions as ors_exceptions
+
+from ..lib.retries import is_transient_error
+
+DEFAULT_REQUEST_TIMEOUT_SECONDS = 60
+INITIAL_CONCURRENCY = 4
+MIN_CONCURRENCY = 1
+MAX_CONCURRENCY = 64
+# Multiplicative decrease of the concurrency limit on errors and high latencies, but at most once
+# per cooldown, as all requests that were in flight at that time tend to be slow or fail together
+CONCURRENCY_DECREASE_FACTOR = 0.5
+CONCURRENCY_DECREASE_COOLDOWN_SECONDS = 2.0
+# The latency is tracked as an exponential moving average. It counts as too high if it is this
+# many times the lowest average that was seen after the first few requests
+LATENCY_SMOOTHING_FACTOR = 0.1
+LATENCY_TOLERANCE_FACTOR = 2.0
+NUM_WARMUP_REQUESTS = 10
+# Unreachable backends are left alone this long before their health is checked again
+HEALTH_CHECK_INTERVAL_SECONDS = 10.0
+HEALTH_CHECK_TIMEOUT_SECONDS = 5.0
+MAX_WAIT_SECONDS = 1.0
+# A request that finds no usable backend for this long fails instead of waiting forever, e.g. when
+# all backends are down
+DEFAULT_ACQUIRE_TIMEOUT_SECONDS = 300.0
+
+# The state of each backend, shared by all processes
+BACKEND_STATE_FIELDS = (
+    "outstanding_requests",
+    "concurrency_limit",
+    "unhealthy_until",
+    "latency_average",
+    "min_latency_average",
+    "last_decrease",
+    "num_requests",
+    "num_errors",
+)
+_NUM_FIELDS = len(BACKEND_STATE_FIELDS)
+_FIELD_INDEXES = {field_name: index for index, field_name in enumerate(BACKEND_STATE_FIELDS)}
+
+
+class NoBackendAvailableError(Exception):
+    pass
+
+
+class LoadBalancedORSClient:
+    # Spreads directions requests over several ORS instances. Each request goes to the healthy
+    # backend with the fewest outstanding requests relative to its concurrency limit, which is
+    # adapted to how the backend copes (AIMD): +1 per limit's worth of good responses, halved on
+    # transient errors and high latencies. The state lives in shared memory, so the worker processes
+    # that get this client balance their requests together
+    def __init__(
+        self,
+        base_urls: list,
+        timeout_seconds: float = DEFAULT_REQUEST_TIMEOUT_SECONDS,
+        initial_concurrency: float = INITIAL_CONCURRENCY,
+        max_concurrency: float = MAX_CONCURRENCY,
+        acquire_timeout_seconds: float = DEFAULT_ACQUIRE_TIMEOUT_SECONDS,
+    ):
+        if not base_urls:
+            raise ValueError("At least one ORS base URL is needed")
+        self.base_urls = [base_url.rstrip("/") for base_url in base_urls]
+        self.timeout_seconds = timeout_seconds
+        self.max_concurrency = max_concurrency
+        self.acquire_timeout_seconds = acquire_timeout_seconds
+
+        self._condition = multiprocessing.Condition()
+        self._state = multiprocessing.RawArray("d", len(self.base_urls) * _NUM_FIELDS)
+        for backend_index in range(len(self.base_urls)):
+            self._set(backend_index, "concurrency_limit", initial_concurrency)
+            self._set(backend_index, "min_latency_average", math.inf)
+
+        # One openrouteservice.Client per backend, created by each process for itself
+        self._clients = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_clients"] = None
+        return state
+
+    def _get(self, backend_index: int, field_name: str) -> float:
+        return self._state[backend_index * _NUM_FIELDS + _FIELD_INDEXES[field_name]]
+
+    def _set(self, backend_index: int, field_name: str, value: float):
+        self._state[backend_index * _NUM_FIELDS + _FIELD_INDEXES[field_name]] = value
+
+    def _get_client(self, backend_index: int) -> openrouteservice.Client:
+        if self._clients is None:
+            self._clients = [
+                openrouteservice.Client(
+                    base_url=base_url,
+                    timeout=self.timeout_seconds,
+                    # Overloaded backends are handled here instead of waiting for them
+                    retry_over_query_limit=False,
+                )
+                for base_url in self.base_urls
+            ]
+        return self._clients[backend_index]
+
+    def directions(self, coords, profile: str, preference: str, units: str = "m", **kwargs) -> dict:
+        backend_index = self._acquire_backend()
+        request_start_time = time.time()
+        try:
+            directions = self._get_client(backend_index).directions(
+                coords, profile=profile, preference=preference, units=units, **kwargs
+            )
+        except Exception as error:
+            self._release_backend(backend_index, None, error)
+            raise
+        self._release_backend(backend_index, time.time() - request_start_time, None)
+        return directions
+
+    def reset_outstanding_requests(self):
+        # The requests of worker processes that died are never released. Only call this while no
+        # process uses the client, e.g. when the worker processes are restarted
+        with self._condition:
+            for backend_index in range(len(self.base_urls)):
+                self._set(backend_index, "outstanding_requests", 0)
+            self._condition.notify_all()
+
+    def _acquire_backend(self) -> int:
+        deadline = time.time() + self.acquire_timeout_seconds
+        while True:
+            self._check_health_of_recovering_backends()
+            with self._condition:
+                now = time.time()
+                best_backend_index = None
+                best_load = math.inf
+                for backend_index in range(len(self.base_urls)):
+                    if self._get(backend_index, "unhealthy_until") > 0:
+                        continue
+                    outstanding_requests = self._get(backend_index, "outstanding_requests")
+                    concurrency_limit = self._get(backend_index, "concurrency_limit")
+                    if outstanding_requests >= math.floor(concurrency_limit):
+                        continue
+                    load = outstanding_requests / concurrency_limit
+                    if load < best_load:
+                        best_backend_index = backend_index
+                        best_load = load
+                if best_backend_index is not None:
+                    self._set(
+                        best_backend_index,
+                        "outstanding_requests",
+                        self._get(best_backend_index, "outstanding_requests") + 1,
+                    )
+                    return best_backend_index
+
+                if now >= deadline:
+                    raise NoBackendAvailableError(
+                        f"No ORS backend was available for {self.acquire_timeout_seconds} seconds"
+                    )
+                # Wait for a request to finish or for an unhealthy backend to be checked again
+                wait_seconds = min(MAX_WAIT_SECONDS, deadline - now)
+                for backend_index in range(len(self.base_urls)):
+                    unhealthy_until = self._get(backend_index, "unhealthy_until")
+                    if unhealthy_until > 0:
+                        wait_seconds = min(wait_seconds, max(0.0, unhealthy_until - now))
+                self._condition.wait(timeout=wait_seconds)
+
+    def _check_health_of_recovering_backends(self):
+        for backend_index in range(len(self.base_urls)):
+            with self._condition:
+                unhealthy_until = self._get(backend_index, "unhealthy_until")
+                if unhealthy_until == 0 or unhealthy_until > time.time():
+                    continue
+                # Only this process checks it, the others keep leaving the backend alone meanwhile
+                self._set(
+                    backend_index, "unhealthy_until", time.time() + HEALTH_CHECK_INTERVAL_SECONDS
+                )
+            is_healthy = self.is_backend_healthy(backend_index)
+            with self._condition:
+                if is_healthy:
+                    self._set(backend_index, "unhealthy_until", 0)
+                    self._set(backend_index, "concurrency_limit", MIN_CONCURRENCY)
+                    self._condition.notify_all()
+
+    def is_backend_healthy(self, backend_index: int) -> bool:
+        try:
+            response = requests.get(
+                f"{self.base_urls[backend_index]}/v2/health", timeout=HEALTH_CHECK_TIMEOUT_SECONDS
+            )
+            return response.ok and response.json().get("status") == "ready"
+        except (requests.exceptions.RequestException, ValueError):
+            return False
+
+    def _release_backend(self, backend_index: int, latency_seconds: float, error: Exception):
+        with self._condition:
+            now = time.time()
+            self._set(
+                backend_index,
+                "outstanding_requests",
+                self._get(backend_index, "outstanding_requests") - 1,
+            )
+            num_requests = self._get(backend_index, "num_requests") + 1
+            self._set(backend_index, "num_requests", num_requests)
+
+            if error is not None:
+                # Errors about the request itself say nothing about the backend
+                if is_transient_error(error):
+                    self._set(
+                        backend_index, "num_errors", self._get(backend_index, "num_errors") + 1
+                    )
+                    self._decrease_concurrency(backend_index, now)
+                if isinstance(error, (ors_exceptions.Timeout, requests.exceptions.ConnectionError)):
+                    self._set(backend_index, "unhealthy_until", now + HEALTH_CHECK_INTERVAL_SECONDS)
+            else:
+                latency_average = self._get(backend_index, "latency_average")
+                if num_requests == 1:
+                    latency_average = latency_seconds
+                else:
+                    latency_average += LATENCY_SMOOTHING_FACTOR * (
+                        latency_seconds - latency_average
+                    )
+                self._set(backend_index, "latency_average", latency_average)
+                min_latency_average = self._get(backend_index, "min_latency_average")
+                if num_requests >= NUM_WARMUP_REQUESTS:
+                    min_latency_average = min(min_latency_average, latency_average)
+                    self._set(backend_index, "min_latency_average", min_latency_average)
+
+                if latency_average > LATENCY_TOLERANCE_FACTOR * min_latency_average:
+                    self._decrease_concurrency(backend_index, now)
+                else:
+                    concurrency_limit = self._get(backend_index, "concurrency_limit")
+                    self._set(
+                        backend_index,
+                        "concurrency_limit",
+                        min(self.max_concurrency, concurrency_limit + 1 / concurrency_limit),
+                    )
+            self._condition.notify_all()
+
+    def _decrease_concurrency(self, backend_index: int, now: float):
+        if now - self._get(backend_index, "last_decrease") < CONCURRENCY_DECREASE_COOLDOWN_SECONDS:
+            return
+        self._set(
+            backend_index,
+            "concurrency_limit",
+            max(
+                MIN_CONCURRENCY,
+                self._get(backend_index, "concurrency_limit") * CONCURRENCY_DECREASE_FACTOR,
+            ),
+        )
+        self._set(backend_index, "last_decrease", now)
+
+    def get_stats(self) -> list:
+        with self._condition:
+            return [
+                {
+                    "base_url": base_url,
+                    "healthy": self._get(backend_index, "unhealthy_until") == 0,
+                    "outstanding_requests": int(self._get(backend_index, "outstanding_requests")),
+                    "concurrency_limit": round(self._get(backend_index, "concurrency_limit"), 2),
+                    "latency_average_seconds": round(
+                        self._get(backend_index, "latency_average"), 4
+                    ),
+                    "num_requests": int(self._get(backend_index, "num_requests")),
+                    "num_errors": int(self._get(backend_index, "num_errors")),
+                }
+                for backend_index, base_url in enumerate(self.base_urls)
+            ]
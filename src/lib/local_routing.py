@@ -0,0 +1,572 @@
+import abc
+import sys
+import math
+import heapq
+import numpy as np
+import xml.etree.ElementTree as ElementTree
+
+from pathlib import Path
+from collections import defaultdict
+
+from ..lib.geometry import haversine_distance_m
+from ..lib.polyline import encode_polyline
+
+# Travel speeds in km/h by the "highway" tag of a way. Ways that are missing can't be used
+CAR_SPEEDS_KMH = {
+    "motorway": 110,
+    "motorway_link": 60,
+    "trunk": 90,
+    "trunk_link": 50,
+    "primary": 65,
+    "primary_link": 45,
+    "secondary": 55,
+    "secondary_link": 40,
+    "tertiary": 45,
+    "tertiary_link": 35,
+    "unclassified": 40,
+    "road": 30,
+    "residential": 30,
+    "living_street": 10,
+    "service": 15,
+}
+BICYCLE_SPEEDS_KMH = {
+    "primary": 18,
+    "primary_link": 18,
+    "secondary": 18,
+    "secondary_link": 18,
+    "tertiary": 18,
+    "tertiary_link": 18,
+    "unclassified": 18,
+    "road": 18,
+    "residential": 18,
+    "living_street": 12,
+    "service": 15,
+    "cycleway": 20,
+    "path": 15,
+    "track": 12,
+    "footway": 6,
+    "pedestrian": 6,
+}
+PROFILE_SPEEDS_KMH = {
+    "driving-car": CAR_SPEEDS_KMH,
+    "cycling-regular": BICYCLE_SPEEDS_KMH,
+}
+UNIT_FACTORS = {"m": 1.0, "km": 0.001, "mi": 1 / 1609.344}
+
+# Step types and instructions are a simplified version of what ORS returns
+STEP_TYPE_CONTINUE = 6
+STEP_TYPE_ARRIVE = 10
+STEP_TYPE_DEPART = 11
+
+# Size of the cells of the grid that is used to find the nearest node of a coordinate
+SNAPPING_GRID_CELL_SIZE_DEGREES = 0.005
+MAX_SNAPPING_RING = 20
+
+
+class RoutingError(Exception):
+    pass
+
+
+class RoutingBackend(abc.ABC):
+    # Everything that can answer directions requests the same way openrouteservice.Client does.
+    # openrouteservice.Client itself fits this interface as it is
+    @abc.abstractmethod
+    def directions(self, coords, profile: str, preference: str, units: str = "m", **kwargs) -> dict:
+        pass
+
+
+class RoadGraph:
+    # A directed road graph in CSR layout: The outgoing edges of node i are the edges from
+    # edge_offsets[i] to edge_offsets[i + 1]. Durations are in seconds, infinite if not allowed
+    def __init__(
+        self,
+        node_latitudes: np.ndarray,
+        node_longitudes: np.ndarray,
+        edge_offsets: np.ndarray,
+        edge_targets: np.ndarray,
+        edge_distances: np.ndarray,
+        edge_durations: dict,
+        edge_name_ids: np.ndarray,
+        names: list,
+    ):
+        self.node_latitudes = np.asarray(node_latitudes, dtype=np.float64)
+        self.node_longitudes = np.asarray(node_longitudes, dtype=np.float64)
+        self.edge_offsets = np.asarray(edge_offsets, dtype=np.int64)
+        self.edge_targets = np.asarray(edge_targets, dtype=np.int64)
+        self.edge_distances = np.asarray(edge_distances, dtype=np.float64)
+        self.edge_durations = {
+            profile: np.asarray(durations, dtype=np.float64)
+            for profile, durations in edge_durations.items()
+        }
+        self.edge_name_ids = np.asarray(edge_name_ids, dtype=np.int64)
+        self.names = list(names)
+
+    def get_num_nodes(self) -> int:
+        return len(self.node_latitudes)
+
+    def save(self, graph_file_path: str):
+        np.savez_compressed(
+            graph_file_path,
+            node_latitudes=self.node_latitudes,
+            node_longitudes=self.node_longitudes,
+            edge_offsets=self.edge_offsets,
+            edge_targets=self.edge_targets,
+            edge_distances=self.edge_distances,
+            edge_name_ids=self.edge_name_ids,
+            names=np.array(self.names, dtype=str),
+            profiles=np.array(list(self.edge_durations.keys()), dtype=str),
+            **{
+                f"edge_durations_{profile}": durations
+                for profile, durations in self.edge_durations.items()
+            },
+        )
+
+    @classmethod
+    def load(cls, graph_file_path: str):
+        with np.load(graph_file_path) as graph_file:
+            return cls(
+                graph_file["node_latitudes"],
+                graph_file["node_longitudes"],
+                graph_file["edge_offsets"],
+                graph_file["edge_targets"],
+                graph_file["edge_distances"],
+                {
+                    str(profile): graph_file[f"edge_durations_{profile}"]
+                    for profile in graph_file["profiles"]
+                },
+                graph_file["edge_name_ids"],
+                [str(name) for name in graph_file["names"]],
+            )
+
+    @classmethod
+    def from_osm_xml(cls, osm_file_path: str):
+        # Reads an OSM extract in XML format (e.g. exported from openstreetmap.org or converted with
+        # "osmium cat extract.osm.pbf -o extract.osm")
+        node_coordinates = dict()
+        ways = list()
+        for _, element in ElementTree.iterparse(osm_file_path, events=("end",)):
+            if element.tag == "node":
+                node_coordinates[int(element.get("id"))] = (
+                    float(element.get("lat")),
+                    float(element.get("lon")),
+                )
+                element.clear()
+            elif element.tag == "way":
+                tags = {tag.get("k"): tag.get("v") for tag in element.iter("tag")}
+                highway = tags.get("highway")
+                if highway and any(highway in speeds for speeds in PROFILE_SPEEDS_KMH.values()):
+                    node_ids = [int(node_ref.get("ref")) for node_ref in element.iter("nd")]
+                    ways.append((node_ids, tags))
+                element.clear()
+            elif element.tag == "relation":
+                element.clear()
+        return cls.from_ways(node_coordinates, ways)
+
+    @classmethod
+    def from_ways(cls, node_coordinates: dict, ways: list):
+        # ways: List of (OSM node ids, tags of the way)
+        node_indexes = dict()
+        node_latitudes = list()
+        node_longitudes = list()
+        names = [""]
+        name_ids = {"": 0}
+        # Source node index -> list of (target node index, distance, durations by profile, name id)
+        outgoing_edges = defaultdict(list)
+
+        def get_node_index(osm_node_id: int) -> int:
+            node_index = node_indexes.get(osm_node_id)
+            if node_index is None:
+                node_index = len(node_latitudes)
+                node_indexes[osm_node_id] = node_index
+                latitude, longitude = node_coordinates[osm_node_id]
+                node_latitudes.append(latitude)
+                node_longitudes.append(longitude)
+            return node_index
+
+        for node_ids, tags in ways:
+            node_ids = [node_id for node_id in node_ids if node_id in node_coordinates]
+            if len(node_ids) < 2:
+                continue
+            highway = tags.get("highway")
+            name = tags.get("name") or tags.get("ref") or ""
+            if name not in name_ids:
+                name_ids[name] = len(names)
+                names.append(name)
+
+            speeds_kmh = dict()
+            for profile, profile_speeds_kmh in PROFILE_SPEEDS_KMH.items():
+                speed_kmh = profile_speeds_kmh.get(highway)
+                if speed_kmh and profile == "driving-car":
+                    speed_kmh = _get_max_speed_kmh(tags.get("maxspeed"), speed_kmh)
+                speeds_kmh[profile] = speed_kmh
+
+            oneway = tags.get("oneway")
+            is_forward_allowed = oneway != "-1"
+            is_backward_allowed = not (
+                oneway in ("yes", "1", "true")
+                or tags.get("junction") == "roundabout"
+                or (highway == "motorway" and oneway != "no")
+            )
+
+            for from_osm_id, to_osm_id in zip(node_ids, node_ids[1:]):
+                from_index = get_node_index(from_osm_id)
+                to_index = get_node_index(to_osm_id)
+                distance = haversine_distance_m(
+                    node_latitudes[from_index],
+                    node_longitudes[from_index],
+                    node_latitudes[to_index],
+                    node_longitudes[to_index],
+                )
+                durations = {
+                    profile: distance / (speed_kmh / 3.6) if speed_kmh else math.inf
+                    for profile, speed_kmh in speeds_kmh.items()
+                }
+                if is_forward_allowed:
+                    outgoing_edges[from_index].append(
+                        (to_index, distance, durations, name_ids[name])
+                    )
+                if is_backward_allowed:
+                    outgoing_edges[to_index].append(
+                        (from_index, distance, durations, name_ids[name])
+                    )
+
+        num_nodes = len(node_latitudes)
+        edge_offsets = np.zeros(num_nodes + 1, dtype=np.int64)
+        edge_targets = list()
+        edge_distances = list()
+        edge_durations = {profile: list() for profile in PROFILE_SPEEDS_KMH}
+        edge_name_ids = list()
+        for node_index in range(num_nodes):
+            for target_index, distance, durations, name_id in outgoing_edges[node_index]:
+                edge_targets.append(target_index)
+                edge_distances.append(distance)
+                for profile, duration in durations.items():
+                    edge_durations[profile].append(duration)
+                edge_name_ids.append(name_id)
+            edge_offsets[node_index + 1] = len(edge_targets)
+
+        return cls(
+            node_latitudes,
+            node_longitudes,
+            edge_offsets,
+            edge_targets,
+            edge_distances,
+            edge_durations,
+            edge_name_ids,
+            names,
+        )
+
+
+def _get_max_speed_kmh(max_speed_tag: str, default_speed_kmh: float) -> float:
+    if not max_speed_tag:
+        return default_speed_kmh
+    try:
+        if max_speed_tag.endswith("mph"):
+            return float(max_speed_tag[:-3].strip()) * 1.609344
+        return float(max_speed_tag)
+    except ValueError:
+        # e.g. "none" or "DE:urban"
+        return default_speed_kmh
+
+
+# Lookup structures that LocalRoutingEngine derives from the road graph before the first request
+PREPARED_ATTRIBUTES = [
+    "_edge_offsets",
+    "_edge_targets",
+    "_edge_distances",
+    "_edge_durations",
+    "_edge_name_ids",
+    "_max_speeds",
+    "_snapping_grid",
+]
+
+
+class LocalRoutingEngine(RoutingBackend):
+    # Answers directions requests in this process with A* on a local road graph, returning the
+    # same "routes" -> "segments" -> "steps" structure with an encoded geometry that ORS returns
+    def __init__(self, graph_file_path: str = None, road_graph: RoadGraph = None):
+        if not graph_file_path and not road_graph:
+            raise ValueError("Either a graph file or a road graph is needed")
+        self.graph_file_path = graph_file_path
+        self._road_graph = road_graph
+        self._is_prepared = False
+
+    def __getstate__(self):
+        # Workers load the graph file themselves instead of receiving the whole graph pickled
+        state = self.__dict__.copy()
+        if self.graph_file_path:
+            state["_road_graph"] = None
+        state["_is_prepared"] = False
+        for prepared_attribute in PREPARED_ATTRIBUTES:
+            state.pop(prepared_attribute, None)
+        return state
+
+    def _prepare(self):
+        if self._is_prepared:
+            return
+        if self._road_graph is None:
+            if str(self.graph_file_path).endswith(".osm"):
+                self._road_graph = RoadGraph.from_osm_xml(self.graph_file_path)
+            else:
+                self._road_graph = RoadGraph.load(self.graph_file_path)
+        road_graph = self._road_graph
+
+        # Plain lists are a lot faster than NumPy arrays for the element-wise access of A*
+        self._edge_offsets = road_graph.edge_offsets.tolist()
+        self._edge_targets = road_graph.edge_targets.tolist()
+        self._edge_distances = road_graph.edge_distances.tolist()
+        self._edge_durations = {
+            profile: durations.tolist() for profile, durations in road_graph.edge_durations.items()
+        }
+        self._edge_name_ids = road_graph.edge_name_ids.tolist()
+        # The heuristic must never overestimate the remaining duration, so use the highest speed
+        self._max_speeds = dict()
+        for profile, durations in road_graph.edge_durations.items():
+            allowed_edges = np.isfinite(durations) & (durations > 0)
+            if allowed_edges.any():
+                self._max_speeds[profile] = float(
+                    np.max(road_graph.edge_distances[allowed_edges] / durations[allowed_edges])
+                )
+            else:
+                self._max_speeds[profile] = 1.0
+
+        # Only nodes with outgoing edges make sense as start or destination
+        self._snapping_grid = defaultdict(list)
+        for node_index in np.nonzero(np.diff(road_graph.edge_offsets) > 0)[0].tolist():
+            self._snapping_grid[
+                self._get_grid_cell(
+                    road_graph.node_latitudes[node_index], road_graph.node_longitudes[node_index]
+                )
+            ].append(node_index)
+        self._is_prepared = True
+
+    def _get_grid_cell(self, latitude: float, longitude: float) -> (int, int):
+        return (
+            int(math.floor(latitude / SNAPPING_GRID_CELL_SIZE_DEGREES)),
+            int(math.floor(longitude / SNAPPING_GRID_CELL_SIZE_DEGREES)),
+        )
+
+    def find_nearest_node(self, latitude: float, longitude: float) -> int:
+        self._prepare()
+        road_graph = self._road_graph
+        cell_lat, cell_lon = self._get_grid_cell(latitude, longitude)
+        # Every node in a ring of cells around the cell of the coordinate is at least this much
+        # further away than the ring before
+        min_cell_extent_m = haversine_distance_m(
+            latitude, longitude, latitude, longitude + SNAPPING_GRID_CELL_SIZE_DEGREES
+        )
+        nearest_node_index = None
+        nearest_distance = math.inf
+        for ring in range(MAX_SNAPPING_RING + 1):
+            for delta_lat in range(-ring, ring + 1):
+                for delta_lon in range(-ring, ring + 1):
+                    if max(abs(delta_lat), abs(delta_lon)) != ring:
+                        continue
+                    for node_index in self._snapping_grid.get(
+                        (cell_lat + delta_lat, cell_lon + delta_lon), []
+                    ):
+                        distance = haversine_distance_m(
+                            latitude,
+                            longitude,
+                            road_graph.node_latitudes[node_index],
+                            road_graph.node_longitudes[node_index],
+                        )
+                        if distance < nearest_distance:
+                            nearest_node_index = node_index
+                            nearest_distance = distance
+            # Nodes in the next ring can't be any closer than this
+            if nearest_distance <= ring * min_cell_extent_m:
+                break
+        if nearest_node_index is None:
+            raise RoutingError(f"No road found near ({latitude}, {longitude})")
+        return nearest_node_index
+
+    def find_path(self, from_node: int, to_node: int, profile: str, preference: str) -> list:
+        # A* search. Returns the edge indexes of the fastest (or shortest) path
+        self._prepare()
+        if profile not in self._edge_durations:
+            raise RoutingError(f"Unsupported profile: {profile}")
+        if preference == "shortest":
+            edge_weights = self._edge_distances
+            allowed_durations = self._edge_durations[profile]
+            max_speed = 1.0
+        else:
+            edge_weights = self._edge_durations[profile]
+            allowed_durations = edge_weights
+            max_speed = self._max_speeds[profile]
+
+        node_latitudes = self._road_graph.node_latitudes
+        node_longitudes = self._road_graph.node_longitudes
+        to_latitude = node_latitudes[to_node]
+        to_longitude = node_longitudes[to_node]
+
+        def heuristic(node_index: int) -> float:
+            return (
+                haversine_distance_m(
+                    node_latitudes[node_index],
+                    node_longitudes[node_index],
+                    to_latitude,
+                    to_longitude,
+                )
+                / max_speed
+            )
+
+        best_costs = {from_node: 0.0}
+        # Node index -> (edge index, source node index) of the best known way to reach it
+        previous_edges = dict()
+        open_nodes = [(heuristic(from_node), 0.0, from_node)]
+        edge_offsets = self._edge_offsets
+        edge_targets = self._edge_targets
+        while open_nodes:
+            _, cost, node_index = heapq.heappop(open_nodes)
+            if node_index == to_node:
+                break
+            if cost > best_costs.get(node_index, math.inf):
+                # Outdated entry
+                continue
+            for edge_index in range(edge_offsets[node_index], edge_offsets[node_index + 1]):
+                if allowed_durations[edge_index] == math.inf:
+                    continue
+                target_index = edge_targets[edge_index]
+                new_cost = cost + edge_weights[edge_index]
+                if new_cost < best_costs.get(target_index, math.inf):
+                    best_costs[target_index] = new_cost
+                    previous_edges[target_index] = (edge_index, node_index)
+                    heapq.heappush(
+                        open_nodes, (new_cost + heuristic(target_index), new_cost, target_index)
+                    )
+        else:
+            raise RoutingError(f"No route found between nodes {from_node} and {to_node}")
+
+        path_edges = list()
+        node_index = to_node
+        while node_index != from_node:
+            edge_index, node_index = previous_edges[node_index]
+            path_edges.append(edge_index)
+        path_edges.reverse()
+        return path_edges
+
+    def directions(self, coords, profile: str, preference: str, units: str = "m", **kwargs) -> dict:
+        self._prepare()
+        unit_factor = UNIT_FACTORS[units]
+        road_graph = self._road_graph
+        snapped_nodes = [self.find_nearest_node(lat, lon) for lon, lat in coords]
+
+        geometry = [
+            (
+                road_graph.node_longitudes[snapped_nodes[0]],
+                road_graph.node_latitudes[snapped_nodes[0]],
+            )
+        ]
+        segments = list()
+        route_way_points = [0]
+        for from_node, to_node in zip(snapped_nodes, snapped_nodes[1:]):
+            segment_start_index = len(geometry) - 1
+            steps = list()
+            for edge_index in self.find_path(from_node, to_node, profile, preference):
+                target_index = self._edge_targets[edge_index]
+                geometry.append(
+                    (
+                        road_graph.node_longitudes[target_index],
+                        road_graph.node_latitudes[target_index],
+                    )
+                )
+                distance = self._edge_distances[edge_index]
+                duration = self._edge_durations[profile][edge_index]
+                name = road_graph.names[self._edge_name_ids[edge_index]]
+                # Consecutive edges of the same street are one step
+                if steps and steps[-1]["name"] == (name or "-"):
+                    steps[-1]["distance"] += distance
+                    steps[-1]["duration"] += duration
+                    steps[-1]["way_points"][1] = len(geometry) - 1
+                else:
+                    steps.append(
+                        {
+                            "distance": distance,
+                            "duration": duration,
+                            "type": STEP_TYPE_DEPART if not steps else STEP_TYPE_CONTINUE,
+                            "instruction": f"{'Head' if not steps else 'Continue'} onto {name or '-'}",
+                            "name": name or "-",
+                            "way_points": [len(geometry) - 2, len(geometry) - 1],
+                        }
+                    )
+            segment_end_index = len(geometry) - 1
+            if segment_end_index == segment_start_index:
+                # Start and destination are the same, but the geometry still needs two points
+                geometry.append(geometry[-1])
+                segment_end_index += 1
+            steps.append(
+                {
+                    "distance": 0.0,
+                    "duration": 0.0,
+                    "type": STEP_TYPE_ARRIVE,
+                    "instruction": "Arrive at your destination",
+                    "name": "-",
+                    "way_points": [segment_end_index, segment_end_index],
+                }
+            )
+            for step in steps:
+                step["distance"] = round(step["distance"] * unit_factor, 1)
+                step["duration"] = round(step["duration"], 1)
+            segments.append(
+                {
+                    "distance": round(sum(step["distance"] for step in steps), 1),
+                    "duration": round(sum(step["duration"] for step in steps), 1),
+                    "steps": steps,
+                }
+            )
+            route_way_points.append(segment_end_index)
+
+        total_distance = sum(segment["distance"] for segment in segments)
+        total_duration = sum(segment["duration"] for segment in segments)
+        longitudes = [lon for lon, _ in geometry]
+        latitudes = [lat for _, lat in geometry]
+        return {
+            "routes": [
+                {
+                    # Just like ORS, there is no summary for a route without any distance
+                    "summary": (
+                        {
+                            "distance": round(total_distance, 1),
+                            "duration": round(total_duration, 1),
+                        }
+                        if total_distance > 0
+                        else {}
+                    ),
+                    "segments": segments,
+                    "bbox": [min(longitudes), min(latitudes), max(longitudes), max(latitudes)],
+                    "geometry": encode_polyline(geometry),
+                    "way_points": route_way_points,
+                }
+            ],
+            "metadata": {
+                "service": "routing",
+                "engine": {"name": "local"},
+                "query": {
+                    "coordinates": [list(coord) for coord in coords],
+                    "profile": profile,
+                    "preference": preference,
+                    "units": units,
+                },
+            },
+        }
+
+
+def build_graph_file(osm_file_path: str, graph_file_path: str):
+    road_graph = RoadGraph.from_osm_xml(osm_file_path)
+    road_graph.save(graph_file_path)
+    print(
+        f"Saved a road graph with {road_graph.get_num_nodes()} nodes and "
+        f"{len(road_graph.edge_targets)} edges to '{graph_file_path}'."
+    )
+
+
+def main():
+    if len(sys.argv) != 3:
+        print(f"Usage: {Path(sys.argv[0]).name} <extract.osm> <graph.npz>")
+        sys.exit(1)
+    build_graph_file(sys.argv[1], sys.argv[2])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+import os
+import json
+import shutil
+
+from pathlib import Path
+from collections import defaultdict
+
+from ..models import Person, DailyRoute
+
+RECORD_TYPE_PERSON = "person"
+RECORD_TYPE_DAILY_ROUTE = "daily_route"
+
+
+class JsonLinesRouteWriter:
+    # Writes every person and every daily route as its own JSON line as soon as it is known,
+    # so that nothing has to be kept in memory and finished work already is on disk
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        Path(file_path).parent.mkdir(parents=True, exist_ok=True)
+        self._out_file = open(file_path, "w")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _write_record(self, record: dict):
+        self._out_file.write(json.dumps(record))
+        self._out_file.write("\n")
+
+    def write_person(self, person: Person):
+        self.write_person_info(person.to_dict())
+
+    def write_person_info(self, person_info: dict):
+        # person_info: As returned by Person.to_dict
+        person_record = {"type": RECORD_TYPE_PERSON}
+        person_record.update(person_info)
+        self._write_record(person_record)
+
+    def write_daily_route(self, person_id: int, day_index: int, daily_route: DailyRoute):
+        daily_route_record = {"type": RECORD_TYPE_DAILY_ROUTE, "day": day_index}
+        daily_route_record.update(daily_route.to_dict())
+        daily_route_record["person"] = person_id
+        self._write_record(daily_route_record)
+
+    def close(self):
+        if not self._out_file.closed:
+            self._out_file.close()
+
+
+def convert_json_lines_to_dataset(
+    json_lines_file_path: str, output_file_path: str, num_days: int = None
+):
+    # Produces the single JSON file layout that was used before:
+    # {"people": [...], "daily_routes": [[routes of day 0 in the order of the people], ...]}
+    # num_days: Number of simulated days. Days without any daily routes, e.g. because all of them
+    #   failed, are empty lists. Only the days up to the last one with a daily route by default
+    # NOTE: Only the file offsets of the daily routes are kept in memory, not the routes themselves
+    person_order = dict()
+    daily_route_offsets_by_day = defaultdict(list)
+    with open(json_lines_file_path, "rb") as json_lines_file:
+        while True:
+            offset = json_lines_file.tell()
+            line = json_lines_file.readline()
+            if not line:
+                break
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if record["type"] == RECORD_TYPE_PERSON:
+                person_order[record["id"]] = len(person_order)
+            elif record["type"] == RECORD_TYPE_DAILY_ROUTE:
+                daily_route_offsets_by_day[record["day"]].append((record["person"], offset))
+
+        Path(output_file_path).parent.mkdir(parents=True, exist_ok=True)
+        with open(output_file_path, "w") as out_file:
+            out_file.write('{"people": [')
+            json_lines_file.seek(0)
+            is_first_person = True
+            for line in json_lines_file:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if record.pop("type") != RECORD_TYPE_PERSON:
+                    continue
+                if not is_first_person:
+                    out_file.write(", ")
+                out_file.write(json.dumps(record))
+                is_first_person = False
+
+            out_file.write('], "daily_routes": [')
+            if num_days is None:
+                num_days = max(daily_route_offsets_by_day, default=-1) + 1
+            for day_index in range(num_days):
+                if day_index > 0:
+                    out_file.write(", ")
+                out_file.write("[")
+                daily_route_offsets = sorted(
+                    daily_route_offsets_by_day.get(day_index, []),
+                    key=lambda person_and_offset: person_order[person_and_offset[0]],
+                )
+                for route_index, (_, offset) in enumerate(daily_route_offsets):
+                    json_lines_file.seek(offset)
+                    record = json.loads(json_lines_file.readline())
+                    del record["type"]
+                    del record["day"]
+                    if route_index > 0:
+                        out_file.write(", ")
+                    out_file.write(json.dumps(record))
+                out_file.write("]")
+            out_file.write("]}")
+
+
+def merge_json_lines_files(json_lines_file_paths: list, output_file_path: str):
+    # Combines the outputs of several shards, which only have to be appended to each other, as the
+    # conversion to the dataset doesn't depend on the order of the records
+    Path(output_file_path).parent.mkdir(parents=True, exist_ok=True)
+    with open(output_file_path, "wb") as out_file:
+        for json_lines_file_path in json_lines_file_paths:
+            with open(json_lines_file_path, "rb") as json_lines_file:
+                shutil.copyfileobj(json_lines_file, out_file)
+                # The last line of a file might not end with a line break
+                json_lines_file.seek(0, os.SEEK_END)
+                if json_lines_file.tell() > 0:
+                    json_lines_file.seek(-1, os.SEEK_END)
+                    if json_lines_file.read(1) != b"\n":
+                        out_file.write(b"\n")
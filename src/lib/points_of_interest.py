@@ -1,32 +1,67 @@
-import requests
+import os
+import bisect
 import json
 import math
+import ijson
+import hashlib
+import requests
 
 from geojson import Point
+from pathlib import Path
 from turfpy.measurement import destination
+from concurrent.futures import ThreadPoolExecutor
 
-from ..models import Workplace, FreeTimePlace
+from ..models import PlaceRegistry
 
 LOCAL_API_SERVER = "http://localhost:5000/pois"
+POI_CACHE_DIRECTORY = "cache/pois"
+# The service only accepts areas of up to about 5km^2. Tiles of this size are at most 4.9km^2
+# (at the equator), in Germany they are roughly 2.2km x 1.4km
+POI_TILE_SIZE_DEGREES = 0.02
+MAX_CONCURRENT_POI_REQUESTS = 8
+POI_REQUEST_TIMEOUT_SECONDS = 120
+RESPONSE_CHUNK_SIZE_BYTES = 64 * 1024
+
 
+def get_all_pois(
+    central_location_point: Point,
+    places_info: dict,
+    square_length_km: float,
+    cache_directory: str = POI_CACHE_DIRECTORY,
+    max_concurrent_requests: int = MAX_CONCURRENT_POI_REQUESTS,
+) -> dict:
+    return {
+        "type": "FeatureCollection",
+        "features": list(
+            iter_all_pois(
+                central_location_point,
+                places_info,
+                square_length_km,
+                cache_directory,
+                max_concurrent_requests,
+            )
+        ),
+    }
 
-def get_all_pois(central_location_point: Point, places_info: dict, square_length_km: float) -> dict:
+
+def iter_all_pois(
+    central_location_point: Point,
+    places_info: dict,
+    square_length_km: float,
+    cache_directory: str = POI_CACHE_DIRECTORY,
+    max_concurrent_requests: int = MAX_CONCURRENT_POI_REQUESTS,
+):
+    # Yields the GeoJSON features of all POIs one by one, never the whole collection at once
     distance_km = square_length_km * math.sqrt(2)  # length * sqrt(2)
     bearing_top_right = 45
     bearing_bottom_left = -135
-    # For the full polygon, we need the other two corners as well
-    bearing_top_left = 135
-    bearing_bottom_right = -45
     options = {"units": "km"}
     dest_top_right = destination(central_location_point, distance_km, bearing_top_right, options)
     dest_bottom_left = destination(
         central_location_point, distance_km, bearing_bottom_left, options
     )
-
-    dest_top_left = destination(central_location_point, distance_km, bearing_top_left, options)
-    dest_bottom_right = destination(
-        central_location_point, distance_km, bearing_bottom_right, options
-    )
+    west, south = dest_bottom_left["geometry"]["coordinates"][:2]
+    east, north = dest_top_right["geometry"]["coordinates"][:2]
 
     # Collect all information for the places we're interested in
     category_group_ids_of_interest = [
@@ -39,65 +74,168 @@ def get_all_pois(central_location_point: Point, places_info: dict, square_length
         for category_id, place_info in places_info.items()
         if not place_info["IsGroupID"]
     ]
+    filters = {
+        "category_group_ids": category_group_ids_of_interest,
+        "category_ids": category_ids_of_interest,
+    }
+
+    # The service only answers small areas, so the square is split into tiles that are fetched
+    # concurrently. Tiles are cached on disk per set of filters, only new tiles are requested
+    tiles = get_tiles_in_bounding_box(south, west, north, east)
+    tile_cache_directory = Path(cache_directory) / get_filters_key(filters)
+    tile_cache_directory.mkdir(parents=True, exist_ok=True)
+    tile_cache_file_paths = {
+        tile: tile_cache_directory / f"{tile[0]}_{tile[1]}.json" for tile in tiles
+    }
+    missing_tiles = [tile for tile in tiles if not tile_cache_file_paths[tile].exists()]
+    if missing_tiles:
+        with ThreadPoolExecutor(max_workers=max(1, max_concurrent_requests)) as executor:
+            for _ in executor.map(
+                lambda tile: fetch_pois_in_tile(tile, filters, tile_cache_file_paths[tile]),
+                missing_tiles,
+            ):
+                pass
+        print(f"Fetched points of interest for {len(missing_tiles)} new tiles.")
+
+    # POIs on the border of two tiles are returned for both of them. Tiles also reach beyond the
+    # square, so everything outside of it is dropped
+    seen_poi_keys = set()
+    for tile in tiles:
+        with open(tile_cache_file_paths[tile], "rb") as tile_cache_file:
+            for feature in ijson.items(tile_cache_file, "features.item", use_float=True):
+                longitude, latitude = feature["geometry"]["coordinates"][:2]
+                if not (south <= latitude <= north and west <= longitude <= east):
+                    continue
+                poi_key = get_poi_key(feature)
+                if poi_key in seen_poi_keys:
+                    continue
+                seen_poi_keys.add(poi_key)
+                yield feature
+
+
+def get_tile(latitude: float, longitude: float) -> (int, int):
+    return (
+        int(math.floor(longitude / POI_TILE_SIZE_DEGREES)),
+        int(math.floor(latitude / POI_TILE_SIZE_DEGREES)),
+    )
+
+
+def get_tiles_in_bounding_box(south: float, west: float, north: float, east: float) -> list:
+    min_tile_x, min_tile_y = get_tile(south, west)
+    max_tile_x, max_tile_y = get_tile(north, east)
+    return [
+        (tile_x, tile_y)
+        for tile_y in range(min_tile_y, max_tile_y + 1)
+        for tile_x in range(min_tile_x, max_tile_x + 1)
+    ]
+
+
+def get_filters_key(filters: dict) -> str:
+    # Tiles fetched with different categories of interest contain different POIs
+    filters_json = json.dumps(filters, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(filters_json.encode("utf-8")).hexdigest()[:16]
+
+
+def get_poi_key(feature: dict):
+    properties = feature.get("properties", dict())
+    if "osm_id" in properties:
+        return (properties.get("osm_type"), properties["osm_id"])
+    # Without an OSM id, the same POI is recognized by its location
+    return tuple(feature["geometry"]["coordinates"][:2])
 
-    # buffer_meters = 2000
-    buffer_meters = 0
+
+def fetch_pois_in_tile(tile: tuple, filters: dict, cache_file_path: Path):
+    # The response is streamed to the cache file as it is, without parsing it here
+    tile_x, tile_y = tile
+    south = tile_y * POI_TILE_SIZE_DEGREES
+    west = tile_x * POI_TILE_SIZE_DEGREES
+    north = south + POI_TILE_SIZE_DEGREES
+    east = west + POI_TILE_SIZE_DEGREES
     poi_req_info_json = {
         "request": "pois",
         "geometry": {
             "geojson": {
                 "type": "Polygon",
                 "coordinates": [
-                    [
-                        [
-                            dest_bottom_left["geometry"]["coordinates"][0],
-                            dest_bottom_left["geometry"]["coordinates"][1],
-                        ],
-                        [
-                            dest_bottom_right["geometry"]["coordinates"][0],
-                            dest_bottom_right["geometry"]["coordinates"][1],
-                        ],
-                        [
-                            dest_top_right["geometry"]["coordinates"][0],
-                            dest_top_right["geometry"]["coordinates"][1],
-                        ],
-                        [
-                            dest_top_left["geometry"]["coordinates"][0],
-                            dest_top_left["geometry"]["coordinates"][1],
-                        ],
-                        [
-                            dest_bottom_left["geometry"]["coordinates"][0],
-                            dest_bottom_left["geometry"]["coordinates"][1],
-                        ],
-                    ]
+                    [[west, south], [east, south], [east, north], [west, north], [west, south]]
                 ],
             },
-            "buffer": buffer_meters,
-        },
-        "filters": {
-            "category_group_ids": category_group_ids_of_interest,
-            "category_ids": category_ids_of_interest,
+            "buffer": 0,
         },
+        "filters": filters,
     }
-    print(poi_req_info_json)
 
-    r = requests.post(LOCAL_API_SERVER, json=poi_req_info_json)
+    with requests.post(
+        LOCAL_API_SERVER, json=poi_req_info_json, timeout=POI_REQUEST_TIMEOUT_SECONDS, stream=True
+    ) as r:
+        # Failed tiles must not end up in the cache
+        r.raise_for_status()
+        # Written to a temporary file first, so that an interrupted run can't leave a broken
+        # tile behind
+        temporary_file_path = cache_file_path.with_suffix(".tmp")
+        with open(temporary_file_path, "wb") as tile_cache_file:
+            for chunk in r.iter_content(chunk_size=RESPONSE_CHUNK_SIZE_BYTES):
+                tile_cache_file.write(chunk)
+        os.replace(temporary_file_path, cache_file_path)
+
+
+class CategoryResolver:
+    # Finds the information in places_info that belongs to a category id. Categories that aren't
+    # listed themselves belong to the nearest group category below them
+    def __init__(self, places_info: dict):
+        self.places_info = places_info
+        self._group_category_ids = sorted(
+            int(category_id)
+            for category_id, place_info in places_info.items()
+            if place_info["IsGroupID"]
+        )
+        self._resolved_place_infos = dict()
 
-    return r.json()
+    def resolve(self, category_id: str) -> dict:
+        related_place_info = self._resolved_place_infos.get(category_id)
+        if related_place_info is None:
+            related_place_info = self.places_info.get(category_id)
+            if not related_place_info:
+                # Look in the nearest group category
+                group_index = bisect.bisect_left(self._group_category_ids, int(category_id)) - 1
+                if group_index < 0:
+                    raise KeyError(f"No group category for category id {category_id}")
+                related_place_info = self.places_info[str(self._group_category_ids[group_index])]
+            self._resolved_place_infos[category_id] = related_place_info
+        return related_place_info
 
 
-def parse_pois(poi_info: dict, places_info: dict) -> (list, list):
-    known_group_category_ids = list()
-    for category_id, place_info in places_info.items():
-        if place_info["IsGroupID"]:
-            known_group_category_ids.append(category_id)
-    known_group_category_ids = sorted(known_group_category_ids)
+def parse_pois(
+    poi_info: dict, places_info: dict, place_registry: PlaceRegistry = None
+) -> (list, list):
+    return parse_poi_features(poi_info["features"], places_info, place_registry)
 
-    workplaces = list()
-    free_time_places = list()
 
-    for poi in poi_info["features"]:
-        category_id = list(poi["properties"]["category_ids"].keys())[0]
+def parse_pois_file(
+    file_path: str, places_info: dict, place_registry: PlaceRegistry = None
+) -> (list, list):
+    # Parses a GeoJSON feature collection feature by feature, without loading the whole file
+    with open(file_path, "rb") as poi_file:
+        return parse_poi_features(
+            ijson.items(poi_file, "features.item", use_float=True), places_info, place_registry
+        )
+
+
+def parse_poi_features(
+    features, places_info: dict, place_registry: PlaceRegistry = None
+) -> (list, list):
+    # features: Any iterable of GeoJSON features, e.g. the generator of iter_all_pois
+    # Every POI is added to the place registry once. The workplaces and free time places that are
+    # returned are the registry's objects, a POI with both roles is in both lists with the same id
+    if place_registry is None:
+        place_registry = PlaceRegistry()
+    category_resolver = CategoryResolver(places_info)
+
+    workplace_ids = list()
+    free_time_place_ids = list()
+
+    for poi in features:
+        category_id = next(iter(poi["properties"]["category_ids"]))
         category_name = poi["properties"]["category_ids"][category_id]["category_name"]
         osm_tags = poi["properties"].get("osm_tags")
         if not osm_tags or "name" not in osm_tags:
@@ -108,38 +246,29 @@ def parse_pois(poi_info: dict, places_info: dict) -> (list, list):
         longitude = poi["geometry"]["coordinates"][0]
 
         # Associate information about this category with this point of interest by the ID
-        related_place_info = places_info.get(category_id)
-        if not related_place_info:
-            # Look in the nearest group category
-            best_id_match = -1
-            for group_category_id in known_group_category_ids:
-                if int(category_id) > int(group_category_id):
-                    best_id_match = group_category_id
-            related_place_info = places_info[best_id_match]
+        related_place_info = category_resolver.resolve(category_id)
 
         work_info = related_place_info["WorkInfo"]
         free_time_activity_info = related_place_info["FreeTimeActivityInfo"]
+        if not work_info and not free_time_activity_info:
+            continue
 
+        place_id = place_registry.add_place(
+            int(category_id),
+            category_name,
+            name,
+            latitude,
+            longitude,
+            work_info,
+            free_time_activity_info,
+        )
         if work_info:
-            workplace = Workplace(
-                int(category_id),
-                category_name,
-                name,
-                latitude,
-                longitude,
-                work_info,
-            )
-            workplaces.append(workplace)
-
+            workplace_ids.append(place_id)
         if free_time_activity_info:
-            free_time_place = FreeTimePlace(
-                int(category_id),
-                category_name,
-                name,
-                latitude,
-                longitude,
-                free_time_activity_info,
-            )
-            free_time_places.append(free_time_place)
+            free_time_place_ids.append(place_id)
 
+    workplaces = [place_registry.get_workplace(place_id) for place_id in workplace_ids]
+    free_time_places = [
+        place_registry.get_free_time_place(place_id) for place_id in free_time_place_ids
+    ]
     return workplaces, free_time_places
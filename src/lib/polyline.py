@@ -0,0 +1,51 @@
+import numpy as np
+
+# Encoded polylines as used by ORS (and Google): Each coordinate is stored as the difference to the
+# previous one, zigzag encoded and split into chunks of 5 bits
+DEFAULT_PRECISION = 5
+
+
+def encode_polyline(coords, precision: int = DEFAULT_PRECISION) -> str:
+    # NOTE: Expects (lon, lat) pairs just like decode_polyline of openrouteservice returns them
+    factor = 10**precision
+    encoded_chars = list()
+    previous_lat = 0
+    previous_lon = 0
+    for lon, lat in coords:
+        current_lat = int(round(lat * factor))
+        current_lon = int(round(lon * factor))
+        for delta in (current_lat - previous_lat, current_lon - previous_lon):
+            value = ~(delta << 1) if delta < 0 else delta << 1
+            while value >= 0x20:
+                encoded_chars.append(chr((0x20 | (value & 0x1F)) + 63))
+                value >>= 5
+            encoded_chars.append(chr(value + 63))
+        previous_lat = current_lat
+        previous_lon = current_lon
+    return "".join(encoded_chars)
+
+
+def decode_polyline(encoded_polyline: str, precision: int = DEFAULT_PRECISION) -> np.ndarray:
+    # Decodes all points at once instead of character by character. Returns one (lon, lat) row
+    # per point, the same values that decode_polyline of openrouteservice returns
+    chunks = np.frombuffer(encoded_polyline.encode("ascii"), dtype=np.uint8).astype(np.int64) - 63
+    # Every value is split into chunks of 5 bits, the last one of them doesn't have the 0x20 bit set
+    last_chunk_indexes = np.flatnonzero(chunks < 0x20)
+    num_values = len(last_chunk_indexes)
+    if num_values % 2 != 0 or (num_values and last_chunk_indexes[-1] != len(chunks) - 1):
+        raise ValueError("Invalid encoded polyline: It ends in the middle of a point")
+    if num_values == 0:
+        return np.empty((0, 2), dtype=np.float64)
+
+    first_chunk_indexes = np.concatenate(([0], last_chunk_indexes[:-1] + 1))
+    chunk_shifts = 5 * (
+        np.arange(len(chunks))
+        - np.repeat(first_chunk_indexes, last_chunk_indexes - first_chunk_indexes + 1)
+    )
+    values = np.add.reduceat((chunks & 0x1F) << chunk_shifts, first_chunk_indexes)
+    # Undo the zigzag encoding, then add up the differences between the points
+    deltas = (values >> 1) ^ -(values & 1)
+    coordinates = np.cumsum(deltas.reshape(-1, 2), axis=0)
+    # Dividing the integers gives the closest float to the decimal coordinate
+    factor = 10**precision
+    return np.column_stack((coordinates[:, 1] / factor, coordinates[:, 0] / factor))
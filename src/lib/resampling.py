@@ -0,0 +1,175 @@
+import numpy as np
+
+from ..models import DailyRoute
+from ..lib.geometry import haversine_distances_m
+
+# Two neighboring waypoints that are further apart in time are a stay, e.g. at the workplace. The
+# person stays at the first of them and only then moves on to the second one. Travelling between
+# two waypoints of a route never takes that long
+DEFAULT_MIN_STAY_SECONDS = 10 * 60
+
+
+def _get_segments(
+    latitudes: np.ndarray, longitudes: np.ndarray, timestamps: np.ndarray, min_stay_seconds: float
+) -> (np.ndarray, np.ndarray):
+    # The length of the way from each waypoint to the next one and when the person starts to move
+    # along it. After a stay, that is as late as possible at the usual speed of the route. The last
+    # waypoint gets a segment of length 0
+    distances = np.append(haversine_distances_m(latitudes, longitudes), 0.0)
+    durations = np.diff(timestamps, append=timestamps[-1])
+    is_stay = durations >= min_stay_seconds
+    moving_duration = durations[~is_stay].sum()
+    departure_timestamps = timestamps.copy()
+    if moving_duration > 0:
+        speed = distances[~is_stay].sum() / moving_duration
+        departure_timestamps[is_stay] = np.maximum(
+            timestamps[is_stay],
+            timestamps[is_stay] + durations[is_stay] - distances[is_stay] / speed,
+        )
+    else:
+        departure_timestamps[is_stay] += durations[is_stay]
+    return distances, departure_timestamps
+
+
+def _interpolate_segments(
+    latitudes: np.ndarray,
+    longitudes: np.ndarray,
+    timestamps: np.ndarray,
+    departure_timestamps: np.ndarray,
+    segment_indexes: np.ndarray,
+    fractions: np.ndarray,
+) -> (np.ndarray, np.ndarray, np.ndarray):
+    # The points at the given fractions of the way along each segment
+    next_waypoint_indexes = np.minimum(segment_indexes + 1, len(latitudes) - 1)
+    return tuple(
+        start_column[segment_indexes]
+        + fractions * (end_column[next_waypoint_indexes] - start_column[segment_indexes])
+        for start_column, end_column in (
+            (latitudes, latitudes),
+            (longitudes, longitudes),
+            (departure_timestamps, timestamps),
+        )
+    )
+
+
+def _get_segment_indexes(positions: np.ndarray, sampled_positions: np.ndarray) -> np.ndarray:
+    # The index of the last waypoint at or before each sampled position (a time or a distance)
+    return np.clip(
+        np.searchsorted(positions, sampled_positions, side="right") - 1, 0, len(positions) - 1
+    )
+
+
+def _get_fractions(offsets: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    # How far along its segment each sample is, 0 for segments without any length
+    fractions = np.zeros(len(offsets), dtype=np.float64)
+    has_length = lengths > 0
+    fractions[has_length] = np.clip(offsets[has_length] / lengths[has_length], 0.0, 1.0)
+    return fractions
+
+
+def resample_by_time(
+    latitudes,
+    longitudes,
+    timestamps,
+    interval_seconds: float,
+    include_stays: bool = True,
+    min_stay_seconds: float = DEFAULT_MIN_STAY_SECONDS,
+) -> (np.ndarray, np.ndarray, np.ndarray):
+    # Samples the route every interval_seconds, like a GPS logger with a fixed recording frequency.
+    # The samples are at multiples of the interval since the epoch, so that the samples of
+    # different routes line up. Positions between two waypoints are interpolated linearly.
+    # During stays, the position is held at the place of the stay, or not sampled at all if
+    # include_stays is False
+    if interval_seconds <= 0:
+        raise ValueError("The sampling interval must be positive")
+    latitudes = np.asarray(latitudes, dtype=np.float64)
+    longitudes = np.asarray(longitudes, dtype=np.float64)
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+    if len(timestamps) == 0:
+        return latitudes, longitudes, timestamps
+
+    first_sample_index = np.ceil(timestamps[0] / interval_seconds)
+    last_sample_index = np.floor(timestamps[-1] / interval_seconds)
+    sampled_timestamps = (
+        np.arange(first_sample_index, last_sample_index + 1, dtype=np.float64) * interval_seconds
+    )
+
+    _, departure_timestamps = _get_segments(latitudes, longitudes, timestamps, min_stay_seconds)
+    segment_indexes = _get_segment_indexes(timestamps, sampled_timestamps)
+    segment_end_timestamps = timestamps[np.minimum(segment_indexes + 1, len(timestamps) - 1)]
+    fractions = _get_fractions(
+        sampled_timestamps - departure_timestamps[segment_indexes],
+        segment_end_timestamps - departure_timestamps[segment_indexes],
+    )
+    sampled_latitudes, sampled_longitudes, _ = _interpolate_segments(
+        latitudes, longitudes, timestamps, departure_timestamps, segment_indexes, fractions
+    )
+
+    if not include_stays:
+        # Only samples while moving and the one at the moment of arrival are kept
+        is_sampled = (sampled_timestamps >= departure_timestamps[segment_indexes]) | (
+            sampled_timestamps == timestamps[segment_indexes]
+        )
+        return (
+            sampled_latitudes[is_sampled],
+            sampled_longitudes[is_sampled],
+            sampled_timestamps[is_sampled],
+        )
+    return sampled_latitudes, sampled_longitudes, sampled_timestamps
+
+
+def resample_by_distance(
+    latitudes,
+    longitudes,
+    timestamps,
+    interval_meters: float,
+    min_stay_seconds: float = DEFAULT_MIN_STAY_SECONDS,
+) -> (np.ndarray, np.ndarray, np.ndarray):
+    # Samples the route every interval_meters along its geometry, starting at its first waypoint.
+    # The timestamps are interpolated the same way as the positions. A stay is only one sample
+    if interval_meters <= 0:
+        raise ValueError("The sampling interval must be positive")
+    latitudes = np.asarray(latitudes, dtype=np.float64)
+    longitudes = np.asarray(longitudes, dtype=np.float64)
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+    if len(timestamps) == 0:
+        return latitudes, longitudes, timestamps
+
+    distances, departure_timestamps = _get_segments(
+        latitudes, longitudes, timestamps, min_stay_seconds
+    )
+    travelled_distances = np.concatenate(([0.0], np.cumsum(distances[:-1])))
+    sampled_distances = np.arange(
+        0.0, np.nextafter(travelled_distances[-1], np.inf), interval_meters, dtype=np.float64
+    )
+
+    segment_indexes = _get_segment_indexes(travelled_distances, sampled_distances)
+    fractions = _get_fractions(
+        sampled_distances - travelled_distances[segment_indexes], distances[segment_indexes]
+    )
+    return _interpolate_segments(
+        latitudes, longitudes, timestamps, departure_timestamps, segment_indexes, fractions
+    )
+
+
+def resample_daily_route(
+    daily_route: DailyRoute,
+    interval_seconds: float = None,
+    interval_meters: float = None,
+    include_stays: bool = True,
+) -> DailyRoute:
+    # Exactly one of the intervals has to be given
+    if (interval_seconds is None) == (interval_meters is None):
+        raise ValueError("Either a time or a distance interval is needed")
+    columns = (
+        daily_route.get_latitudes(),
+        daily_route.get_longitudes(),
+        daily_route.get_timestamps(),
+    )
+    if interval_seconds is not None:
+        sampled_columns = resample_by_time(*columns, interval_seconds, include_stays)
+    else:
+        sampled_columns = resample_by_distance(*columns, interval_meters)
+    resampled_daily_route = DailyRoute()
+    resampled_daily_route.add_waypoints(*sampled_columns)
+    return resampled_daily_route
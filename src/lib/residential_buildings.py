@@ -1,46 +1,161 @@
-import json
+import math
+import sqlite3
 
 import overpass
 
 from pathlib import Path
 
 from ..models import Position
+from ..lib.geometry import haversine_distance_m, EARTH_RADIUS_METERS
 
+BUILDING_CACHE_FILE_PATH = "cache/buildings_cache.sqlite"
+# The cache is organized in tiles of this size, roughly 2.2km x 1.4km in Germany.
+# Any area is answered from the tiles that cover it, so only new tiles have to be fetched
+TILE_SIZE_DEGREES = 0.02
 
-def get_all_residential_buildings(
-    central_location_latitude: float, central_location_longitude: float, overpass_api: overpass.API
-) -> list:
-    radius = 5000  # TODO: Set depending on square size
 
-    Path("cache/").mkdir(exist_ok=True)
+class BuildingTileCache:
+    def __init__(self, file_path: str = BUILDING_CACHE_FILE_PATH):
+        self.file_path = file_path
+        Path(file_path).parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(file_path, timeout=60)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS tiles (tile_x INTEGER, tile_y INTEGER, "
+            "PRIMARY KEY (tile_x, tile_y))"
+        )
+        # Every building belongs to the tile that contains its (first) coordinate
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS buildings (osm_id TEXT PRIMARY KEY, "
+            "tile_x INTEGER NOT NULL, tile_y INTEGER NOT NULL, "
+            "latitude REAL NOT NULL, longitude REAL NOT NULL)"
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS buildings_tile ON buildings (tile_x, tile_y)"
+        )
+        self._connection.commit()
 
-    cached_buildings_info = dict()
-    with open("cache/overpass_cache.json", "r") as cache_file:
-        cached_buildings_info = json.load(cache_file)
+    def close(self):
+        self._connection.close()
 
-    query = f'way(around:{radius},{central_location_latitude},{central_location_longitude})["building"="residential"];(._;<;);'
+    def get_missing_tiles(self, tiles: list) -> list:
+        missing_tiles = list()
+        for tile_x, tile_y in tiles:
+            row = self._connection.execute(
+                "SELECT 1 FROM tiles WHERE tile_x = ? AND tile_y = ?", (tile_x, tile_y)
+            ).fetchone()
+            if row is None:
+                missing_tiles.append((tile_x, tile_y))
+        return missing_tiles
 
-    # Check if there already is an entry in the cache
-    if not query in cached_buildings_info:
-        result = overpass_api.Get(query, responseformat="geojson", verbosity="geom")
-        # Cache residential info returned from the API
+    def add_tile(self, tile: tuple, buildings: list):
+        # buildings: List of (OSM id, latitude, longitude)
+        with self._connection:
+            self._connection.executemany(
+                "INSERT OR IGNORE INTO buildings (osm_id, tile_x, tile_y, latitude, longitude) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [
+                    (osm_id, *get_tile(latitude, longitude), latitude, longitude)
+                    for osm_id, latitude, longitude in buildings
+                ],
+            )
+            self._connection.execute("INSERT OR IGNORE INTO tiles VALUES (?, ?)", tile)
+
+    def get_buildings(self, tiles: list) -> list:
         buildings = list()
-        for building_info in result["features"]:
-            building_longitude = building_info["geometry"]["coordinates"][0][0]
-            building_latitude = building_info["geometry"]["coordinates"][0][1]
-            buildings.append([building_latitude, building_longitude])
+        for tile_x, tile_y in tiles:
+            buildings.extend(
+                self._connection.execute(
+                    "SELECT latitude, longitude FROM buildings "
+                    "WHERE tile_x = ? AND tile_y = ? ORDER BY rowid",
+                    (tile_x, tile_y),
+                ).fetchall()
+            )
+        return buildings
+
+
+def get_tile(latitude: float, longitude: float) -> (int, int):
+    return (
+        int(math.floor(longitude / TILE_SIZE_DEGREES)),
+        int(math.floor(latitude / TILE_SIZE_DEGREES)),
+    )
+
+
+def get_tiles_in_radius(latitude: float, longitude: float, radius_meters: float) -> list:
+    # All tiles that overlap the bounding box of the circle
+    delta_latitude = math.degrees(radius_meters / EARTH_RADIUS_METERS)
+    delta_longitude = math.degrees(
+        radius_meters / (EARTH_RADIUS_METERS * math.cos(math.radians(latitude)))
+    )
+    min_tile_x, min_tile_y = get_tile(latitude - delta_latitude, longitude - delta_longitude)
+    max_tile_x, max_tile_y = get_tile(latitude + delta_latitude, longitude + delta_longitude)
+    return [
+        (tile_x, tile_y)
+        for tile_y in range(min_tile_y, max_tile_y + 1)
+        for tile_x in range(min_tile_x, max_tile_x + 1)
+    ]
+
 
-        cached_buildings_info[query] = buildings
-        print(buildings)
+def _get_first_coordinate(geometry: dict) -> list:
+    # Depending on the type of the geometry, the coordinates are nested differently
+    coordinates = geometry["coordinates"]
+    while isinstance(coordinates[0], list):
+        coordinates = coordinates[0]
+    return coordinates
+
+
+def fetch_residential_buildings_in_tile(tile: tuple, overpass_api: overpass.API) -> list:
+    tile_x, tile_y = tile
+    south = tile_y * TILE_SIZE_DEGREES
+    west = tile_x * TILE_SIZE_DEGREES
+    north = south + TILE_SIZE_DEGREES
+    east = west + TILE_SIZE_DEGREES
+    query = f'way({south},{west},{north},{east})["building"="residential"];(._;<;);'
+    result = overpass_api.Get(query, responseformat="geojson", verbosity="geom")
+
+    buildings = list()
+    for building_info in result["features"]:
+        if not building_info.get("geometry") or not building_info["geometry"].get("coordinates"):
+            continue
+        first_coordinate = _get_first_coordinate(building_info["geometry"])
+        building_longitude, building_latitude = first_coordinate[0], first_coordinate[1]
+        # Buildings on the border of a tile are returned for both tiles, but only stored once
+        osm_id = building_info.get("id", f"{building_latitude},{building_longitude}")
+        buildings.append((str(osm_id), building_latitude, building_longitude))
+    return buildings
+
+
+def get_all_residential_buildings(
+    central_location_latitude: float,
+    central_location_longitude: float,
+    overpass_api: overpass.API,
+    square_length_km: float,
+    cache_file_path: str = BUILDING_CACHE_FILE_PATH,
+) -> list:
+    # The buildings in the circle that fits into the square of the points of interest (see
+    # iter_all_pois), so that the people live among the places they go to
+    radius = square_length_km * 1000
+    building_cache = BuildingTileCache(cache_file_path)
+    tiles = get_tiles_in_radius(central_location_latitude, central_location_longitude, radius)
 
-        with open("cache/overpass_cache.json", "w") as cache_file:
-            json.dump(cached_buildings_info, cache_file)
-    else:
-        # print("Already in cache!")
-        pass
+    # Only tiles that were never fetched before are requested from Overpass
+    missing_tiles = building_cache.get_missing_tiles(tiles)
+    for tile in missing_tiles:
+        building_cache.add_tile(tile, fetch_residential_buildings_in_tile(tile, overpass_api))
+    if missing_tiles:
+        print(f"Fetched residential buildings for {len(missing_tiles)} new tiles.")
 
     building_positions = list()
-    for building in cached_buildings_info[query]:
-        building_positions.append(Position(building[0], building[1]))
+    for building_latitude, building_longitude in building_cache.get_buildings(tiles):
+        if (
+            haversine_distance_m(
+                central_location_latitude,
+                central_location_longitude,
+                building_latitude,
+                building_longitude,
+            )
+            <= radius
+        ):
+            building_positions.append(Position(building_latitude, building_longitude))
+    building_cache.close()
 
     return building_positions
@@ -0,0 +1,66 @@
+import time
+import random
+import asyncio
+import aiohttp
+import requests
+
+from openrouteservice import exceptions as ors_exceptions
+
+DEFAULT_MAX_ATTEMPTS = 4
+BACKOFF_BASE_SECONDS = 1.0
+MAX_BACKOFF_SECONDS = 30.0
+# Status codes of overloaded or restarting servers, which are worth trying again
+TRANSIENT_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+# Separate from the global random state, which decides what people do
+_backoff_random = random.Random()
+
+
+class MalformedResponseError(Exception):
+    # The routing backend answered, but not with what was asked for
+    pass
+
+
+def is_transient_error(error: Exception) -> bool:
+    if isinstance(error, (ors_exceptions.Timeout, MalformedResponseError)):
+        return True
+    if isinstance(error, ors_exceptions.ApiError):
+        return error.status in TRANSIENT_STATUS_CODES
+    if isinstance(error, ors_exceptions.HTTPError):
+        return error.status_code in TRANSIENT_STATUS_CODES
+    if isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+        return True
+    if isinstance(error, aiohttp.ClientResponseError):
+        return error.status in TRANSIENT_STATUS_CODES
+    if isinstance(error, (aiohttp.ClientConnectionError, asyncio.TimeoutError)):
+        return True
+    return False
+
+
+def get_backoff_seconds(attempt: int) -> float:
+    # Exponential backoff with full jitter, so that workers that failed together don't retry together
+    return _backoff_random.uniform(0, min(MAX_BACKOFF_SECONDS, BACKOFF_BASE_SECONDS * 2**attempt))
+
+
+def call_with_retries(function, *args, max_attempts: int = DEFAULT_MAX_ATTEMPTS, **kwargs):
+    # Calls the function until it doesn't raise a transient error anymore. Other errors and the last
+    # transient one are raised
+    for attempt in range(max_attempts):
+        try:
+            return function(*args, **kwargs)
+        except Exception as error:
+            if attempt == max_attempts - 1 or not is_transient_error(error):
+                raise
+        time.sleep(get_backoff_seconds(attempt))
+
+
+async def call_with_retries_async(
+    coroutine_function, *args, max_attempts: int = DEFAULT_MAX_ATTEMPTS, **kwargs
+):
+    for attempt in range(max_attempts):
+        try:
+            return await coroutine_function(*args, **kwargs)
+        except Exception as error:
+            if attempt == max_attempts - 1 or not is_transient_error(error):
+                raise
+        await asyncio.sleep(get_backoff_seconds(attempt))
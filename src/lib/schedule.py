@@ -0,0 +1,168 @@
+import numpy as np
+
+from datetime import datetime, time, timedelta
+
+from ..lib.seeding import get_random_numbers
+
+# All information about the schedule, as stored by get_columns. Every column except "is_weekend"
+# (one value per day) has one row per person and one column per day
+SCHEDULE_COLUMN_NAMES = (
+    "is_weekend",
+    "start_of_day_timestamps",
+    "free_time_place_ids",
+    "work_stay_durations_seconds",
+    "free_time_stay_durations_seconds",
+)
+# People start their day on the weekend somewhen in this timeframe (hours)
+WEEKEND_START_OF_DAY_FROM = 8
+WEEKEND_START_OF_DAY_TO = 18
+WORK_STAY_DURATION_HOURS = 8.0
+# The stay durations vary by up to this much from day to day
+MAX_WORK_STAY_DURATION_VARIATION_HOURS = 1.0
+MAX_EXTRA_FREE_TIME_STAY_DURATION_HOURS = 1.0
+
+
+class Schedule:
+    # All random decisions about every simulated day of every person: When they leave home, which of
+    # their favorite free time places they visit and how long they stay at work and there.
+    # People are referred to by their index in the list the schedule was generated for
+    def __init__(
+        self,
+        is_weekend,
+        start_of_day_timestamps,
+        free_time_place_ids,
+        work_stay_durations_seconds,
+        free_time_stay_durations_seconds,
+    ):
+        self.is_weekend = is_weekend
+        # Seconds since the epoch
+        self.start_of_day_timestamps = start_of_day_timestamps
+        # -1 if the person has no favorite free time places
+        self.free_time_place_ids = free_time_place_ids
+        self.work_stay_durations_seconds = work_stay_durations_seconds
+        self.free_time_stay_durations_seconds = free_time_stay_durations_seconds
+
+    @classmethod
+    def from_columns(cls, columns: dict):
+        # columns: As returned by get_columns, but any arrays work, e.g. memory-mapped ones
+        return cls(*(columns[column_name] for column_name in SCHEDULE_COLUMN_NAMES))
+
+    def get_columns(self) -> dict:
+        return {column_name: getattr(self, column_name) for column_name in SCHEDULE_COLUMN_NAMES}
+
+    def get_num_days(self) -> int:
+        return len(self.is_weekend)
+
+
+def _get_start_of_day_timestamps(start_date: datetime.date, num_days: int) -> np.ndarray:
+    # The timestamps of local midnight. They are derived from midday, so that they are only off
+    # for times before the switch on days where daylight saving time starts or ends
+    return np.array(
+        [
+            datetime.combine(start_date + timedelta(days=day_index), time(12)).timestamp()
+            - 12 * 3600
+            for day_index in range(num_days)
+        ],
+        dtype=np.float64,
+    )
+
+
+def generate_schedule(
+    people: list, start_date: datetime.date, num_days: int, seed: int = None
+) -> Schedule:
+    # Draws all random numbers for all people and days at once. With a seed, every number only
+    # depends on the seed, the person's id and the day, so any subset of the people gets the same
+    # schedule for them. Otherwise, the numbers are different on every run
+    person_ids = np.array([person.id for person in people], dtype=np.int64)
+    day_indexes = np.arange(num_days, dtype=np.int64)
+    if seed is None:
+        random_number_generator = np.random.default_rng()
+
+        def get_uniform_random_numbers(stream_name: str) -> np.ndarray:
+            return random_number_generator.random((len(person_ids), num_days))
+
+    else:
+
+        def get_uniform_random_numbers(stream_name: str) -> np.ndarray:
+            return get_random_numbers(seed, f"schedule:{stream_name}", person_ids, day_indexes)
+
+    # The places are looked up in the columns of the registry that all people share
+    if people:
+        place_columns = people[0].place_registry.get_columns()
+        start_times_from = np.asarray(place_columns["start_times_from"], dtype=np.float64)
+        start_times_to = np.asarray(place_columns["start_times_to"], dtype=np.float64)
+        typical_stay_durations_hours = np.asarray(
+            place_columns["typical_stay_durations_hours"], dtype=np.float64
+        )
+    else:
+        start_times_from = start_times_to = typical_stay_durations_hours = np.empty(0)
+    workplace_ids = np.array([person.workplace_id for person in people], dtype=np.int64)
+    free_time_place_offsets = np.zeros(len(people) + 1, dtype=np.int64)
+    free_time_place_offsets[1:] = np.cumsum(
+        [len(person.favorite_free_time_place_ids) for person in people], dtype=np.int64
+    )
+    free_time_place_ids = np.array(
+        [place_id for person in people for place_id in person.favorite_free_time_place_ids],
+        dtype=np.int64,
+    )
+
+    is_weekend = np.array(
+        [(start_date + timedelta(days=day_index)).weekday() >= 5 for day_index in range(num_days)],
+        dtype=bool,
+    )
+
+    # On weekdays, people start their day depending on their workplace. Any whole minute in the
+    # timeframe is equally likely, including its end
+    start_hours_from = start_times_from[workplace_ids]
+    start_hours_to = start_times_to[workplace_ids]
+    start_hours = np.where(
+        is_weekend[np.newaxis, :], WEEKEND_START_OF_DAY_FROM, start_hours_from[:, np.newaxis]
+    )
+    num_start_minutes = (
+        np.where(
+            is_weekend[np.newaxis, :],
+            WEEKEND_START_OF_DAY_TO - WEEKEND_START_OF_DAY_FROM,
+            (start_hours_to - start_hours_from)[:, np.newaxis],
+        )
+        * 60
+        + 1
+    )
+    start_minutes = np.floor(get_uniform_random_numbers("start_of_day") * num_start_minutes)
+    start_of_day_timestamps = (
+        _get_start_of_day_timestamps(start_date, num_days)[np.newaxis, :]
+        + start_hours * 3600
+        + start_minutes * 60
+    )
+
+    # One of their favorite free time places every day. Index -1 refers to the appended -1, which
+    # people without favorite free time places get
+    num_free_time_places = np.diff(free_time_place_offsets)[:, np.newaxis]
+    chosen_free_time_place_indexes = np.where(
+        num_free_time_places > 0,
+        free_time_place_offsets[:-1, np.newaxis]
+        + np.floor(get_uniform_random_numbers("free_time_place") * num_free_time_places).astype(
+            np.int64
+        ),
+        -1,
+    )
+    chosen_free_time_place_ids = np.append(free_time_place_ids, -1)[chosen_free_time_place_indexes]
+
+    work_stay_durations_hours = (
+        WORK_STAY_DURATION_HOURS
+        + MAX_WORK_STAY_DURATION_VARIATION_HOURS
+        * (2.0 * get_uniform_random_numbers("work_stay_duration") - 1.0)
+    )
+    # Without a free time place (-1), the stay duration is NaN
+    free_time_stay_durations_hours = np.append(typical_stay_durations_hours, np.nan)[
+        chosen_free_time_place_ids
+    ] + MAX_EXTRA_FREE_TIME_STAY_DURATION_HOURS * get_uniform_random_numbers(
+        "free_time_stay_duration"
+    )
+
+    return Schedule(
+        is_weekend,
+        start_of_day_timestamps,
+        chosen_free_time_place_ids,
+        work_stay_durations_hours * 3600,
+        free_time_stay_durations_hours * 3600,
+    )
@@ -0,0 +1,51 @@
+import random
+import hashlib
+import numpy as np
+
+# Increment of the SplitMix64 generator, 2^64 divided by the golden ratio
+GOLDEN_RATIO_64 = np.uint64(0x9E3779B97F4A7C15)
+
+
+def get_random_generator(seed: int, *keys) -> random.Random:
+    # An independent random stream for every combination of seed and keys, e.g. (seed, "daily_route",
+    # person id, day index). It doesn't depend on what else was drawn before or in which process,
+    # so any part of a run can be reproduced on its own
+    key = ":".join(str(part) for part in (seed, *keys))
+    return random.Random(int.from_bytes(hashlib.sha256(key.encode("utf-8")).digest()[:8], "big"))
+
+
+def get_shard_range(num_items: int, shard_index: int, num_shards: int) -> (int, int):
+    # Contiguous, almost equally large ranges [start, stop) that together cover all items
+    if not 0 <= shard_index < num_shards:
+        raise ValueError(f"Invalid shard {shard_index} of {num_shards}")
+    return (
+        num_items * shard_index // num_shards,
+        num_items * (shard_index + 1) // num_shards,
+    )
+
+
+def mix_bits(values: np.ndarray) -> np.ndarray:
+    # The finalizer of SplitMix64: Every input bit affects every output bit
+    values = values ^ (values >> np.uint64(30))
+    values = values * np.uint64(0xBF58476D1CE4E5B9)
+    values = values ^ (values >> np.uint64(27))
+    values = values * np.uint64(0x94D049BB133111EB)
+    return values ^ (values >> np.uint64(31))
+
+
+def get_random_numbers(seed: int, stream_name: str, person_ids, day_indexes) -> np.ndarray:
+    # Uniform random numbers in [0, 1) for every combination of person id (rows) and day index
+    # (columns). Each number is a hash of (seed, stream name, person id, day index) instead of the
+    # next output of a random state, so it doesn't depend on which other people or days are drawn
+    # at the same time, e.g. in another shard
+    key = np.uint64(get_random_generator(seed, stream_name).getrandbits(64))
+    person_ids = np.asarray(person_ids, dtype=np.uint64)
+    day_indexes = np.asarray(day_indexes, dtype=np.uint64)
+    # Integer overflows are intended, numpy wraps around just like the 64 bit arithmetic of SplitMix64
+    with np.errstate(over="ignore"):
+        person_keys = mix_bits(key ^ mix_bits(person_ids + GOLDEN_RATIO_64))
+        random_bits = mix_bits(
+            person_keys[:, np.newaxis] + (day_indexes + np.uint64(1)) * GOLDEN_RATIO_64
+        )
+    # The upper 53 bits fill the mantissa of a double, like random.random() does
+    return (random_bits >> np.uint64(11)).astype(np.float64) * (1.0 / (1 << 53))
@@ -0,0 +1,256 @@
+import json
+import numpy as np
+
+from array import array
+from pathlib import Path
+
+from ..models import Person, DailyRoute
+from ..lib.seeding import mix_bits
+from ..lib.varint import encode_varints, decode_varints, zigzag_encode, zigzag_decode
+from ..lib.columnar_store import (
+    META_FILE_NAME,
+    PEOPLE_FILE_NAME,
+    RouteStoreReader,
+    save_route_index,
+    convert_route_store_to_dataset,
+    merge_route_stores,
+)
+
+# Layout of a segment store directory. Daily routes share most of their way with other routes,
+# e.g. the way to work on every day or the streets around the homes of the people of a building.
+# Each piece of a way is only stored once, a route refers to the pieces it is made of:
+# - "meta.json", "people.jsonl", "index.npy": Like in a columnar route store, except that the index
+#   refers to byte ranges of "routes.bin"
+# - "segments.bin": The coordinates of all segments (pieces of ways) in the order of their ids, as
+#   varints of the zigzag encoded differences between each point and the one before it
+# - "segment_lengths.bin": Number of points of each segment, as varints
+# - "routes.bin": For each daily route, as varints: The number of its segments, the zigzag encoded
+#   differences between their ids, the first timestamp and the differences between the timestamps
+SEGMENT_STORE_FORMAT_VERSION = 1
+SEGMENTS_FILE_NAME = "segments.bin"
+SEGMENT_LENGTHS_FILE_NAME = "segment_lengths.bin"
+ROUTES_FILE_NAME = "routes.bin"
+# Coordinates are stored as multiples of 1e-7 degrees (about 1 cm), which keeps the 5 decimal places
+# of ORS geometries and the 7 decimal places of OSM coordinates exactly. Timestamps are stored as
+# whole milliseconds
+COORDINATE_SCALE = 10**7
+TIMESTAMP_SCALE = 1000
+# A route is cut into segments after every point whose hash is a multiple of this. The cuts only
+# depend on the points themselves, so two routes along the same way are cut at the same points
+# and share the segments in between, no matter where they start
+AVERAGE_SEGMENT_LENGTH = 16
+
+
+def _quantize_coordinates(latitudes, longitudes) -> np.ndarray:
+    # (number of points, 2) array with the integer latitude and longitude of each point
+    return np.rint(
+        np.column_stack(
+            (
+                np.asarray(latitudes, dtype=np.float64),
+                np.asarray(longitudes, dtype=np.float64),
+            )
+        )
+        * COORDINATE_SCALE
+    ).astype(np.int64)
+
+
+def _get_segment_starts(coordinates: np.ndarray) -> np.ndarray:
+    # Indexes of the first point of each segment of a route: Its first point and every point after
+    # a cut point
+    if len(coordinates) == 0:
+        return np.empty(0, dtype=np.int64)
+    with np.errstate(over="ignore"):
+        point_hashes = mix_bits(
+            mix_bits(coordinates[:, 0].astype(np.uint64)) ^ coordinates[:, 1].astype(np.uint64)
+        )
+    is_cut_point = point_hashes % np.uint64(AVERAGE_SEGMENT_LENGTH) == 0
+    return np.flatnonzero(np.concatenate(([True], is_cut_point[:-1])))
+
+
+def _get_point_indexes(starts: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    # The indexes of all points of consecutive ranges, e.g. starts (5, 0), lengths (2, 3) -> 5 6 0 1 2
+    range_offsets = np.cumsum(lengths) - lengths
+    return np.arange(lengths.sum()) - np.repeat(range_offsets - starts, lengths)
+
+
+class SegmentRouteWriter:
+    # Same interface as JsonLinesRouteWriter. New segments and routes are appended to their files
+    # while generating, the segment ids of all segments written so far are kept in memory
+    def __init__(self, directory_path: str):
+        self.directory_path = Path(directory_path)
+        self.directory_path.mkdir(parents=True, exist_ok=True)
+        self._people_file = open(self.directory_path / PEOPLE_FILE_NAME, "w")
+        self._segments_file = open(self.directory_path / SEGMENTS_FILE_NAME, "wb")
+        self._routes_file = open(self.directory_path / ROUTES_FILE_NAME, "wb")
+        # Coordinates of a segment as bytes -> its id
+        self._segment_ids = dict()
+        self._segment_lengths = array("q")
+        # The differences of the coordinates of a new segment start at the last point of the
+        # segment before it
+        self._last_segment_point = np.zeros(2, dtype=np.int64)
+        self._index_persons = array("q")
+        self._index_days = array("q")
+        self._index_starts = array("q")
+        self._num_route_bytes = 0
+        self._num_segment_points = 0
+        self._is_closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write_person(self, person: Person):
+        self.write_person_info(person.to_dict())
+
+    def write_person_info(self, person_info: dict):
+        # person_info: As returned by Person.to_dict
+        self._people_file.write(json.dumps(person_info))
+        self._people_file.write("\n")
+
+    def write_daily_route(self, person_id: int, day_index: int, daily_route: DailyRoute):
+        self.write_trajectory(
+            person_id,
+            day_index,
+            daily_route.get_latitudes(),
+            daily_route.get_longitudes(),
+            daily_route.get_timestamps(),
+        )
+
+    def _get_segment_ids(self, coordinates: np.ndarray) -> np.ndarray:
+        # Looks up the segments of a route and writes the ones that are new
+        segment_starts = _get_segment_starts(coordinates)
+        segment_stops = np.append(segment_starts[1:], len(coordinates))
+        segment_ids = np.empty(len(segment_starts), dtype=np.int64)
+        new_segment_coordinates = list()
+        for segment_position, (start, stop) in enumerate(zip(segment_starts, segment_stops)):
+            segment_coordinates = coordinates[start:stop]
+            segment_key = segment_coordinates.tobytes()
+            segment_id = self._segment_ids.get(segment_key)
+            if segment_id is None:
+                segment_id = len(self._segment_lengths)
+                self._segment_ids[segment_key] = segment_id
+                self._segment_lengths.append(stop - start)
+                new_segment_coordinates.append(segment_coordinates)
+            segment_ids[segment_position] = segment_id
+
+        if new_segment_coordinates:
+            new_coordinates = np.concatenate(new_segment_coordinates)
+            coordinate_differences = np.diff(
+                new_coordinates, axis=0, prepend=self._last_segment_point[np.newaxis, :]
+            )
+            self._segments_file.write(encode_varints(zigzag_encode(coordinate_differences.ravel())))
+            self._last_segment_point = new_coordinates[-1]
+            self._num_segment_points += len(new_coordinates)
+        return segment_ids
+
+    def write_trajectory(self, person_id: int, day_index: int, latitudes, longitudes, timestamps):
+        # The columns can be any sequences of floats
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        if np.isnan(timestamps).any():
+            raise ValueError("Daily routes without timestamps can't be stored in a segment store")
+        segment_ids = self._get_segment_ids(_quantize_coordinates(latitudes, longitudes))
+        integer_timestamps = np.rint(timestamps * TIMESTAMP_SCALE).astype(np.int64)
+        encoded_route = encode_varints(
+            np.concatenate(
+                (
+                    np.array([len(segment_ids)], dtype=np.uint64),
+                    zigzag_encode(np.diff(segment_ids, prepend=0)),
+                    zigzag_encode(np.diff(integer_timestamps, prepend=0)),
+                )
+            )
+        )
+        self._routes_file.write(encoded_route)
+
+        self._index_persons.append(person_id)
+        self._index_days.append(day_index)
+        self._index_starts.append(self._num_route_bytes)
+        self._num_route_bytes += len(encoded_route)
+
+    def close(self):
+        if self._is_closed:
+            return
+        self._is_closed = True
+        self._people_file.close()
+        self._segments_file.close()
+        self._routes_file.close()
+        with open(self.directory_path / SEGMENT_LENGTHS_FILE_NAME, "wb") as segment_lengths_file:
+            segment_lengths_file.write(
+                encode_varints(np.frombuffer(self._segment_lengths, np.int64))
+            )
+
+        save_route_index(
+            self.directory_path,
+            self._index_persons,
+            self._index_days,
+            self._index_starts,
+            self._num_route_bytes,
+        )
+
+        meta_info = {
+            "version": SEGMENT_STORE_FORMAT_VERSION,
+            "coordinate_scale": COORDINATE_SCALE,
+            "timestamp_scale": TIMESTAMP_SCALE,
+            "num_segments": len(self._segment_lengths),
+            "num_segment_points": self._num_segment_points,
+        }
+        with open(self.directory_path / META_FILE_NAME, "w") as meta_file:
+            json.dump(meta_info, meta_file)
+
+
+class SegmentRouteReader(RouteStoreReader):
+    # All segments are decoded at once when opening the store. They are much smaller than the
+    # routes, which are only decoded when they are read
+    def __init__(self, directory_path: str):
+        super().__init__(directory_path)
+        with open(self.directory_path / META_FILE_NAME, "r") as meta_file:
+            meta_info = json.load(meta_file)
+        if meta_info["version"] != SEGMENT_STORE_FORMAT_VERSION:
+            raise ValueError(f"Unsupported segment store version: {meta_info['version']}")
+        self._coordinate_scale = meta_info["coordinate_scale"]
+        self._timestamp_scale = meta_info["timestamp_scale"]
+
+        with open(self.directory_path / SEGMENTS_FILE_NAME, "rb") as segments_file:
+            coordinates = np.cumsum(
+                zigzag_decode(decode_varints(segments_file.read())).reshape(-1, 2), axis=0
+            )
+        self._latitudes = coordinates[:, 0] / self._coordinate_scale
+        self._longitudes = coordinates[:, 1] / self._coordinate_scale
+        with open(self.directory_path / SEGMENT_LENGTHS_FILE_NAME, "rb") as segment_lengths_file:
+            self._segment_lengths = decode_varints(segment_lengths_file.read()).astype(np.int64)
+        self._segment_starts = np.cumsum(self._segment_lengths) - self._segment_lengths
+
+        with open(self.directory_path / ROUTES_FILE_NAME, "rb") as routes_file:
+            self._routes = routes_file.read()
+
+    def _read_trajectory(self, index_entry) -> dict:
+        values = decode_varints(
+            memoryview(self._routes)[int(index_entry["start"]) : int(index_entry["stop"])]
+        )
+        # The number of segments, then the differences between the segment ids and the timestamps
+        num_segments = int(values[0])
+        differences = zigzag_decode(values[1:])
+        segment_ids = np.cumsum(differences[:num_segments])
+        point_indexes = _get_point_indexes(
+            self._segment_starts[segment_ids], self._segment_lengths[segment_ids]
+        )
+        integer_timestamps = np.cumsum(differences[num_segments:])
+        return {
+            "latitudes": self._latitudes[point_indexes],
+            "longitudes": self._longitudes[point_indexes],
+            "timestamps": integer_timestamps / self._timestamp_scale,
+        }
+
+
+def convert_segment_store_to_dataset(
+    directory_path: str, output_file_path: str, num_days: int = None
+):
+    convert_route_store_to_dataset(SegmentRouteReader(directory_path), output_file_path, num_days)
+
+
+def merge_segment_stores(directory_paths: list, output_directory_path: str):
+    # The segment ids differ between the stores, so all routes are encoded again
+    merge_route_stores(
+        SegmentRouteReader, SegmentRouteWriter, directory_paths, output_directory_path
+    )
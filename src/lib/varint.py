@@ -0,0 +1,53 @@
+import numpy as np
+
+# Variable-length integers (LEB128): 7 bits per byte, the highest bit is set on all bytes of a
+# value except the last one. Small values take a single byte
+MAX_BYTES_PER_VALUE = 10
+# The smallest value that needs 1, 2, 3, ... bytes
+_MIN_VALUES_BY_NUM_BYTES = np.array(
+    [0] + [1 << (7 * num_bytes) for num_bytes in range(1, MAX_BYTES_PER_VALUE)], dtype=np.uint64
+)
+
+
+def zigzag_encode(values: np.ndarray) -> np.ndarray:
+    # Maps signed to unsigned integers so that small negative values stay small: 0, -1, 1, -2 ...
+    values = np.asarray(values, dtype=np.int64)
+    return ((values << 1) ^ (values >> 63)).astype(np.uint64)
+
+
+def zigzag_decode(values: np.ndarray) -> np.ndarray:
+    values = np.asarray(values, dtype=np.uint64)
+    return (values >> np.uint64(1)).astype(np.int64) ^ -(values & np.uint64(1)).astype(np.int64)
+
+
+def encode_varints(values: np.ndarray) -> bytes:
+    # Encodes all (unsigned) values at once
+    values = np.asarray(values, dtype=np.uint64)
+    num_bytes = np.searchsorted(_MIN_VALUES_BY_NUM_BYTES, values, side="right")
+    last_byte_positions = np.cumsum(num_bytes) - 1
+    byte_indexes = np.arange(num_bytes.sum()) - np.repeat(
+        last_byte_positions - num_bytes + 1, num_bytes
+    )
+    encoded_bytes = (
+        np.repeat(values, num_bytes) >> (np.uint64(7) * byte_indexes.astype(np.uint64))
+    ) & np.uint64(0x7F)
+    # Every byte but the last one of a value has the continuation bit
+    encoded_bytes |= np.uint64(0x80)
+    encoded_bytes[last_byte_positions] &= np.uint64(0x7F)
+    return encoded_bytes.astype(np.uint8).tobytes()
+
+
+def decode_varints(encoded_bytes) -> np.ndarray:
+    # Decodes all values at once, encoded_bytes can be anything with the buffer protocol
+    chunks = np.frombuffer(encoded_bytes, dtype=np.uint8).astype(np.uint64)
+    if len(chunks) > 0 and chunks[-1] >= 0x80:
+        raise ValueError("Invalid varints: The last value is incomplete")
+    last_byte_indexes = np.flatnonzero(chunks < 0x80)
+    if len(last_byte_indexes) == 0:
+        return np.empty(0, dtype=np.uint64)
+    first_byte_indexes = np.concatenate(([0], last_byte_indexes[:-1] + 1))
+    byte_shifts = np.uint64(7) * (
+        np.arange(len(chunks))
+        - np.repeat(first_byte_indexes, last_byte_indexes - first_byte_indexes + 1)
+    ).astype(np.uint64)
+    return np.bitwise_or.reduceat((chunks & np.uint64(0x7F)) << byte_shifts, first_byte_indexes)
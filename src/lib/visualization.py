@@ -0,0 +1,386 @@
+import json
+import math
+import ijson
+import argparse
+import numpy as np
+
+from pathlib import Path
+from datetime import datetime
+
+from ..lib.output import RECORD_TYPE_DAILY_ROUTE
+from ..lib.columnar_store import ColumnarRouteReader
+from ..lib.segment_store import SegmentRouteReader, SEGMENTS_FILE_NAME
+
+# Maps of many routes are exported as one small GeoJSON file per zoom level instead of one marker
+# per waypoint, so that they load quickly in any web map (e.g. Leaflet) or GIS:
+# - "routes_z<zoom>.geojson": One LineString per daily route, simplified so that it differs from
+#   the full route by at most SIMPLIFICATION_TOLERANCE_PIXELS at that zoom level
+# - "heatmap_z<zoom>.geojson": The centers of the grid cells of HEATMAP_CELL_SIZE_PIXELS at that
+#   zoom level that daily routes pass through, one MultiPoint per number of daily routes ("count")
+# Pixels are the ones of the usual Web Mercator tiles of TILE_SIZE_PIXELS
+TILE_SIZE_PIXELS = 256
+MAX_MERCATOR_LATITUDE = 85.0511287798
+DEFAULT_ZOOM_LEVELS = (10, 13, 16)
+SIMPLIFICATION_TOLERANCE_PIXELS = 1.0
+HEATMAP_CELL_SIZE_PIXELS = 16
+# The cells of the daily routes are counted together once there are this many of them per zoom level
+HEATMAP_MERGE_BUFFER_SIZE = 1_000_000
+ROUTES_FILE_NAME_TEMPLATE = "routes_z{zoom}.geojson"
+HEATMAP_FILE_NAME_TEMPLATE = "heatmap_z{zoom}.geojson"
+
+
+def project_to_pixels(latitudes, longitudes, zoom: int) -> (np.ndarray, np.ndarray):
+    # Web Mercator, the origin is the top left corner of the map
+    map_size_pixels = TILE_SIZE_PIXELS * 2**zoom
+    latitudes_rad = np.radians(
+        np.clip(
+            np.asarray(latitudes, dtype=np.float64), -MAX_MERCATOR_LATITUDE, MAX_MERCATOR_LATITUDE
+        )
+    )
+    xs = (np.asarray(longitudes, dtype=np.float64) + 180.0) / 360.0 * map_size_pixels
+    ys = (1.0 - np.arcsinh(np.tan(latitudes_rad)) / np.pi) / 2.0 * map_size_pixels
+    return xs, ys
+
+
+def unproject_pixels(xs, ys, zoom: int) -> (np.ndarray, np.ndarray):
+    map_size_pixels = TILE_SIZE_PIXELS * 2**zoom
+    longitudes = np.asarray(xs, dtype=np.float64) / map_size_pixels * 360.0 - 180.0
+    latitudes = np.degrees(
+        np.arctan(np.sinh(np.pi * (1.0 - 2.0 * np.asarray(ys, dtype=np.float64) / map_size_pixels)))
+    )
+    return latitudes, longitudes
+
+
+def get_coordinate_decimals(zoom: int) -> int:
+    # Enough decimal places for the coordinates to be off by less than half a pixel
+    half_pixel_degrees = 360.0 / (TILE_SIZE_PIXELS * 2**zoom) / 2.0
+    return min(7, math.ceil(-math.log10(half_pixel_degrees)))
+
+
+def simplify_douglas_peucker(xs: np.ndarray, ys: np.ndarray, tolerance: float) -> np.ndarray:
+    # Which points to keep, so that the line through them is at most tolerance away from all other
+    # points. The first and the last point are always kept. Instead of recursing into one part of
+    # the line after the other, all parts are split at once, which takes as many steps as the
+    # recursion is deep
+    num_points = len(xs)
+    is_kept = np.zeros(num_points, dtype=bool)
+    is_kept[[0, -1] if num_points > 0 else []] = True
+    point_indexes = np.arange(num_points)
+    while True:
+        kept_indexes = np.flatnonzero(is_kept)
+        # The kept points before and after each point. Kept points are their own part
+        part_indexes = np.searchsorted(kept_indexes, point_indexes, side="right") - 1
+        firsts = kept_indexes[part_indexes]
+        lasts = kept_indexes[np.minimum(part_indexes + 1, len(kept_indexes) - 1)]
+        offset_xs = xs - xs[firsts]
+        offset_ys = ys - ys[firsts]
+        delta_xs = xs[lasts] - xs[firsts]
+        delta_ys = ys[lasts] - ys[firsts]
+        lengths = np.hypot(delta_xs, delta_ys)
+        # Parts where the route comes back to where it started are measured from their first point
+        distances = np.where(
+            lengths > 0,
+            np.abs(delta_xs * offset_ys - delta_ys * offset_xs) / np.where(lengths > 0, lengths, 1),
+            np.hypot(offset_xs, offset_ys),
+        )
+        distances[is_kept] = 0.0
+        max_distances = np.maximum.reduceat(distances, kept_indexes)
+        is_farthest = (distances == max_distances[part_indexes]) & (distances > tolerance)
+        if not is_farthest.any():
+            return is_kept
+        # Only the first farthest point of each part
+        farthest_indexes = np.flatnonzero(is_farthest)
+        is_kept[farthest_indexes[np.diff(part_indexes[farthest_indexes], prepend=-1) != 0]] = True
+
+
+def _densify(xs: np.ndarray, ys: np.ndarray, max_step: float) -> (np.ndarray, np.ndarray):
+    # Adds points between neighboring points that are further apart than max_step, so that a line
+    # doesn't skip any grid cells of at least twice that size
+    if len(xs) < 2:
+        return xs, ys
+    num_steps = np.maximum(1, np.ceil(np.hypot(np.diff(xs), np.diff(ys)) / max_step)).astype(
+        np.int64
+    )
+    segment_indexes = np.repeat(np.arange(len(num_steps)), num_steps)
+    fractions = (
+        np.arange(num_steps.sum()) - np.repeat(np.cumsum(num_steps) - num_steps, num_steps)
+    ) / np.repeat(num_steps, num_steps)
+    return (
+        np.append(xs[segment_indexes] + fractions * np.diff(xs)[segment_indexes], xs[-1]),
+        np.append(ys[segment_indexes] + fractions * np.diff(ys)[segment_indexes], ys[-1]),
+    )
+
+
+def _to_json_timestamp(timestamp: float):
+    return None if math.isnan(timestamp) else int(round(timestamp))
+
+
+class VisualizationExporter:
+    # Same interface as the route writers for daily routes. The routes are simplified and written
+    # to the files of all zoom levels as they come, the heatmaps are written at the end
+    def __init__(
+        self,
+        directory_path: str,
+        zoom_levels=DEFAULT_ZOOM_LEVELS,
+        from_timestamp: float = None,
+        to_timestamp: float = None,
+    ):
+        # Only the parts of the routes between from_timestamp and to_timestamp are exported
+        self.directory_path = Path(directory_path)
+        self.directory_path.mkdir(parents=True, exist_ok=True)
+        self.zoom_levels = sorted(zoom_levels)
+        self.from_timestamp = from_timestamp
+        self.to_timestamp = to_timestamp
+        self._routes_files = dict()
+        self._num_written_routes = {zoom: 0 for zoom in self.zoom_levels}
+        self.num_routes = 0
+        # Zoom level -> the cells that daily routes pass through so far and how many of them do.
+        # The cells of the latest daily routes are buffered until they are merged into these
+        self._heatmap_cells = {zoom: np.empty(0, dtype=np.int64) for zoom in self.zoom_levels}
+        self._heatmap_counts = {zoom: np.empty(0, dtype=np.int64) for zoom in self.zoom_levels}
+        self._buffered_heatmap_cells = {zoom: list() for zoom in self.zoom_levels}
+        self._num_buffered_heatmap_cells = {zoom: 0 for zoom in self.zoom_levels}
+        for zoom in self.zoom_levels:
+            routes_file = open(
+                self.directory_path / ROUTES_FILE_NAME_TEMPLATE.format(zoom=zoom), "w"
+            )
+            routes_file.write('{"type":"FeatureCollection","features":[')
+            self._routes_files[zoom] = routes_file
+        self._is_closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _filter_by_time(self, latitudes, longitudes, timestamps) -> tuple:
+        latitudes = np.asarray(latitudes, dtype=np.float64)
+        longitudes = np.asarray(longitudes, dtype=np.float64)
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        is_in_timeframe = np.ones(len(timestamps), dtype=bool)
+        # NaN (unknown) timestamps are never in a timeframe
+        if self.from_timestamp is not None:
+            is_in_timeframe &= timestamps >= self.from_timestamp
+        if self.to_timestamp is not None:
+            is_in_timeframe &= timestamps <= self.to_timestamp
+        return latitudes[is_in_timeframe], longitudes[is_in_timeframe], timestamps[is_in_timeframe]
+
+    def add_trajectory(self, person_id: int, day_index: int, latitudes, longitudes, timestamps):
+        latitudes, longitudes, timestamps = self._filter_by_time(latitudes, longitudes, timestamps)
+        if len(latitudes) == 0:
+            return
+        properties = {
+            "person": person_id,
+            "day": day_index,
+            "start": _to_json_timestamp(timestamps[0]),
+            "end": _to_json_timestamp(timestamps[-1]),
+        }
+        for zoom in self.zoom_levels:
+            xs, ys = project_to_pixels(latitudes, longitudes, zoom)
+            if len(xs) >= 2:
+                self._write_route(zoom, xs, ys, properties)
+            dense_xs, dense_ys = _densify(xs, ys, HEATMAP_CELL_SIZE_PIXELS / 2)
+            route_cells = np.unique(self._get_cells(zoom, dense_xs, dense_ys))
+            self._buffered_heatmap_cells[zoom].append(route_cells)
+            self._num_buffered_heatmap_cells[zoom] += len(route_cells)
+            if self._num_buffered_heatmap_cells[zoom] >= HEATMAP_MERGE_BUFFER_SIZE:
+                self._merge_heatmap_cells(zoom)
+        self.num_routes += 1
+
+    def _write_route(self, zoom: int, xs: np.ndarray, ys: np.ndarray, properties: dict):
+        is_kept = simplify_douglas_peucker(xs, ys, SIMPLIFICATION_TOLERANCE_PIXELS)
+        latitudes, longitudes = unproject_pixels(xs[is_kept], ys[is_kept], zoom)
+        coordinates = np.round(
+            np.column_stack((longitudes, latitudes)), get_coordinate_decimals(zoom)
+        ).tolist()
+        feature = {
+            "type": "Feature",
+            "geometry": {"type": "LineString", "coordinates": coordinates},
+            "properties": properties,
+        }
+        routes_file = self._routes_files[zoom]
+        if self._num_written_routes[zoom] > 0:
+            routes_file.write(",")
+        routes_file.write(json.dumps(feature, separators=(",", ":")))
+        self._num_written_routes[zoom] += 1
+
+    def _get_num_cells_per_row(self, zoom: int) -> int:
+        return math.ceil(TILE_SIZE_PIXELS * 2**zoom / HEATMAP_CELL_SIZE_PIXELS)
+
+    def _get_cells(self, zoom: int, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+        # One number per cell: row * number of cells per row + column
+        num_cells_per_row = self._get_num_cells_per_row(zoom)
+        # The right edge of the map (180°) belongs to the last column
+        columns = np.minimum(
+            np.floor(xs / HEATMAP_CELL_SIZE_PIXELS).astype(np.int64), num_cells_per_row - 1
+        )
+        rows = np.floor(ys / HEATMAP_CELL_SIZE_PIXELS).astype(np.int64)
+        return rows * num_cells_per_row + columns
+
+    def _merge_heatmap_cells(self, zoom: int):
+        buffered_cells = self._buffered_heatmap_cells[zoom]
+        if not buffered_cells:
+            return
+        merged_cells = self._heatmap_cells[zoom]
+        cells, cell_indexes = np.unique(
+            np.concatenate([merged_cells] + buffered_cells), return_inverse=True
+        )
+        # Each buffered cell adds one daily route to the count of its cell
+        counts = np.bincount(cell_indexes[len(merged_cells) :], minlength=len(cells))
+        counts[cell_indexes[: len(merged_cells)]] += self._heatmap_counts[zoom]
+        self._heatmap_cells[zoom] = cells
+        self._heatmap_counts[zoom] = counts
+        self._buffered_heatmap_cells[zoom] = list()
+        self._num_buffered_heatmap_cells[zoom] = 0
+
+    def _write_heatmap(self, zoom: int):
+        self._merge_heatmap_cells(zoom)
+        cells = self._heatmap_cells[zoom]
+        counts = self._heatmap_counts[zoom]
+        rows, columns = np.divmod(cells, self._get_num_cells_per_row(zoom))
+        latitudes, longitudes = unproject_pixels(
+            (columns + 0.5) * HEATMAP_CELL_SIZE_PIXELS,
+            (rows + 0.5) * HEATMAP_CELL_SIZE_PIXELS,
+            zoom,
+        )
+        coordinates = np.round(
+            np.column_stack((longitudes, latitudes)), get_coordinate_decimals(zoom)
+        )
+        # All cells with the same count are one MultiPoint, which is much smaller than one Point
+        # feature per cell
+        order = np.argsort(counts, kind="stable")
+        distinct_counts, first_positions = np.unique(counts[order], return_index=True)
+        features = [
+            {
+                "type": "Feature",
+                "geometry": {"type": "MultiPoint", "coordinates": cell_coordinates.tolist()},
+                "properties": {"count": count},
+            }
+            for count, cell_coordinates in zip(
+                distinct_counts.tolist(), np.split(coordinates[order], first_positions[1:])
+            )
+        ]
+        with open(
+            self.directory_path / HEATMAP_FILE_NAME_TEMPLATE.format(zoom=zoom), "w"
+        ) as out_file:
+            json.dump(
+                {"type": "FeatureCollection", "features": features},
+                out_file,
+                separators=(",", ":"),
+            )
+
+    def close(self):
+        if self._is_closed:
+            return
+        self._is_closed = True
+        for routes_file in self._routes_files.values():
+            routes_file.write("]}")
+            routes_file.close()
+        for zoom in self.zoom_levels:
+            self._write_heatmap(zoom)
+
+
+def iter_generated_trajectories(route_path: str):
+    # Yields (person id, day index, latitudes, longitudes, timestamps) of all daily routes in the
+    # output of the route generator, in any output format or as the converted single JSON file
+    route_path = Path(route_path)
+    if route_path.is_dir():
+        if (route_path / SEGMENTS_FILE_NAME).exists():
+            route_reader = SegmentRouteReader(route_path)
+        else:
+            route_reader = ColumnarRouteReader(route_path)
+        for person_id, day_index, trajectory in route_reader.iter_trajectories():
+            yield (
+                person_id,
+                day_index,
+                trajectory["latitudes"],
+                trajectory["longitudes"],
+                trajectory["timestamps"],
+            )
+    elif route_path.suffix == ".jsonl":
+        with open(route_path, "r") as json_lines_file:
+            for line in json_lines_file:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if record["type"] == RECORD_TYPE_DAILY_ROUTE:
+                    yield _get_trajectory_of_record(record, record["day"])
+    else:
+        # Only one day of daily routes is in memory at a time
+        with open(route_path, "rb") as dataset_file:
+            for day_index, daily_routes in enumerate(
+                ijson.items(dataset_file, "daily_routes.item", use_float=True)
+            ):
+                for daily_route_info in daily_routes:
+                    yield _get_trajectory_of_record(daily_route_info, day_index)
+
+
+def _get_trajectory_of_record(daily_route_info: dict, day_index: int) -> tuple:
+    # daily_route_info: As returned by DailyRoute.to_dict, with the id of the person
+    coordinates = np.array(daily_route_info["coords"], dtype=np.float64).reshape(-1, 2)
+    return (
+        daily_route_info["person"],
+        day_index,
+        coordinates[:, 0],
+        coordinates[:, 1],
+        np.array(daily_route_info["times"], dtype=np.float64),
+    )
+
+
+def export_visualization(
+    route_path: str,
+    directory_path: str,
+    zoom_levels=DEFAULT_ZOOM_LEVELS,
+    from_timestamp: float = None,
+    to_timestamp: float = None,
+) -> int:
+    # Returns the number of daily routes that were exported
+    with VisualizationExporter(
+        directory_path, zoom_levels, from_timestamp, to_timestamp
+    ) as visualization_exporter:
+        for trajectory in iter_generated_trajectories(route_path):
+            visualization_exporter.add_trajectory(*trajectory)
+        return visualization_exporter.num_routes
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Export generated daily routes as simplified GeoJSON routes and heatmaps "
+        "per zoom level"
+    )
+    parser.add_argument(
+        "routes",
+        help="Output of the route generator: A .jsonl file, a route store directory "
+        "or the converted JSON file",
+    )
+    parser.add_argument("output_directory")
+    parser.add_argument("--zoom-levels", type=int, nargs="+", default=list(DEFAULT_ZOOM_LEVELS))
+    parser.add_argument(
+        "--from",
+        dest="from_time",
+        type=datetime.fromisoformat,
+        default=None,
+        help="Only export the parts of the routes from this (local) time on, e.g. 2023-05-02T07:00",
+    )
+    parser.add_argument(
+        "--to",
+        dest="to_time",
+        type=datetime.fromisoformat,
+        default=None,
+        help="Only export the parts of the routes up to this (local) time",
+    )
+    args = parser.parse_args()
+
+    num_routes = export_visualization(
+        args.routes,
+        args.output_directory,
+        args.zoom_levels,
+        args.from_time.timestamp() if args.from_time else None,
+        args.to_time.timestamp() if args.to_time else None,
+    )
+    print(f"Exported {num_routes} daily routes to '{args.output_directory}'.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+import os
+import shutil
+import tempfile
+import numpy as np
+
+from pathlib import Path
+from contextlib import contextmanager
+from collections import OrderedDict
+
+from ..models import Person, Position, PlaceRegistry
+from ..models.place_registry import PLACE_COLUMN_NAMES
+from ..lib.schedule import SCHEDULE_COLUMN_NAMES, Schedule
+
+# Layout of a world state directory, one .npy file per column:
+# - "people_ids", "people_home_latitudes", "people_home_longitudes", "people_workplace_ids"
+# - "people_free_time_place_offsets", "people_free_time_place_ids": The favorite free time places
+#   of person i are people_free_time_place_ids[offsets[i]:offsets[i + 1]]
+# - "places_<column>": The columns of the place registry. Text columns are split into
+#   "places_<column>_bytes" (all UTF-8 strings after each other) and "places_<column>_offsets"
+# - "schedule_<column>": The columns of the schedule of the people, if there is one
+PLACE_TEXT_COLUMN_NAMES = ("category_names", "names")
+# Memory-mapped files in here are backed by RAM, so they effectively are shared memory
+SHARED_MEMORY_DIRECTORY = "/dev/shm"
+# Workers get the days of one person after each other (a chunk can end in the middle of the next
+# person), so only the last few people are kept together with their route templates
+MAX_CACHED_PEOPLE = 2
+
+
+class _TextColumn:
+    # A read-only sequence of strings that are only decoded when accessed
+    def __init__(self, text_bytes, offsets):
+        self._text_bytes = text_bytes
+        self._offsets = offsets
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, index: int) -> str:
+        return bytes(self._text_bytes[self._offsets[index] : self._offsets[index + 1]]).decode(
+            "utf-8"
+        )
+
+
+def write_world_state(directory_path: str, people: list, schedule: Schedule = None):
+    # All people have to share the same place registry
+    place_registry = people[0].place_registry if people else PlaceRegistry()
+    if any(person.place_registry is not place_registry for person in people):
+        raise ValueError("All people must refer to the same place registry")
+
+    free_time_place_offsets = np.zeros(len(people) + 1, dtype=np.int64)
+    free_time_place_offsets[1:] = np.cumsum(
+        [len(person.favorite_free_time_place_ids) for person in people], dtype=np.int64
+    )
+    columns = {
+        "people_ids": np.array([person.id for person in people], dtype=np.int64),
+        "people_home_latitudes": np.array(
+            [person.home_location.lat for person in people], dtype=np.float64
+        ),
+        "people_home_longitudes": np.array(
+            [person.home_location.lon for person in people], dtype=np.float64
+        ),
+        "people_workplace_ids": np.array(
+            [person.workplace_id for person in people], dtype=np.int64
+        ),
+        "people_free_time_place_offsets": free_time_place_offsets,
+        "people_free_time_place_ids": np.array(
+            [place_id for person in people for place_id in person.favorite_free_time_place_ids],
+            dtype=np.int64,
+        ),
+    }
+    for column_name, column in place_registry.get_columns().items():
+        if column_name in PLACE_TEXT_COLUMN_NAMES:
+            encoded_texts = [text.encode("utf-8") for text in column]
+            text_offsets = np.zeros(len(encoded_texts) + 1, dtype=np.int64)
+            text_offsets[1:] = np.cumsum([len(text) for text in encoded_texts], dtype=np.int64)
+            columns[f"places_{column_name}_bytes"] = np.frombuffer(
+                b"".join(encoded_texts), dtype=np.uint8
+            )
+            columns[f"places_{column_name}_offsets"] = text_offsets
+        else:
+            columns[f"places_{column_name}"] = np.asarray(column)
+    if schedule is not None:
+        for column_name, column in schedule.get_columns().items():
+            columns[f"schedule_{column_name}"] = np.asarray(column)
+
+    directory_path = Path(directory_path)
+    directory_path.mkdir(parents=True, exist_ok=True)
+    for column_name, column in columns.items():
+        np.save(directory_path / f"{column_name}.npy", column)
+
+
+@contextmanager
+def temporary_world_state(people: list, schedule: Schedule = None):
+    # Writes the world state to a temporary directory that is removed afterwards
+    parent_directory = SHARED_MEMORY_DIRECTORY if os.path.isdir(SHARED_MEMORY_DIRECTORY) else None
+    directory_path = tempfile.mkdtemp(prefix="world_state_", dir=parent_directory)
+    try:
+        write_world_state(directory_path, people, schedule)
+        yield directory_path
+    finally:
+        shutil.rmtree(directory_path, ignore_errors=True)
+
+
+class WorldState:
+    # Read-only view of a world state directory. The columns are memory-mapped, so all processes
+    # that open the same directory share one copy of them. People are created when they are needed
+    def __init__(self, directory_path: str):
+        self.directory_path = Path(directory_path)
+        self._people_ids = self._load_column("people_ids")
+        self._home_latitudes = self._load_column("people_home_latitudes")
+        self._home_longitudes = self._load_column("people_home_longitudes")
+        self._workplace_ids = self._load_column("people_workplace_ids")
+        self._free_time_place_offsets = self._load_column("people_free_time_place_offsets")
+        self._free_time_place_ids = self._load_column("people_free_time_place_ids")
+
+        place_columns = dict()
+        for column_name in PLACE_COLUMN_NAMES:
+            if column_name in PLACE_TEXT_COLUMN_NAMES:
+                place_columns[column_name] = _TextColumn(
+                    self._load_column(f"places_{column_name}_bytes"),
+                    self._load_column(f"places_{column_name}_offsets"),
+                )
+            else:
+                place_columns[column_name] = self._load_column(f"places_{column_name}")
+        self.place_registry = PlaceRegistry.from_columns(place_columns)
+
+        self.schedule = None
+        if (self.directory_path / f"schedule_{SCHEDULE_COLUMN_NAMES[0]}.npy").exists():
+            self.schedule = Schedule.from_columns(
+                {
+                    column_name: self._load_column(f"schedule_{column_name}")
+                    for column_name in SCHEDULE_COLUMN_NAMES
+                }
+            )
+
+        # Person index -> Person, the most recently used one last
+        self._people = OrderedDict()
+
+    def _load_column(self, column_name: str) -> memoryview:
+        # Indexing a memoryview returns plain Python numbers instead of numpy scalars
+        file_path = self.directory_path / f"{column_name}.npy"
+        try:
+            column = np.load(file_path, mmap_mode="r")
+        except ValueError:
+            # Empty arrays can't be memory-mapped
+            column = np.load(file_path)
+        return memoryview(column)
+
+    def __len__(self):
+        return len(self._people_ids)
+
+    def get_person(self, person_index: int) -> Person:
+        # The same object is returned as long as the person is one of the last MAX_CACHED_PEOPLE,
+        # so that its route templates can be reused. Older people and their route templates are
+        # dropped, so the memory of a worker doesn't grow with the population
+        person = self._people.get(person_index)
+        if person is not None:
+            self._people.move_to_end(person_index)
+        else:
+            first_offset = self._free_time_place_offsets[person_index]
+            last_offset = self._free_time_place_offsets[person_index + 1]
+            person = Person(
+                self._people_ids[person_index],
+                Position(self._home_latitudes[person_index], self._home_longitudes[person_index]),
+                self._workplace_ids[person_index],
+                list(self._free_time_place_ids[first_offset:last_offset]),
+                self.place_registry,
+            )
+            self._people[person_index] = person
+            if len(self._people) > MAX_CACHED_PEOPLE:
+                self._people.popitem(last=False)
+        return person
@@ -1,4 +1,6 @@
 from .person import Person
 from .place import Place, Workplace, FreeTimePlace
+from .place_registry import PlaceRegistry
 from .position import Position
 from .route import DailyRoute
+from .route_template import RouteTemplate
@@ -1,6 +1,8 @@
 from .place import Workplace
+from .place_registry import PlaceRegistry
 from .position import Position
 from .route import DailyRoute
+from .route_template import RouteTemplate
 
 
 class Person:
@@ -8,15 +10,37 @@ class Person:
         self,
         p_id: int,
         home_location: Position,
-        workplace: Workplace,
-        favorite_free_time_places: list,
+        workplace_id: int,
+        favorite_free_time_place_ids: list,
+        place_registry: PlaceRegistry,
     ):
         self.id = p_id
         self.home_location = home_location
-        self.workplace = workplace
-        self.favorite_free_time_places = favorite_free_time_places
+        # The places are only referred to by their ids in the registry, which all people share
+        self.workplace_id = workplace_id
+        self.favorite_free_time_place_ids = favorite_free_time_place_ids
+        self.place_registry = place_registry
 
         self._past_routes = list()
+        # Route templates by the coordinates of the chain of routes, see RouteTemplate
+        self._route_templates = dict()
+
+    def __getstate__(self):
+        # The route templates are only needed by the process that generates the routes of this person
+        state = self.__dict__.copy()
+        state["_route_templates"] = dict()
+        return state
+
+    @property
+    def workplace(self) -> Workplace:
+        return self.place_registry.get_workplace(self.workplace_id)
+
+    @property
+    def favorite_free_time_places(self) -> list:
+        return [
+            self.place_registry.get_free_time_place(place_id)
+            for place_id in self.favorite_free_time_place_ids
+        ]
 
     def add_route(self, route: DailyRoute):
         self._past_routes.append(route)
@@ -24,6 +48,22 @@ class Person:
     def get_all_routes(self) -> list:
         return self._past_routes
 
+    def get_route_template(self, coords: list) -> RouteTemplate:
+        return self._route_templates.get(tuple(coords))
+
+    def set_route_template(self, coords: list, route_template: RouteTemplate):
+        self._route_templates[tuple(coords)] = route_template
+
+    def to_dict(self) -> dict:
+        person_info = dict()
+        person_info["id"] = self.id
+        person_info["home_location"] = [self.home_location.lat, self.home_location.lon]
+        person_info["workplace"] = [self.workplace.latitude, self.workplace.longitude]
+        person_info["free_time_places"] = [
+            [place.latitude, place.longitude] for place in self.favorite_free_time_places
+        ]
+        return person_info
+
     def get_all_routes_as_dicts(self) -> list:
         all_daily_routes = list()
         for daily_route in self._past_routes:
@@ -6,7 +6,10 @@ class Place:
         name: str,
         latitude: float,
         longitude: float,
+        place_id: int = None,
     ):
+        # Set for places from a PlaceRegistry
+        self.place_id = place_id
         self.category_id = category_id
         self.category_name = category_name
         self.name = name
@@ -20,6 +23,9 @@ class Place:
         return f"(Category ID: {self.category_id}; Category Name: {self.category_name}; Name: {self.name}; Latitude: {self.latitude}; Longitude: {self.longitude}"
 
     def __eq__(self, other_place):
+        if self.place_id is not None and other_place.place_id is not None:
+            # The workplace and the free time place of the same POI are equal as well
+            return self.place_id == other_place.place_id
         return (
             self.category_id == other_place.category_id
             and self.category_name == other_place.category_name
@@ -28,6 +34,13 @@ class Place:
             and self.longitude == other_place.longitude
         )
 
+    def __hash__(self):
+        if self.place_id is not None:
+            return hash(self.place_id)
+        return hash(
+            (self.category_id, self.category_name, self.name, self.latitude, self.longitude)
+        )
+
 
 class Workplace(Place):
     def __init__(
@@ -38,6 +51,7 @@ class Workplace(Place):
         latitude: float,
         longitude: float,
         work_info: dict,
+        place_id: int = None,
     ):
         super().__init__(
             category_id,
@@ -45,6 +59,7 @@ class Workplace(Place):
             name,
             latitude,
             longitude,
+            place_id,
         )
         self.max_workers = work_info["MaxWorkers"]
         self.start_time_from = work_info["StartTimeFrom"]
@@ -64,6 +79,7 @@ class FreeTimePlace(Place):
         latitude: float,
         longitude: float,
         free_time_activity_info: dict,
+        place_id: int = None,
     ):
         super().__init__(
             category_id,
@@ -71,6 +87,7 @@ class FreeTimePlace(Place):
             name,
             latitude,
             longitude,
+            place_id,
         )
         self.typical_stay_duration_hours = free_time_activity_info["TypicalStayDurationHours"]
 
@@ -0,0 +1,188 @@
+from math import nan, isnan
+from array import array
+
+from .place import Workplace, FreeTimePlace
+
+# All information about the places, as stored by get_columns
+PLACE_COLUMN_NAMES = (
+    "category_ids",
+    "category_names",
+    "names",
+    "latitudes",
+    "longitudes",
+    "max_workers",
+    "start_times_from",
+    "start_times_to",
+    "current_people",
+    "typical_stay_durations_hours",
+)
+
+
+class PlaceRegistry:
+    # Every point of interest is stored once and gets a stable integer id, the order in which it
+    # was added. A POI can be a workplace, a free time place or both, and the Workplace and
+    # FreeTimePlace objects of one POI share its id. People only keep these ids
+    def __init__(self):
+        self._place_ids_by_key = dict()
+        self._category_ids = array("q")
+        self._category_names = list()
+        self._names = list()
+        self._latitudes = array("d")
+        self._longitudes = array("d")
+        # -1 max. workers means it's not a workplace, NaN stay duration means it's no free time place
+        self._max_workers = array("q")
+        self._start_times_from = array("d")
+        self._start_times_to = array("d")
+        self._current_people = array("q")
+        self._typical_stay_durations_hours = array("d")
+
+        # Workplace and FreeTimePlace objects by place id, only created when they are asked for
+        self._workplaces = dict()
+        self._free_time_places = dict()
+
+    def __getstate__(self):
+        # Only the arrays are sent to other processes, the objects are recreated there if needed
+        self._store_current_people()
+        state = self.__dict__.copy()
+        state["_workplaces"] = dict()
+        state["_free_time_places"] = dict()
+        # Places are added before people are generated, other processes only look them up
+        state["_place_ids_by_key"] = None
+        return state
+
+    @classmethod
+    def from_columns(cls, columns: dict):
+        # columns: As returned by get_columns, but any sequences work, e.g. memory-mapped ones
+        place_registry = cls()
+        for column_name in PLACE_COLUMN_NAMES:
+            setattr(place_registry, f"_{column_name}", columns[column_name])
+        place_registry._place_ids_by_key = None
+        return place_registry
+
+    def get_columns(self) -> dict:
+        self._store_current_people()
+        return {column_name: getattr(self, f"_{column_name}") for column_name in PLACE_COLUMN_NAMES}
+
+    def __len__(self):
+        return len(self._latitudes)
+
+    def add_place(
+        self,
+        category_id: int,
+        category_name: str,
+        name: str,
+        latitude: float,
+        longitude: float,
+        work_info: dict = None,
+        free_time_activity_info: dict = None,
+    ) -> int:
+        place_key = (category_id, category_name, name, latitude, longitude)
+        if self._place_ids_by_key is None:
+            self._place_ids_by_key = {
+                place_key: place_id for place_id, place_key in enumerate(self._iter_place_keys())
+            }
+        place_id = self._place_ids_by_key.get(place_key)
+        if place_id is None:
+            place_id = len(self)
+            self._place_ids_by_key[place_key] = place_id
+            self._category_ids.append(category_id)
+            self._category_names.append(category_name)
+            self._names.append(name)
+            self._latitudes.append(latitude)
+            self._longitudes.append(longitude)
+            self._max_workers.append(-1)
+            self._start_times_from.append(nan)
+            self._start_times_to.append(nan)
+            self._current_people.append(0)
+            self._typical_stay_durations_hours.append(nan)
+
+        if work_info:
+            self._max_workers[place_id] = work_info["MaxWorkers"]
+            self._start_times_from[place_id] = work_info["StartTimeFrom"]
+            self._start_times_to[place_id] = work_info["StartTimeTo"]
+        if free_time_activity_info:
+            self._typical_stay_durations_hours[place_id] = free_time_activity_info[
+                "TypicalStayDurationHours"
+            ]
+        return place_id
+
+    def get_location(self, place_id: int) -> (float, float):
+        return self._latitudes[place_id], self._longitudes[place_id]
+
+    def is_workplace(self, place_id: int) -> bool:
+        return self._max_workers[place_id] >= 0
+
+    def is_free_time_place(self, place_id: int) -> bool:
+        return not isnan(self._typical_stay_durations_hours[place_id])
+
+    def get_workplace(self, place_id: int) -> Workplace:
+        workplace = self._workplaces.get(place_id)
+        if workplace is None:
+            if not self.is_workplace(place_id):
+                raise KeyError(f"Place {place_id} is not a workplace")
+            workplace = Workplace(
+                self._category_ids[place_id],
+                self._category_names[place_id],
+                self._names[place_id],
+                self._latitudes[place_id],
+                self._longitudes[place_id],
+                {
+                    "MaxWorkers": self._max_workers[place_id],
+                    "StartTimeFrom": _to_number(self._start_times_from[place_id]),
+                    "StartTimeTo": _to_number(self._start_times_to[place_id]),
+                },
+                place_id,
+            )
+            workplace.current_people = self._current_people[place_id]
+            self._workplaces[place_id] = workplace
+        return workplace
+
+    def get_free_time_place(self, place_id: int) -> FreeTimePlace:
+        free_time_place = self._free_time_places.get(place_id)
+        if free_time_place is None:
+            if not self.is_free_time_place(place_id):
+                raise KeyError(f"Place {place_id} is not a free time place")
+            free_time_place = FreeTimePlace(
+                self._category_ids[place_id],
+                self._category_names[place_id],
+                self._names[place_id],
+                self._latitudes[place_id],
+                self._longitudes[place_id],
+                {"TypicalStayDurationHours": self._typical_stay_durations_hours[place_id]},
+                place_id,
+            )
+            self._free_time_places[place_id] = free_time_place
+        return free_time_place
+
+    def get_workplaces(self) -> list:
+        return [
+            self.get_workplace(place_id)
+            for place_id in range(len(self))
+            if self.is_workplace(place_id)
+        ]
+
+    def get_free_time_places(self) -> list:
+        return [
+            self.get_free_time_place(place_id)
+            for place_id in range(len(self))
+            if self.is_free_time_place(place_id)
+        ]
+
+    def _iter_place_keys(self):
+        return zip(
+            self._category_ids,
+            self._category_names,
+            self._names,
+            self._latitudes,
+            self._longitudes,
+        )
+
+    def _store_current_people(self):
+        # The allocation of workers changes the Workplace objects
+        for place_id, workplace in self._workplaces.items():
+            self._current_people[place_id] = workplace.current_people
+
+
+def _to_number(value: float):
+    # The start times are whole hours in the places info, keep them as integers then
+    return int(value) if value.is_integer() else value
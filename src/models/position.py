@@ -1,7 +1,11 @@
+from math import isnan
 from datetime import datetime
 
 
 class Position:
+    # There can be a lot of positions, so they don't get a __dict__
+    __slots__ = ("lat", "lon", "timestamp")
+
     def __init__(self, latitude: float, longitude: float, time_point: datetime = None):
         self.lat = latitude
         self.lon = longitude
@@ -10,6 +14,13 @@ class Position:
         else:
             self.timestamp = None
 
+    @classmethod
+    def from_timestamp(cls, latitude: float, longitude: float, timestamp: float):
+        position = cls(latitude, longitude)
+        if timestamp is not None and not isnan(timestamp):
+            position.timestamp = timestamp
+        return position
+
     def __repr__(self):
         return self.__str__()
 
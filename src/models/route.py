@@ -1,52 +1,118 @@
 # NOTE: Every waypoint is seen as a sampled GPS location
-from math import isclose
+import numpy as np
+
+from math import isclose, isnan
+from array import array
 
 from .position import Position
 
+NAN = float("nan")
+# The default of math.isclose
+RELATIVE_TOLERANCE = 1e-09
+
 
 class DailyRoute:
+    # The waypoints are stored column by column in contiguous arrays instead of as Position objects.
+    # A missing timestamp is stored as NaN
     def __init__(self):
-        self._route_waypoints = list()
+        self._latitudes = array("d")
+        self._longitudes = array("d")
+        self._timestamps = array("d")
 
     def __repr__(self):
         return self.__str__()
 
     def __str__(self):
         string_representation = ""
-        for i, position in enumerate(self._route_waypoints):
+        for i, position in enumerate(self.get_waypoints()):
             string_representation += f"{i+1}.\t{position}\n"
         return string_representation
 
+    def __len__(self):
+        return len(self._latitudes)
+
     def add_waypoint(self, position: Position):
-        self._route_waypoints.append(position)
+        self._latitudes.append(position.lat)
+        self._longitudes.append(position.lon)
+        self._timestamps.append(position.timestamp if position.timestamp is not None else NAN)
+
+    def add_waypoints(self, latitudes, longitudes, timestamps):
+        # Appends many waypoints at once from any sequences of floats
+        extend_column(self._latitudes, latitudes)
+        extend_column(self._longitudes, longitudes)
+        extend_column(self._timestamps, timestamps)
 
     def is_roughly_equal_to_last_waypoint(self, pos: Position):
-        last_waypoint = self._route_waypoints[-1]
-        return isclose(pos.lat, last_waypoint.lat) and isclose(pos.lon, last_waypoint.lon)
+        return isclose(pos.lat, self._latitudes[-1]) and isclose(pos.lon, self._longitudes[-1])
+
+    def get_new_waypoint_mask(self, latitudes: np.ndarray, longitudes: np.ndarray) -> np.ndarray:
+        # Which of these waypoints are not roughly equal to the one before them, the first one is
+        # compared to the last waypoint of the route. Same tolerance as is_roughly_equal_to_last_waypoint
+        # NaN isn't close to anything, so the first waypoint of an empty route is always new
+        last_latitude = self._latitudes[-1] if len(self._latitudes) > 0 else NAN
+        last_longitude = self._longitudes[-1] if len(self._longitudes) > 0 else NAN
+        previous_latitudes = np.concatenate(([last_latitude], latitudes[:-1]))
+        previous_longitudes = np.concatenate(([last_longitude], longitudes[:-1]))
+        return ~(
+            _are_close(latitudes, previous_latitudes) & _are_close(longitudes, previous_longitudes)
+        )
 
     def get_waypoints(self) -> list:
-        return self._route_waypoints
+        return [
+            Position.from_timestamp(latitude, longitude, timestamp)
+            for latitude, longitude, timestamp in zip(
+                self._latitudes, self._longitudes, self._timestamps
+            )
+        ]
+
+    # Zero-copy views of the underlying arrays
+    # NOTE: No waypoints can be added to the route while a view of it is still in use
+    def get_latitudes(self) -> memoryview:
+        return memoryview(self._latitudes)
+
+    def get_longitudes(self) -> memoryview:
+        return memoryview(self._longitudes)
+
+    def get_timestamps(self) -> memoryview:
+        return memoryview(self._timestamps)
 
     def get_waypoints_as_lat_lon(self) -> list:
-        return [pos.to_lat_lon() for pos in self._route_waypoints]
+        return list(zip(self._latitudes, self._longitudes))
 
     def get_waypoints_as_lon_lat(self) -> list:
-        return [pos.to_lon_lat() for pos in self._route_waypoints]
+        return list(zip(self._longitudes, self._latitudes))
+
+    def get_timestamps_as_list(self) -> list:
+        return [None if isnan(timestamp) else timestamp for timestamp in self._timestamps]
 
     def to_dict(self) -> dict:
         output = dict()
-        output["coords"] = list()
-        output["times"] = list()
-        for position in self._route_waypoints:
-            output["coords"].append([position.lat, position.lon])
-            output["times"].append(position.timestamp)
+        output["coords"] = [
+            [latitude, longitude] for latitude, longitude in zip(self._latitudes, self._longitudes)
+        ]
+        output["times"] = self.get_timestamps_as_list()
         return output
 
     # For later visualization
     def to_linestring(self) -> dict:
         linestring_info = dict()
         linestring_info["type"] = "LineString"
-        linestring_info["coordinates"] = list()
-        for position in self._route_waypoints:
-            linestring_info["coordinates"].append([position.lat, position.lon])
+        linestring_info["coordinates"] = [
+            [latitude, longitude] for latitude, longitude in zip(self._latitudes, self._longitudes)
+        ]
         return linestring_info
+
+
+def _are_close(values: np.ndarray, other_values: np.ndarray) -> np.ndarray:
+    # Like math.isclose with its default relative tolerance. Unlike numpy.isclose, it's symmetric
+    return np.abs(values - other_values) <= RELATIVE_TOLERANCE * np.maximum(
+        np.abs(values), np.abs(other_values)
+    )
+
+
+def extend_column(column: array, values):
+    # numpy arrays and views of columns are copied as one block of memory instead of value by value
+    if isinstance(values, (np.ndarray, memoryview)):
+        column.frombytes(np.ascontiguousarray(values, dtype=np.float64).tobytes())
+    else:
+        column.extend(values)
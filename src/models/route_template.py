@@ -0,0 +1,66 @@
+import numpy as np
+
+from array import array
+
+from .route import DailyRoute, extend_column
+
+
+class RouteTemplate:
+    # The geometry of a chain of routes (e.g. home -> workplace -> free time place -> home) together
+    # with the travel time to each waypoint. It doesn't depend on the day, so it only has to be
+    # calculated once per person and chain and can then be timed for every simulated day
+    def __init__(self):
+        self._latitudes = array("d")
+        self._longitudes = array("d")
+        # Seconds of travel time since leaving the first location of the chain
+        self._travel_time_offsets = array("d")
+        # Index of the first waypoint of the next route for each route of the chain
+        self._route_end_indices = list()
+
+    def __repr__(self):
+        return self.__str__()
+
+    def __str__(self):
+        return f"(Route template: {len(self._latitudes)} waypoints; {self.get_num_routes()} routes)"
+
+    def add_waypoint(self, latitude: float, longitude: float, travel_time_offset_seconds: float):
+        self._latitudes.append(latitude)
+        self._longitudes.append(longitude)
+        self._travel_time_offsets.append(travel_time_offset_seconds)
+
+    def add_waypoints(self, latitudes, longitudes, travel_time_offsets_seconds):
+        # Appends many waypoints at once from any sequences of floats
+        extend_column(self._latitudes, latitudes)
+        extend_column(self._longitudes, longitudes)
+        extend_column(self._travel_time_offsets, travel_time_offsets_seconds)
+
+    def end_route(self):
+        self._route_end_indices.append(len(self._latitudes))
+
+    def get_num_routes(self) -> int:
+        return len(self._route_end_indices)
+
+    def to_daily_route(
+        self, start_of_day_timestamp: float, stay_durations_seconds: list
+    ) -> DailyRoute:
+        # start_of_day_timestamp: When the first route starts, in seconds since the epoch
+        # NOTE: Just like the coordinates, the stay duration at index 0 belongs to the destination of the first route
+        num_routes = len(self._route_end_indices)
+        # Each route starts after all stays before it, the stay at the last destination doesn't matter
+        stay_durations_before_routes = np.zeros(num_routes, dtype=np.float64)
+        num_stays = max(0, min(len(stay_durations_seconds), num_routes - 1))
+        stay_durations_before_routes[1 : num_stays + 1] = stay_durations_seconds[:num_stays]
+        route_start_timestamps = start_of_day_timestamp + np.cumsum(stay_durations_before_routes)
+
+        num_waypoints = self._route_end_indices[-1] if num_routes > 0 else 0
+        route_lengths = np.diff(self._route_end_indices, prepend=0)
+        timestamps = (
+            np.repeat(route_start_timestamps, route_lengths)
+            + np.frombuffer(self._travel_time_offsets, dtype=np.float64)[:num_waypoints]
+        )
+
+        daily_route = DailyRoute()
+        daily_route.add_waypoints(
+            self._latitudes[:num_waypoints], self._longitudes[:num_waypoints], timestamps
+        )
+        return daily_route
@@ -1,23 +1,52 @@
 #!/usr/bin/env python
 
-import json
 import random
+import argparse
 import overpass
 import openrouteservice
 
 from tqdm import tqdm
-from datetime import date, timedelta, datetime
+from pathlib import Path
+from datetime import date
 from geojson import Point
-from defaultlist import defaultlist
-from requests.exceptions import ConnectionError
 
-from .models import Person, Position, DailyRoute
-from .lib.points_of_interest import get_all_pois, parse_pois
+from .models import Person, PlaceRegistry
+from .lib.points_of_interest import iter_all_pois, parse_poi_features
 from .lib.residential_buildings import get_all_residential_buildings
 from .lib.places import get_all_places
+from .lib.allocation import WorkplaceAllocator, choose_random_places
+from .lib.directions_cache import DirectionsCache
+from .lib.checkpoints import CheckpointStore, DEFAULT_CHECKPOINT_DIRECTORY
 from .lib.generating_routes import (
-    generate_daily_routes_sequentially,
-    generate_daily_routes_parallel,
+    iter_daily_routes_parallel,
+    get_default_num_processes,
+    DEFAULT_ORS_CAPACITY,
+)
+from .lib.output import (
+    JsonLinesRouteWriter,
+    convert_json_lines_to_dataset,
+    merge_json_lines_files,
+)
+from .lib.columnar_store import (
+    ColumnarRouteWriter,
+    convert_columnar_store_to_dataset,
+    merge_columnar_stores,
+)
+from .lib.segment_store import (
+    SegmentRouteWriter,
+    convert_segment_store_to_dataset,
+    merge_segment_stores,
+)
+from .lib.async_routing import generate_daily_routes_async
+from .lib.local_routing import LocalRoutingEngine
+from .lib.load_balancing import LoadBalancedORSClient
+from .lib.seeding import get_random_generator, get_shard_range
+from .lib.resampling import resample_daily_route
+from .lib.geojson_directions import (
+    GEOMETRY_FORMATS,
+    GEOMETRY_FORMAT_GEOJSON,
+    GEOMETRY_FORMAT_POLYLINE,
+    GeoJSONDirectionsClient,
 )
 
 # Route from A to B:
@@ -36,113 +65,431 @@ NUM_DAYS_TO_SIMULATE = 2
 
 PEOPLE_PER_RESIDENTIAL_BUILDING = 1
 NUM_FREE_TIME_PLACES_PER_PERSON = 2
+# Stop generating people at this number. 0 to populate all residential buildings
+MAX_NUM_PEOPLE = 10
+
+# Route every pair of neighboring waypoints with its own ORS request instead of interpolating them
+# locally from one route per day. Much slower, but closer to what ORS itself would answer
+USE_HIGH_FIDELITY_ROUTES = False
+
+# Responses of ORS are cached on disk, so that reruns and repeated routes are (almost) free
+DIRECTIONS_CACHE_FILE_PATH = "cache/directions_cache.sqlite"
+DIRECTIONS_CACHE_MAX_SIZE_BYTES = 2 * 1024**3
+
+ORS_BASE_URL = "http://localhost:8080/ors"
+# Requests that take longer fail and are retried, instead of blocking a worker forever
+ORS_REQUEST_TIMEOUT_SECONDS = 60
+MAX_IN_FLIGHT_ORS_REQUESTS = 32
+
+
+# Output format -> (default output path, route writer, converter to a single JSON file,
+# merger of the outputs of several shards)
+OUTPUT_FORMATS = {
+    "jsonl": (
+        "output/generated_routes.jsonl",
+        JsonLinesRouteWriter,
+        convert_json_lines_to_dataset,
+        merge_json_lines_files,
+    ),
+    "columnar": (
+        "output/generated_routes.routes",
+        ColumnarRouteWriter,
+        convert_columnar_store_to_dataset,
+        merge_columnar_stores,
+    ),
+    "segments": (
+        "output/generated_routes.segments",
+        SegmentRouteWriter,
+        convert_segment_store_to_dataset,
+        merge_segment_stores,
+    ),
+}
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Simulate the daily routes of generated people and save them"
+    )
+    parser.add_argument(
+        "--max-people",
+        type=int,
+        default=MAX_NUM_PEOPLE,
+        help="Maximum number of people to generate. 0 to populate all residential buildings",
+    )
+    parser.add_argument(
+        "--graph-file",
+        default=None,
+        help="Route locally on this road graph (.npz built by src.lib.local_routing, or an .osm extract) "
+        "instead of asking ORS",
+    )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=None,
+        help="Number of worker processes. Determined from the CPU count and --ors-capacity by default",
+    )
+    parser.add_argument(
+        "--async-engine",
+        action="store_true",
+        help="Generate all daily routes concurrently in this process with asyncio instead of using "
+        "worker processes. Only for a single ORS instance",
+    )
+    parser.add_argument(
+        "--max-in-flight",
+        type=int,
+        default=MAX_IN_FLIGHT_ORS_REQUESTS,
+        help="With --async-engine: Maximum number of requests that are sent to ORS at the same time",
+    )
+    parser.add_argument(
+        "--ors-url",
+        action="append",
+        default=None,
+        help=f"Base URL of an ORS instance (default: {ORS_BASE_URL}). Repeat it to balance the "
+        "requests over several instances",
+    )
+    parser.add_argument(
+        "--ors-capacity",
+        type=int,
+        default=None,
+        help="Number of requests the ORS instances can handle at the same time",
+    )
+    parser.add_argument(
+        "--geometry-format",
+        choices=GEOMETRY_FORMATS,
+        default=GEOMETRY_FORMAT_POLYLINE,
+        help="Ask ORS for encoded polylines, or for GeoJSON coordinates that don't need decoding",
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=None,
+        help="Number of (person, day) tasks that are handed to a worker process at once",
+    )
+    parser.add_argument(
+        "--output-format",
+        choices=OUTPUT_FORMATS.keys(),
+        default="jsonl",
+        help="'jsonl': One JSON line per person and daily route. "
+        "'columnar': Binary columns with an index that can be memory-mapped by ColumnarRouteReader. "
+        "'segments': Compact binary store, in which routes share the pieces of their ways",
+    )
+    parser.add_argument(
+        "--output",
+        default=None,
+        help="Path that the people and their daily routes are streamed to. Depends on the format by default",
+    )
+    sampling_group = parser.add_mutually_exclusive_group()
+    sampling_group.add_argument(
+        "--sample-interval-seconds",
+        type=float,
+        default=None,
+        help="Resample the output routes at this fixed time interval, like a GPS logger",
+    )
+    sampling_group.add_argument(
+        "--sample-interval-meters",
+        type=float,
+        default=None,
+        help="Resample the output routes every this many meters along their way",
+    )
+    parser.add_argument(
+        "--skip-stays",
+        action="store_true",
+        help="With --sample-interval-seconds: No samples while people stay somewhere",
+    )
+    parser.add_argument(
+        "--checkpoint-dir",
+        default=DEFAULT_CHECKPOINT_DIRECTORY,
+        help="Directory that the generated people and every finished daily route are saved to",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue the run in --checkpoint-dir with its people, only generating missing routes",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=None,
+        help="Generate the people and their routes reproducibly from this seed",
+    )
+    parser.add_argument(
+        "--start-date",
+        type=date.fromisoformat,
+        default=None,
+        help="First simulated day (YYYY-MM-DD). Today by default",
+    )
+    parser.add_argument(
+        "--num-shards",
+        type=int,
+        default=1,
+        help="Split the people into this many contiguous ranges of ids, e.g. for several machines. "
+        "Needs --seed, so that all shards generate the same people",
+    )
+    parser.add_argument(
+        "--shard-index",
+        type=int,
+        default=0,
+        help="Only generate the routes of the people in this shard (0 to --num-shards - 1)",
+    )
+    parser.add_argument(
+        "--merge-shards",
+        nargs="+",
+        default=None,
+        help="Don't generate anything, but merge the outputs of these shards into --output",
+    )
+    parser.add_argument(
+        "--json-output",
+        default="output/generated_routes.json",
+        help="Convert the output into one JSON file at this path afterwards. Empty to skip",
+    )
+    return parser.parse_args()
 
 
 def main():
-    ors_client = openrouteservice.Client(base_url="http://localhost:8080/ors")
+    args = parse_arguments()
+    default_output_path, route_writer_class, convert_to_dataset, merge_outputs = OUTPUT_FORMATS[
+        args.output_format
+    ]
+    output_path = args.output or default_output_path
+    if args.merge_shards:
+        merge_outputs(args.merge_shards, output_path)
+        print(f"Merged {len(args.merge_shards)} shards into '{output_path}'.")
+        if args.json_output:
+            convert_to_dataset(output_path, args.json_output)
+            print(f"Converted the merged routes to '{args.json_output}'.")
+        return
+    if args.num_shards > 1 and args.seed is None:
+        raise SystemExit("Sharded runs need a --seed, so that all shards generate the same people.")
+
+    ors_base_urls = args.ors_url or [ORS_BASE_URL]
+    # NOTE: The async engine talks to a single ORS instance only
+    if args.async_engine and (args.graph_file or len(ors_base_urls) > 1):
+        raise SystemExit("The async engine only works with a single ORS instance.")
+    if args.graph_file:
+        ors_client = LocalRoutingEngine(args.graph_file)
+        # Routes of different backends must not be mixed up in the cache
+        directions_cache_file_path = DIRECTIONS_CACHE_FILE_PATH.replace(
+            ".sqlite", f"_{Path(args.graph_file).stem}.sqlite"
+        )
+    else:
+        if len(ors_base_urls) > 1:
+            ors_client = LoadBalancedORSClient(ors_base_urls, ORS_REQUEST_TIMEOUT_SECONDS)
+        else:
+            ors_client = openrouteservice.Client(
+                base_url=ors_base_urls[0], timeout=ORS_REQUEST_TIMEOUT_SECONDS
+            )
+        directions_cache_file_path = DIRECTIONS_CACHE_FILE_PATH
+    # NOTE: The local routing engine always returns encoded polylines
+    routing_client = ors_client
+    if args.geometry_format == GEOMETRY_FORMAT_GEOJSON and not args.graph_file:
+        routing_client = GeoJSONDirectionsClient(ors_client)
     overpass_api = overpass.API()
+    directions_cache = DirectionsCache(directions_cache_file_path, DIRECTIONS_CACHE_MAX_SIZE_BYTES)
+
+    checkpoint_store = CheckpointStore(args.checkpoint_dir)
+    if args.resume:
+        if not checkpoint_store.has_run():
+            raise SystemExit(f"There is no run to resume in '{args.checkpoint_dir}'.")
+        generated_people, start_date, num_days_to_simulate, seed = checkpoint_store.load_run()
+        completed_tasks = checkpoint_store.get_completed_tasks()
+        print(
+            f"Resuming the run with {len(generated_people)} people, "
+            f"{len(completed_tasks)} daily routes are done already."
+        )
+    else:
+        # e.g. 2023-03-29
+        start_date = args.start_date or date.today()
+        num_days_to_simulate = NUM_DAYS_TO_SIMULATE
+        seed = args.seed
+
+        generated_people = generate_population(overpass_api, args.max_people, seed)
+        # Every shard generates all people the same way, but only keeps its own range of them
+        first_person_index, last_person_index = get_shard_range(
+            len(generated_people), args.shard_index, args.num_shards
+        )
+        generated_people = generated_people[first_person_index:last_person_index]
+        if args.num_shards > 1:
+            print(
+                f"Shard {args.shard_index} of {args.num_shards}: "
+                f"people {first_person_index} to {last_person_index - 1}."
+            )
+        checkpoint_store.start_run(generated_people, start_date, num_days_to_simulate, seed)
+        completed_tasks = set()
+
+    # Use the generated people to come up with their daily routes for the given time span of X days
+
+    # Generate routes for all days for each person
+    # generate_daily_routes_sequentially(
+    #    start_date,
+    #    NUM_DAYS_TO_SIMULATE,
+    #    generated_people,
+    #    ors_client,
+    #    USE_HIGH_FIDELITY_ROUTES,
+    #    directions_cache,
+    # )
+
+    # Every daily route is checkpointed as soon as it is done, so that a crashed run can be resumed
+    failed_tasks = list()
+
+    def report_failed_task(person: Person, day_index: int, error_message: str):
+        failed_tasks.append((person.id, day_index))
+        tqdm.write(
+            f"Failed to generate the daily route of person {person.id} on day {day_index}: "
+            f"{error_message}"
+        )
 
+    if args.async_engine:
+        generate_daily_routes_async(
+            start_date,
+            num_days_to_simulate,
+            generated_people,
+            ors_base_urls[0],
+            args.max_in_flight,
+            directions_cache,
+            completed_tasks,
+            lambda person, day_index, daily_route: checkpoint_store.add_daily_route(
+                person.id, day_index, daily_route
+            ),
+            report_failed_task,
+            seed,
+            args.geometry_format,
+        )
+    else:
+        # Every ORS instance can serve requests at the same time
+        ors_capacity = args.ors_capacity or DEFAULT_ORS_CAPACITY * len(ors_base_urls)
+        num_processes = args.processes or get_default_num_processes(ors_capacity)
+        print(f"Generating daily routes with {num_processes} worker processes...")
+        for person, day_index, daily_route in tqdm(
+            iter_daily_routes_parallel(
+                start_date,
+                num_days_to_simulate,
+                generated_people,
+                routing_client,
+                USE_HIGH_FIDELITY_ROUTES,
+                directions_cache,
+                num_processes,
+                args.chunk_size,
+                completed_tasks,
+                report_failed_task,
+                seed,
+            ),
+            total=len(generated_people) * num_days_to_simulate - len(completed_tasks),
+        ):
+            checkpoint_store.add_daily_route(person.id, day_index, daily_route)
+    if failed_tasks:
+        print(
+            f"{len(failed_tasks)} daily routes could not be generated. "
+            "Run again with --resume to retry only those."
+        )
+
+    # The output is built from the checkpoints, which contain the routes of earlier attempts as well
+    with route_writer_class(output_path) as route_writer:
+        for person in generated_people:
+            route_writer.write_person(person)
+        for person_id, day_index, daily_route in checkpoint_store.iter_daily_routes():
+            # The checkpoints keep the sparse routes, so that they can be resampled differently
+            if args.sample_interval_seconds or args.sample_interval_meters:
+                daily_route = resample_daily_route(
+                    daily_route,
+                    args.sample_interval_seconds,
+                    args.sample_interval_meters,
+                    include_stays=not args.skip_stays,
+                )
+            route_writer.write_daily_route(person_id, day_index, daily_route)
+    checkpoint_store.close()
+    print(f"Directions cache: {directions_cache.get_stats()}")
+    if isinstance(ors_client, LoadBalancedORSClient):
+        print(f"ORS instances: {ors_client.get_stats()}")
+    print(f"Saved all generated routes to '{output_path}'.")
+
+    # Existing consumers expect everything in one JSON file
+    if args.json_output:
+        convert_to_dataset(output_path, args.json_output, num_days_to_simulate)
+        print(f"Converted the generated routes to '{args.json_output}'.")
+
+
+def generate_population(
+    overpass_api: overpass.API, max_num_people: int = MAX_NUM_PEOPLE, seed: int = None
+) -> list:
     # Use the city's geo location and a fixed size square (or something else) to get all points of interest
-    # NOTE: Maximum size: 5km^2
+    # NOTE: Large squares are fetched in tiles, see get_all_pois
     central_location_latitude = 52.2719595
     central_location_longitude = 8.047635
     central_location_point = Point((central_location_longitude, central_location_latitude))
 
-    # e.g. 2023-03-29
-    start_date = date.today()
-
     # Create a list with all workplaces and one with all free time places in the surrounding area
     # Combine it with information and parameters we set up in a file to specify e.g. the max. number of workers
     places_info = get_all_places("data/places_info.json")
-    location_poi_info = get_all_pois(central_location_point, places_info, SQUARE_LENGTH_km)
-    workplaces, free_time_places = parse_pois(location_poi_info, places_info)
+    place_registry = PlaceRegistry()
+    workplaces, free_time_places = parse_poi_features(
+        iter_all_pois(central_location_point, places_info, SQUARE_LENGTH_km),
+        places_info,
+        place_registry,
+    )
 
     location_residential_buildings = get_all_residential_buildings(
-        central_location_latitude, central_location_longitude, overpass_api
+        central_location_latitude, central_location_longitude, overpass_api, SQUARE_LENGTH_km
     )
 
     # Use the place objects to generate people
-    generated_people = generate_people(location_residential_buildings, workplaces, free_time_places)
-
-    # Use the generated people to come up with their daily routes for the given time span of X days
-
-    # Generate routes for all days for each person
-    # generate_daily_routes_sequentially(
-    #    start_date, NUM_DAYS_TO_SIMULATE, generated_people, ors_client
-    # )
-    generated_people = generate_daily_routes_parallel(
-        start_date, NUM_DAYS_TO_SIMULATE, generated_people, ors_client
-    )
-
-    # Iterate over generated people, which store a list of their daily routes
-    output_dataset = dict()
-    output_dataset["people"] = list()
-    # Note: A defaultlist helps make the code much cleaner by allowing to iterate over people
-    # and inserting all of their daily routes for every day in that iteration instead of iterating over days
-    output_dataset["daily_routes"] = defaultlist(list)
-    for person in generated_people:
-        person_info = dict()
-        person_info["id"] = person.id
-        person_info["home_location"] = [person.home_location.lat, person.home_location.lon]
-        person_info["workplace"] = [person.workplace.latitude, person.workplace.longitude]
-        person_info["free_time_places"] = [
-            [place.latitude, place.longitude] for place in person.favorite_free_time_places
-        ]
-        output_dataset["people"].append(person_info)
-
-        all_daily_routes_for_person = person.get_all_routes_as_dicts()
-        for day_index, daily_route_info in enumerate(all_daily_routes_for_person):
-            output_dataset["daily_routes"][day_index].append(daily_route_info)
-
-    # Save the end result for later use to visualize everything
-    with open("output/generated_routes.json", "w") as out_file:
-        json.dump(output_dataset, out_file)
-    print("Saved all generated routes.")
+    return generate_people(
+        location_residential_buildings,
+        workplaces,
+        free_time_places,
+        place_registry,
+        max_num_people,
+        get_random_generator(seed, "population") if seed is not None else None,
+    )
 
 
 def generate_people(
-    location_residential_buildings: list, workplaces: list, free_time_places: list
+    location_residential_buildings: list,
+    workplaces: list,
+    free_time_places: list,
+    place_registry: PlaceRegistry,
+    max_num_people: int = MAX_NUM_PEOPLE,
+    random_generator: random.Random = None,
 ) -> list:
+    # Uses the global random state if no random generator is given
     generated_people = list()
     person_id = 0
-    random.shuffle(location_residential_buildings)
+    if random_generator is None:
+        random_generator = random
+    else:
+        # The order of the buildings depends on how they were cached, but a seeded population must
+        # only depend on the seed
+        location_residential_buildings.sort(key=lambda position: (position.lat, position.lon))
+    random_generator.shuffle(location_residential_buildings)
+    # There's no correlation between homes and workplaces and such, they are picked randomly
+    workplace_allocator = WorkplaceAllocator(workplaces, random_generator=random_generator)
     # Assign everyone one of the residential buildings, up to the maximum of 8 people per building
     for home_location in tqdm(location_residential_buildings):
-        if person_id == 10:
+        if max_num_people and person_id >= max_num_people:
             break
         for i in range(PEOPLE_PER_RESIDENTIAL_BUILDING):
-            # Randomly shuffle all workplaces and free time places so that there's no correlation between homes and workplaces and such
-            random.shuffle(workplaces)
-            random.shuffle(free_time_places)
-            # Choose one of the workplaces
-            chosen_workplace = None
-            for workplace in workplaces:
-                if workplace.current_people < workplace.max_workers:
-                    # This workplace still has capacity
-                    chosen_workplace = workplace
-                    workplace.current_people += 1
-                    break
+            # Choose one of the workplaces that still have capacity
+            chosen_workplace = workplace_allocator.allocate()
             if not chosen_workplace:
                 # print("All workplaces were full! Choosing a random 'full' workplace anyways...")
                 # chosen_workplace = workplaces[0]
                 print("All workplaces are full. No need to generate more people!")
                 return generated_people
 
-            # Now choose one of the free time places that is not this workplace
-            chosen_free_time_places = list()
-            for free_time_place in free_time_places:
-                if not free_time_place == chosen_workplace:
-                    if len(chosen_free_time_places) < NUM_FREE_TIME_PLACES_PER_PERSON:
-                        chosen_free_time_places.append(free_time_place)
-                    else:
-                        break
+            # Now choose some of the free time places that are not this workplace
+            chosen_free_time_places = choose_random_places(
+                free_time_places,
+                NUM_FREE_TIME_PLACES_PER_PERSON,
+                excluded_place=chosen_workplace,
+                random_generator=random_generator,
+            )
 
             # The person can be created now
             person = Person(
                 person_id,
                 home_location,
-                chosen_workplace,
-                chosen_free_time_places,
+                chosen_workplace.place_id,
+                [free_time_place.place_id for free_time_place in chosen_free_time_places],
+                place_registry,
             )
             generated_people.append(person)
             person_id += 1
@@ -0,0 +1,161 @@
+import json
+import random
+import copy
+
+from pathlib import Path
+from openrouteservice import convert
+
+from src.route_generator import generate_people
+from src.models import Person, Position, PlaceRegistry
+from src.lib.places import get_all_places
+from src.lib.points_of_interest import parse_poi_features
+from src.lib.polyline import encode_polyline
+from src.lib.local_routing import LocalRoutingEngine, RoadGraph
+from src.lib.seeding import get_random_generator
+
+REPOSITORY_DIRECTORY = Path(__file__).parent.parent
+PLACES_INFO_FILE_PATH = REPOSITORY_DIRECTORY / "data" / "places_info.json"
+EXAMPLE_ROUTE_FILE_PATH = REPOSITORY_DIRECTORY / "openrouteservice_example_route.json"
+# The area of the people and places, with a road every 0.005 degrees
+SOUTH, WEST = 52.2, 8.0
+NUM_GRID_LINES = 11
+GRID_STEP_DEGREES = 0.005
+
+
+def load_example_directions() -> dict:
+    with open(EXAMPLE_ROUTE_FILE_PATH, "r") as example_route_file:
+        return json.load(example_route_file)
+
+
+class StubDirectionsClient:
+    # Answers every directions request with the segments of the example route, one after the other
+    # and starting over after the last one, so that there is a segment for every pair of
+    # coordinates. Counts the requests of this process
+    def __init__(self):
+        self.requests = list()
+        self._example_route = load_example_directions()["routes"][0]
+        self._example_geometry = convert.decode_polyline(self._example_route["geometry"])[
+            "coordinates"
+        ]
+
+    def directions(self, coords, profile: str, preference: str, units: str = "m", **kwargs) -> dict:
+        self.requests.append([tuple(coord) for coord in coords])
+        example_way_points = self._example_route["way_points"]
+        geometry = list()
+        segments = list()
+        for segment_index in range(len(coords) - 1):
+            example_segment_index = segment_index % len(self._example_route["segments"])
+            first_index = example_way_points[example_segment_index]
+            last_index = example_way_points[example_segment_index + 1]
+            # Consecutive segments share the point between them
+            offset = max(0, len(geometry) - 1) - first_index
+            geometry.extend(
+                self._example_geometry[first_index + (1 if geometry else 0) : last_index + 1]
+            )
+            segment = copy.deepcopy(self._example_route["segments"][example_segment_index])
+            for step in segment["steps"]:
+                step["way_points"] = [way_point + offset for way_point in step["way_points"]]
+            segments.append(segment)
+        return {
+            "routes": [
+                {
+                    "summary": {
+                        "distance": sum(segment["distance"] for segment in segments),
+                        "duration": sum(segment["duration"] for segment in segments),
+                    },
+                    "segments": segments,
+                    "geometry": encode_polyline(geometry),
+                    "way_points": [0]
+                    + [segment["steps"][-1]["way_points"][1] for segment in segments],
+                }
+            ],
+        }
+
+
+def get_people(num_people: int) -> list:
+    # One workplace and one free time place per person, without any randomness
+    place_registry = PlaceRegistry()
+    people = list()
+    for person_index in range(num_people):
+        workplace_id = place_registry.add_place(
+            101,
+            "Bakery",
+            f"Bakery {person_index}",
+            52.28 + person_index * 0.001,
+            8.05,
+            work_info={"MaxWorkers": 5, "StartTimeFrom": 5, "StartTimeTo": 6},
+        )
+        free_time_place_id = place_registry.add_place(
+            201,
+            "Park",
+            f"Park {person_index}",
+            52.26,
+            8.04 + person_index * 0.001,
+            free_time_activity_info={"TypicalStayDurationHours": 1.5},
+        )
+        home_location = Position(52.27 + person_index * 0.001, 8.03)
+        people.append(
+            Person(person_index, home_location, workplace_id, [free_time_place_id], place_registry)
+        )
+    return people
+
+
+def get_grid_routing_engine() -> LocalRoutingEngine:
+    node_coordinates = {
+        row * NUM_GRID_LINES
+        + column: (SOUTH + row * GRID_STEP_DEGREES, WEST + column * GRID_STEP_DEGREES)
+        for row in range(NUM_GRID_LINES)
+        for column in range(NUM_GRID_LINES)
+    }
+    ways = list()
+    for line in range(NUM_GRID_LINES):
+        row_node_ids = [line * NUM_GRID_LINES + column for column in range(NUM_GRID_LINES)]
+        column_node_ids = [row * NUM_GRID_LINES + line for row in range(NUM_GRID_LINES)]
+        ways.append((row_node_ids, {"highway": "residential", "name": f"Row {line}"}))
+        ways.append((column_node_ids, {"highway": "residential", "name": f"Column {line}"}))
+    return LocalRoutingEngine(road_graph=RoadGraph.from_ways(node_coordinates, ways))
+
+
+def generate_population(seed: int, num_people: int) -> list:
+    # The same people for the same seed, like every shard generates them. The places are fixed,
+    # only the people depend on the seed
+    places_info = get_all_places(PLACES_INFO_FILE_PATH)
+    category_ids = [
+        category_id
+        for category_id, place_info in places_info.items()
+        if not place_info["IsGroupID"]
+    ]
+    places_random_generator = random.Random(5)
+    extent_degrees = (NUM_GRID_LINES - 1) * GRID_STEP_DEGREES
+    features = [
+        {
+            "type": "Feature",
+            "geometry": {
+                "type": "Point",
+                "coordinates": [
+                    WEST + places_random_generator.random() * extent_degrees,
+                    SOUTH + places_random_generator.random() * extent_degrees,
+                ],
+            },
+            "properties": {
+                "category_ids": {category_id: {"category_name": "Place"}},
+                "osm_tags": {"name": f"Place {place_index}"},
+            },
+        }
+        for place_index, category_id in enumerate(
+            places_random_generator.choice(category_ids) for _ in range(100)
+        )
+    ]
+    place_registry = PlaceRegistry()
+    workplaces, free_time_places = parse_poi_features(features, places_info, place_registry)
+    residential_buildings = [
+        Position(SOUTH + index * 0.001, WEST + index * 0.0005) for index in range(20)
+    ]
+    return generate_people(
+        residential_buildings,
+        workplaces,
+        free_time_places,
+        place_registry,
+        num_people,
+        get_random_generator(seed, "population"),
+    )
@@ -0,0 +1,59 @@
+import random
+import pytest
+
+from collections import Counter
+
+from src.models import Workplace
+from src.lib.allocation import FenwickTree, WorkplaceAllocator, iter_random_indexes
+
+
+def create_workplaces(max_workers: list) -> list:
+    return [
+        Workplace(
+            1,
+            "Office",
+            f"Office {place_id}",
+            52.2,
+            8.0,
+            {"MaxWorkers": num_workers, "StartTimeFrom": 7, "StartTimeTo": 9},
+            place_id,
+        )
+        for place_id, num_workers in enumerate(max_workers)
+    ]
+
+
+@pytest.mark.parametrize("weight_by_remaining_capacity", [False, True])
+def test_allocator_never_exceeds_max_workers(weight_by_remaining_capacity):
+    max_workers = [1, 5, 0, 30, 2, 7]
+    workplaces = create_workplaces(max_workers)
+    allocator = WorkplaceAllocator(
+        workplaces, weight_by_remaining_capacity, random_generator=random.Random(1)
+    )
+    allocated_workplaces = [allocator.allocate() for _ in range(sum(max_workers))]
+    # Every place of every workplace is taken, then there are none left
+    assert allocator.allocate() is None
+    num_workers = Counter(workplace.place_id for workplace in allocated_workplaces)
+    for workplace in workplaces:
+        assert workplace.current_people == workplace.max_workers
+        assert num_workers[workplace.place_id] == workplace.max_workers
+
+
+def test_allocator_skips_workplaces_that_are_full_already():
+    workplaces = create_workplaces([3, 3])
+    workplaces[0].current_people = 3
+    allocator = WorkplaceAllocator(workplaces, random_generator=random.Random(1))
+    assert [allocator.allocate() for _ in range(3)] == [workplaces[1]] * 3
+    assert allocator.allocate() is None
+
+
+def test_fenwick_tree_finds_prefix_sums():
+    weights = [3, 0, 1, 4, 0, 2]
+    tree = FenwickTree(weights)
+    assert tree.total() == sum(weights)
+    expected_indexes = [index for index, weight in enumerate(weights) for _ in range(weight)]
+    assert [tree.find(value) for value in range(sum(weights))] == expected_indexes
+
+
+def test_random_indexes_are_a_permutation():
+    indexes = list(iter_random_indexes(100, random.Random(1)))
+    assert sorted(indexes) == list(range(100))
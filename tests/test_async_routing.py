@@ -0,0 +1,86 @@
+import asyncio
+import datetime
+
+from src.lib.async_routing import (
+    MAX_PENDING_DAILY_ROUTES_PER_REQUEST,
+    _generate_all_daily_routes_async,
+)
+from src.lib.generating_routes import generate_daily_routes_sequentially, print_failed_task
+from tests.helpers import StubDirectionsClient, generate_population
+
+START_DATE = datetime.date(2023, 4, 3)
+NUM_DAYS = 7
+
+
+class StubAsyncORSClient:
+    # Answers like StubDirectionsClient after giving the other tasks a chance to run, and keeps
+    # track of how many requests were waiting for an answer at the same time
+    def __init__(self, max_in_flight_requests: int):
+        self.max_in_flight_requests = max_in_flight_requests
+        self.num_waiting_requests = 0
+        self.max_waiting_requests = 0
+        self._stub_client = StubDirectionsClient()
+
+    async def directions(self, coords, profile: str, preference: str, units: str) -> dict:
+        self.num_waiting_requests += 1
+        self.max_waiting_requests = max(self.max_waiting_requests, self.num_waiting_requests)
+        await asyncio.sleep(0.001)
+        self.num_waiting_requests -= 1
+        return self._stub_client.directions(coords, profile, preference, units)
+
+
+def generate_daily_routes(people: list, ors_client: StubAsyncORSClient, on_daily_route=None):
+    asyncio.run(
+        _generate_all_daily_routes_async(
+            START_DATE,
+            NUM_DAYS,
+            people,
+            ors_client,
+            None,
+            set(),
+            on_daily_route,
+            print_failed_task,
+            1,
+        )
+    )
+
+
+def get_routes_as_dicts(people: list) -> list:
+    return [person.get_all_routes_as_dicts() for person in people]
+
+
+def test_async_routes_match_the_sequential_ones():
+    people = generate_population(1, 4)
+    generate_daily_routes(people, StubAsyncORSClient(max_in_flight_requests=2))
+
+    sequential_people = generate_population(1, 4)
+    generate_daily_routes_sequentially(
+        START_DATE, NUM_DAYS, sequential_people, StubDirectionsClient(), seed=1
+    )
+    assert get_routes_as_dicts(people) == get_routes_as_dicts(sequential_people)
+
+
+def test_pending_daily_routes_are_bounded():
+    ors_client = StubAsyncORSClient(max_in_flight_requests=1)
+    generate_daily_routes(generate_population(1, 4), ors_client)
+
+    # Only the pending daily routes can wait for a route template
+    assert 1 <= ors_client.max_waiting_requests <= MAX_PENDING_DAILY_ROUTES_PER_REQUEST
+
+
+def test_people_dont_keep_routes_with_a_callback():
+    people = generate_population(1, 4)
+    finished_tasks = list()
+    generate_daily_routes(
+        people,
+        StubAsyncORSClient(max_in_flight_requests=2),
+        on_daily_route=lambda person, day_index, daily_route: finished_tasks.append(
+            (person.id, day_index)
+        ),
+    )
+
+    assert sorted(finished_tasks) == sorted(
+        (person.id, day_index) for person in people for day_index in range(NUM_DAYS)
+    )
+    for person in people:
+        assert len(person.get_all_routes()) == 0
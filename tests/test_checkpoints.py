@@ -0,0 +1,111 @@
+import sys
+import json
+import pytest
+
+from src import route_generator
+from src.lib.checkpoints import CheckpointStore
+from tests.helpers import StubDirectionsClient, generate_population
+
+SEED = 2
+NUM_PEOPLE = 5
+NUM_INTERRUPTED_DAILY_ROUTES = 4
+
+
+class RunInterrupted(Exception):
+    pass
+
+
+def run_route_generator(monkeypatch, tmp_path, run_name: str, *arguments):
+    # Runs the route generator with stubbed people and directions, returns the converted output
+    json_output_path = tmp_path / f"{run_name}.json"
+    monkeypatch.setattr(
+        sys,
+        "argv",
+        [
+            "route_generator",
+            "--seed",
+            str(SEED),
+            "--max-people",
+            str(NUM_PEOPLE),
+            "--start-date",
+            "2023-04-03",
+            "--processes",
+            "2",
+            "--output",
+            str(tmp_path / f"{run_name}.jsonl"),
+            "--json-output",
+            str(json_output_path),
+            *arguments,
+        ],
+    )
+    route_generator.main()
+    with open(json_output_path, "r") as json_output_file:
+        return json.load(json_output_file)
+
+
+@pytest.fixture
+def stubbed_route_generator(monkeypatch, tmp_path):
+    monkeypatch.setattr(
+        route_generator,
+        "generate_population",
+        lambda overpass_api, max_num_people, seed: generate_population(seed, max_num_people),
+    )
+    monkeypatch.setattr(
+        route_generator.openrouteservice, "Client", lambda **kwargs: StubDirectionsClient()
+    )
+    monkeypatch.setattr(
+        route_generator, "DIRECTIONS_CACHE_FILE_PATH", str(tmp_path / "directions_cache.sqlite")
+    )
+
+
+def test_resumed_run_equals_uninterrupted_run(monkeypatch, tmp_path, stubbed_route_generator):
+    uninterrupted_output = run_route_generator(
+        monkeypatch,
+        tmp_path,
+        "uninterrupted",
+        "--checkpoint-dir",
+        str(tmp_path / "uninterrupted_checkpoints"),
+    )
+    num_days = len(uninterrupted_output["daily_routes"])
+    assert sum(map(len, uninterrupted_output["daily_routes"])) == NUM_PEOPLE * num_days
+
+    # The run is killed after a few daily routes were checkpointed
+    add_daily_route = CheckpointStore.add_daily_route
+    added_tasks = list()
+
+    def add_daily_route_until_interrupted(checkpoint_store, person_id, day_index, daily_route):
+        if len(added_tasks) == NUM_INTERRUPTED_DAILY_ROUTES:
+            raise RunInterrupted()
+        add_daily_route(checkpoint_store, person_id, day_index, daily_route)
+        added_tasks.append((person_id, day_index))
+
+    checkpoint_directory = str(tmp_path / "interrupted_checkpoints")
+    with monkeypatch.context() as interrupted_monkeypatch:
+        interrupted_monkeypatch.setattr(
+            CheckpointStore, "add_daily_route", add_daily_route_until_interrupted
+        )
+        with pytest.raises(RunInterrupted):
+            run_route_generator(
+                monkeypatch, tmp_path, "interrupted", "--checkpoint-dir", checkpoint_directory
+            )
+    interrupted_tasks = list(added_tasks)
+
+    # Resuming neither generates new people nor the daily routes that are done
+    def generate_no_population(*args):
+        raise AssertionError("A resumed run must use the people of its checkpoint")
+
+    monkeypatch.setattr(route_generator, "generate_population", generate_no_population)
+    added_tasks.clear()
+
+    def add_daily_route_and_remember(checkpoint_store, person_id, day_index, daily_route):
+        add_daily_route(checkpoint_store, person_id, day_index, daily_route)
+        added_tasks.append((person_id, day_index))
+
+    monkeypatch.setattr(CheckpointStore, "add_daily_route", add_daily_route_and_remember)
+    resumed_output = run_route_generator(
+        monkeypatch, tmp_path, "resumed", "--checkpoint-dir", checkpoint_directory, "--resume"
+    )
+    assert len(interrupted_tasks) == NUM_INTERRUPTED_DAILY_ROUTES
+    assert not set(added_tasks) & set(interrupted_tasks)
+    assert len(added_tasks) + len(interrupted_tasks) == NUM_PEOPLE * num_days
+    assert resumed_output == uninterrupted_output
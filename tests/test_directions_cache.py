@@ -0,0 +1,174 @@
+import json
+import pickle
+import hashlib
+
+from concurrent.futures import ProcessPoolExecutor
+
+from src.lib.directions_cache import (
+    LAST_ACCESSED_UPDATE_INTERVAL_SECONDS,
+    STATS_FLUSH_INTERVAL_LOOKUPS,
+    DirectionsCache,
+)
+
+PROFILE = "foot-walking"
+PREFERENCE = "fastest"
+UNITS = "m"
+COORDS = [[8.047635, 52.2719595], [8.0512, 52.2801]]
+NUM_PROCESSES = 4
+NUM_ENTRIES_PER_PROCESS = 50
+
+
+def get_response(index: int) -> dict:
+    # All responses have the same size
+    return {"routes": [{"summary": {"distance": 1000.0 + index, "duration": 2000.0 + index}}]}
+
+
+def get_coords(index: int) -> list:
+    return [[8.0 + index * 0.001, 52.2], [8.1, 52.2 + index * 0.001]]
+
+
+def test_key_is_stable(tmp_path):
+    directions_cache = DirectionsCache(str(tmp_path / "cache.sqlite"))
+    key = directions_cache.make_key(PROFILE, PREFERENCE, UNITS, COORDS)
+    # Keys are kept across runs, so they must not depend on anything but the request
+    expected_key_info = '["foot-walking","fastest","m",[[8.047635,52.27196],[8.0512,52.2801]]]'
+    assert key == hashlib.sha256(expected_key_info.encode("utf-8")).hexdigest()
+    other_directions_cache = DirectionsCache(str(tmp_path / "other_cache.sqlite"))
+    assert other_directions_cache.make_key(PROFILE, PREFERENCE, UNITS, COORDS) == key
+    # Differences below the precision don't matter, but everything else does
+    assert (
+        directions_cache.make_key(PROFILE, PREFERENCE, UNITS, [tuple(coord) for coord in COORDS])
+        == key
+    )
+    assert (
+        directions_cache.make_key(
+            PROFILE, PREFERENCE, UNITS, [[8.0476351, 52.2719595], [8.0512, 52.2801]]
+        )
+        == key
+    )
+    assert directions_cache.make_key("cycling-regular", PREFERENCE, UNITS, COORDS) != key
+    assert directions_cache.make_key(PROFILE, "shortest", UNITS, COORDS) != key
+    assert directions_cache.make_key(PROFILE, PREFERENCE, "km", COORDS) != key
+    assert directions_cache.make_key(PROFILE, PREFERENCE, UNITS, COORDS[::-1]) != key
+
+
+def test_hits_and_misses_are_counted(tmp_path):
+    directions_cache = DirectionsCache(str(tmp_path / "cache.sqlite"))
+    assert directions_cache.get(PROFILE, PREFERENCE, UNITS, COORDS) is None
+    directions_cache.put(PROFILE, PREFERENCE, UNITS, COORDS, get_response(1))
+    assert directions_cache.get(PROFILE, PREFERENCE, UNITS, COORDS) == get_response(1)
+    assert directions_cache.get(PROFILE, PREFERENCE, UNITS, COORDS) == get_response(1)
+    assert (directions_cache.hits, directions_cache.misses) == (2, 1)
+
+    # A copy for another process counts on its own, but adds to the same totals
+    other_directions_cache = pickle.loads(pickle.dumps(directions_cache))
+    assert other_directions_cache.get(PROFILE, PREFERENCE, UNITS, get_coords(1)) is None
+    other_directions_cache.close()
+    stats = directions_cache.get_stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (2, 2, 1)
+    directions_cache.close()
+
+    # The totals are kept across runs
+    directions_cache = DirectionsCache(str(tmp_path / "cache.sqlite"))
+    assert (directions_cache.hits, directions_cache.misses) == (0, 0)
+    assert directions_cache.get_stats()["hits"] == 2
+
+
+def test_counts_are_written_after_some_lookups(tmp_path):
+    directions_cache = DirectionsCache(str(tmp_path / "cache.sqlite"))
+    other_directions_cache = DirectionsCache(str(tmp_path / "cache.sqlite"))
+    for _ in range(STATS_FLUSH_INTERVAL_LOOKUPS - 1):
+        directions_cache.get(PROFILE, PREFERENCE, UNITS, COORDS)
+    assert other_directions_cache.get_stats()["misses"] == 0
+    directions_cache.get(PROFILE, PREFERENCE, UNITS, COORDS)
+    assert other_directions_cache.get_stats()["misses"] == STATS_FLUSH_INTERVAL_LOOKUPS
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("src.lib.directions_cache.time.time", lambda: now[0])
+    entry_size = len(json.dumps(get_response(0), separators=(",", ":")))
+    directions_cache = DirectionsCache(
+        str(tmp_path / "directions_cache.sqlite"), max_size_bytes=10 * entry_size
+    )
+    for index in range(10):
+        directions_cache.put(PROFILE, PREFERENCE, UNITS, get_coords(index), get_response(index))
+        now[0] += 1.0
+    assert directions_cache.get_stats()["entries"] == 10
+
+    # Using the first entry long after it was added makes it the most recently used one
+    now[0] += LAST_ACCESSED_UPDATE_INTERVAL_SECONDS
+    assert directions_cache.get(PROFILE, PREFERENCE, UNITS, get_coords(0)) == get_response(0)
+    directions_cache.put(PROFILE, PREFERENCE, UNITS, get_coords(10), get_response(10))
+
+    # Evicted down to 90% of the maximum size, the oldest entries first
+    stats = directions_cache.get_stats()
+    assert stats["entries"] == 9
+    assert stats["total_size"] == 9 * entry_size
+    for index in (1, 2):
+        assert directions_cache.get(PROFILE, PREFERENCE, UNITS, get_coords(index)) is None
+    for index in (0, *range(3, 11)):
+        response = directions_cache.get(PROFILE, PREFERENCE, UNITS, get_coords(index))
+        assert response == get_response(index)
+
+    # Replacing an entry doesn't count its size twice, too big responses aren't stored at all
+    directions_cache.put(PROFILE, PREFERENCE, UNITS, get_coords(0), get_response(0))
+    directions_cache.put(PROFILE, PREFERENCE, UNITS, COORDS, {"routes": ["x" * 20 * entry_size]})
+    stats = directions_cache.get_stats()
+    assert (stats["entries"], stats["total_size"]) == (9, 9 * entry_size)
+
+
+def test_reads_dont_wait_for_a_writer(tmp_path):
+    cache_file_path = str(tmp_path / "cache.sqlite")
+    writing_directions_cache = DirectionsCache(cache_file_path)
+    writing_directions_cache.put(PROFILE, PREFERENCE, UNITS, COORDS, get_response(1))
+    reading_directions_cache = DirectionsCache(cache_file_path)
+    reading_directions_cache._get_connection().execute("PRAGMA busy_timeout = 0")
+    connection = writing_directions_cache._get_connection()
+    connection.execute("BEGIN IMMEDIATE")
+    connection.execute("DELETE FROM directions")
+
+    # The other connection still sees the last committed state while the write lock is held
+    assert reading_directions_cache.get(PROFILE, PREFERENCE, UNITS, COORDS) == get_response(1)
+    connection.execute("COMMIT")
+    assert reading_directions_cache.get(PROFILE, PREFERENCE, UNITS, COORDS) is None
+
+
+def write_and_read_entries(directions_cache: DirectionsCache, process_index: int) -> int:
+    # Writes its own entries and reads the ones of all processes while they are being written.
+    # Returns the number of hits
+    for entry_index in range(NUM_ENTRIES_PER_PROCESS):
+        own_index = process_index * NUM_ENTRIES_PER_PROCESS + entry_index
+        directions_cache.put(
+            PROFILE, PREFERENCE, UNITS, get_coords(own_index), get_response(own_index)
+        )
+        for other_process_index in range(NUM_PROCESSES):
+            index = other_process_index * NUM_ENTRIES_PER_PROCESS + entry_index
+            response = directions_cache.get(PROFILE, PREFERENCE, UNITS, get_coords(index))
+            if index == own_index:
+                assert response == get_response(index)
+            else:
+                assert response is None or response == get_response(index)
+    directions_cache.close()
+    return directions_cache.hits
+
+
+def test_concurrent_reads_and_writes(tmp_path):
+    directions_cache = DirectionsCache(str(tmp_path / "cache.sqlite"))
+    with ProcessPoolExecutor(NUM_PROCESSES) as executor:
+        num_hits = list(
+            executor.map(
+                write_and_read_entries, [directions_cache] * NUM_PROCESSES, range(NUM_PROCESSES)
+            )
+        )
+
+    # Nothing got lost, neither entries nor counts
+    num_entries = NUM_PROCESSES * NUM_ENTRIES_PER_PROCESS
+    entry_size = len(json.dumps(get_response(0), separators=(",", ":")))
+    stats = directions_cache.get_stats()
+    assert (stats["entries"], stats["total_size"]) == (num_entries, num_entries * entry_size)
+    assert stats["hits"] == sum(num_hits)
+    assert stats["hits"] + stats["misses"] == num_entries * NUM_PROCESSES
+    for index in range(num_entries):
+        response = directions_cache.get(PROFILE, PREFERENCE, UNITS, get_coords(index))
+        assert response == get_response(index)
@@ -0,0 +1,178 @@
+import math
+import datetime
+import numpy as np
+
+from openrouteservice import convert
+
+from src.models import Position, DailyRoute
+from src.lib.geometry import haversine_distance_m
+from src.lib.schedule import generate_schedule
+from src.lib.generating_routes import (
+    generate_daily_routes_sequentially,
+    get_default_chunk_size,
+    iter_daily_routes_parallel,
+    plan_daily_route_for_person,
+    route_template_from_directions,
+)
+from tests.helpers import (
+    StubDirectionsClient,
+    generate_population,
+    get_people,
+    load_example_directions,
+)
+
+START_DATE = datetime.date(2023, 4, 3)
+
+
+def get_example_daily_route() -> (dict, list, DailyRoute):
+    # The example route densified from its home, timed as travel time without any stays
+    directions = load_example_directions()
+    geometry = convert.decode_polyline(directions["routes"][0]["geometry"])["coordinates"]
+    home_longitude, home_latitude = geometry[0]
+    route_template = route_template_from_directions(
+        Position(home_latitude, home_longitude), 3, directions
+    )
+    return directions, geometry, route_template.to_daily_route(0.0, [0.0, 0.0])
+
+
+def test_one_directions_request_per_chain_of_routes():
+    people = generate_population(1, 4)
+    ors_client = StubDirectionsClient()
+    generate_daily_routes_sequentially(START_DATE, 7, people, ors_client, seed=1)
+
+    # The whole day of a person is requested at once, never a single pair of waypoints. Days with
+    # the same chain of routes share the request
+    schedule = generate_schedule(people, START_DATE, 7, 1)
+    planned_coords = {
+        tuple(plan_daily_route_for_person(person, schedule, person_index, day_index)[0])
+        for person_index, person in enumerate(people)
+        for day_index in range(7)
+    }
+    assert sorted(tuple(coords) for coords in ors_client.requests) == sorted(planned_coords)
+    for person in people:
+        assert len(person.get_all_routes()) == 7
+
+
+def test_densified_route_keeps_step_durations():
+    directions, _, daily_route = get_example_daily_route()
+    timestamps = np.asarray(daily_route.get_timestamps())
+    assert np.all(np.diff(timestamps) >= 0)
+    total_duration = sum(
+        step["duration"]
+        for segment in directions["routes"][0]["segments"]
+        for step in segment["steps"]
+    )
+    assert math.isclose(timestamps[-1] - timestamps[0], total_duration)
+
+
+def test_step_way_points_are_timed_by_their_step():
+    # The last waypoint of every step is reached when all steps up to it are done
+    directions, geometry, daily_route = get_example_daily_route()
+    waypoints = list(
+        zip(daily_route.get_longitudes(), daily_route.get_latitudes(), daily_route.get_timestamps())
+    )
+    travel_time = 0.0
+    for segment in directions["routes"][0]["segments"]:
+        for step in segment["steps"]:
+            first_index, last_index = step["way_points"]
+            travel_time += step["duration"]
+            if first_index == last_index or geometry[last_index] == geometry[last_index - 1]:
+                continue
+            longitude, latitude = geometry[last_index]
+            assert any(
+                math.isclose(waypoint_longitude, longitude)
+                and math.isclose(waypoint_latitude, latitude)
+                and math.isclose(timestamp, travel_time)
+                for waypoint_longitude, waypoint_latitude, timestamp in waypoints
+            )
+    # All waypoints are on the geometry
+    geometry_points = {tuple(point) for point in geometry}
+    assert all((longitude, latitude) in geometry_points for longitude, latitude, _ in waypoints)
+
+
+def test_parallel_generation_yields_every_daily_route_once():
+    people = get_people(4)
+    generated_tasks = [
+        (person.id, day_index)
+        for person, day_index, _ in iter_daily_routes_parallel(
+            START_DATE, 3, people, StubDirectionsClient(), num_processes=2, chunk_size=2
+        )
+    ]
+    assert sorted(generated_tasks) == [
+        (person.id, day_index) for person in people for day_index in range(3)
+    ]
+
+
+def test_default_chunk_size():
+    # All days of a person in one chunk if there are enough people, smaller chunks otherwise
+    assert get_default_chunk_size(1000, 7, 8) == 7
+    assert 1 <= get_default_chunk_size(2, 7, 8) < 7
+
+
+def densify_step_by_step(directions: dict, geometry: list) -> list:
+    # The loop over the steps and waypoints that the array operations replaced, as
+    # (latitude, longitude, travel time) of every waypoint
+    home_longitude, home_latitude = geometry[0]
+    waypoints = [(home_latitude, home_longitude, 0.0)]
+    travel_time = 0.0
+    for segment in directions["routes"][0]["segments"]:
+        for step in segment["steps"]:
+            first_index, last_index = step["way_points"]
+            if first_index == last_index:
+                continue
+            step_geometry = geometry[first_index : last_index + 1]
+            distances = [
+                haversine_distance_m(previous_point[1], previous_point[0], point[1], point[0])
+                for previous_point, point in zip(step_geometry, step_geometry[1:])
+            ]
+            for (longitude, latitude), distance in zip(step_geometry[1:], distances):
+                if sum(distances) > 0:
+                    travel_time += step["duration"] * distance / sum(distances)
+                else:
+                    travel_time += step["duration"] / len(distances)
+                last_latitude, last_longitude, _ = waypoints[-1]
+                if not (
+                    math.isclose(latitude, last_latitude)
+                    and math.isclose(longitude, last_longitude)
+                ):
+                    waypoints.append((latitude, longitude, travel_time))
+    return waypoints
+
+
+def test_densifying_matches_the_step_by_step_loop():
+    directions, geometry, daily_route = get_example_daily_route()
+    expected_waypoints = np.array(densify_step_by_step(directions, geometry))
+    assert len(daily_route) == len(expected_waypoints)
+    np.testing.assert_allclose(daily_route.get_latitudes(), expected_waypoints[:, 0], rtol=1e-12)
+    np.testing.assert_allclose(daily_route.get_longitudes(), expected_waypoints[:, 1], rtol=1e-12)
+    np.testing.assert_allclose(
+        daily_route.get_timestamps(), expected_waypoints[:, 2], rtol=1e-9, atol=1e-6
+    )
+
+
+def test_new_waypoint_mask_matches_isclose():
+    # Duplicates, almost duplicates and points that are just too far apart to be the same
+    latitudes = np.array([52.2, 52.2, 52.2 + 1e-12, 52.2 + 1e-6, 52.3, 52.3, 52.2])
+    longitudes = np.array([8.0, 8.0, 8.0, 8.0, 8.1, 8.1 + 1e-7, 8.0])
+    daily_route = DailyRoute()
+    assert daily_route.get_new_waypoint_mask(latitudes, longitudes).tolist() == [
+        True,
+        False,
+        False,
+        True,
+        True,
+        True,
+        True,
+    ]
+    daily_route.add_waypoints([52.2], [8.0], [0.0])
+    is_new_waypoint = daily_route.get_new_waypoint_mask(latitudes, longitudes)
+    expected_is_new_waypoint = [
+        not (
+            math.isclose(latitude, previous_latitude)
+            and math.isclose(longitude, previous_longitude)
+        )
+        for latitude, longitude, previous_latitude, previous_longitude in zip(
+            latitudes, longitudes, np.append(52.2, latitudes[:-1]), np.append(8.0, longitudes[:-1])
+        )
+    ]
+    assert is_new_waypoint.tolist() == expected_is_new_waypoint
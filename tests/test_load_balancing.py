@@ -0,0 +1,177 @@
+import time
+import pytest
+
+from openrouteservice import exceptions as ors_exceptions
+
+from src.lib import load_balancing
+from src.lib.load_balancing import (
+    CONCURRENCY_DECREASE_COOLDOWN_SECONDS,
+    HEALTH_CHECK_INTERVAL_SECONDS,
+    INITIAL_CONCURRENCY,
+    MIN_CONCURRENCY,
+    LoadBalancedORSClient,
+    NoBackendAvailableError,
+)
+
+COORDS = [[8.047635, 52.2719595], [8.0512, 52.2801]]
+RESPONSE = {"routes": [{"summary": {"distance": 1000.0, "duration": 100.0}}]}
+
+
+class FakeBackendClient:
+    # Raises the given errors one after the other, then answers every request
+    def __init__(self):
+        self.errors = list()
+        self.num_requests = 0
+
+    def directions(self, coords, profile: str, preference: str, units: str, **kwargs) -> dict:
+        self.num_requests += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return RESPONSE
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> FakeClock:
+    clock = FakeClock()
+    monkeypatch.setattr(load_balancing, "time", clock)
+    return clock
+
+
+def get_load_balanced_client(num_backends: int, **kwargs) -> LoadBalancedORSClient:
+    # Without any network access: The backends are fake and healthy unless they are marked down
+    ors_client = LoadBalancedORSClient(
+        [f"http://ors-{backend_index}:8080/ors" for backend_index in range(num_backends)], **kwargs
+    )
+    ors_client.backend_clients = [FakeBackendClient() for _ in range(num_backends)]
+    ors_client.down_backend_indexes = set()
+    ors_client._get_client = lambda backend_index: ors_client.backend_clients[backend_index]
+    ors_client.is_backend_healthy = (
+        lambda backend_index: backend_index not in ors_client.down_backend_indexes
+    )
+    return ors_client
+
+
+def request_directions(ors_client: LoadBalancedORSClient) -> dict:
+    return ors_client.directions(COORDS, profile="foot-walking", preference="fastest")
+
+
+def test_backend_with_the_least_load_is_chosen():
+    ors_client = get_load_balanced_client(2, acquire_timeout_seconds=0.1)
+    ors_client._set(1, "concurrency_limit", INITIAL_CONCURRENCY / 2)
+    # Outstanding requests relative to the concurrency limit, the first backend wins ties
+    acquired_backend_indexes = [ors_client._acquire_backend() for _ in range(6)]
+    assert acquired_backend_indexes == [0, 1, 0, 0, 1, 0]
+    assert [stats["outstanding_requests"] for stats in ors_client.get_stats()] == [4, 2]
+
+    # Both backends are at their limit
+    with pytest.raises(NoBackendAvailableError):
+        ors_client._acquire_backend()
+    ors_client._release_backend(1, 0.1, None)
+    assert ors_client._acquire_backend() == 1
+
+
+def test_responses_are_counted_and_raise_the_limit():
+    ors_client = get_load_balanced_client(1)
+    assert request_directions(ors_client) == RESPONSE
+    stats = ors_client.get_stats()[0]
+    assert (stats["outstanding_requests"], stats["num_requests"], stats["num_errors"]) == (0, 1, 0)
+    assert stats["concurrency_limit"] == round(INITIAL_CONCURRENCY + 1 / INITIAL_CONCURRENCY, 2)
+
+
+def test_transient_errors_halve_the_limit_once_per_cooldown(clock):
+    ors_client = get_load_balanced_client(1)
+    backend_client = ors_client.backend_clients[0]
+    backend_client.errors = [ors_exceptions.ApiError(503)] * 5
+
+    # Requests that fail together only count once
+    for _ in range(2):
+        with pytest.raises(ors_exceptions.ApiError):
+            request_directions(ors_client)
+    assert ors_client._get(0, "concurrency_limit") == INITIAL_CONCURRENCY / 2
+
+    clock.now += CONCURRENCY_DECREASE_COOLDOWN_SECONDS
+    with pytest.raises(ors_exceptions.ApiError):
+        request_directions(ors_client)
+    assert ors_client._get(0, "concurrency_limit") == INITIAL_CONCURRENCY / 4
+
+    # Never below the minimum
+    for _ in range(2):
+        clock.now += CONCURRENCY_DECREASE_COOLDOWN_SECONDS
+        with pytest.raises(ors_exceptions.ApiError):
+            request_directions(ors_client)
+    assert ors_client._get(0, "concurrency_limit") == MIN_CONCURRENCY
+    stats = ors_client.get_stats()[0]
+    assert (stats["healthy"], stats["num_requests"], stats["num_errors"]) == (True, 5, 5)
+    assert stats["outstanding_requests"] == 0
+
+
+def test_errors_about_the_request_dont_lower_the_limit(clock):
+    ors_client = get_load_balanced_client(1)
+    ors_client.backend_clients[0].errors = [
+        ors_exceptions.ApiError(400, "Invalid coordinates"),
+        ValueError("Bug"),
+    ]
+    for error_type in (ors_exceptions.ApiError, ValueError):
+        with pytest.raises(error_type):
+            request_directions(ors_client)
+    stats = ors_client.get_stats()[0]
+    assert stats["concurrency_limit"] == INITIAL_CONCURRENCY
+    assert (stats["healthy"], stats["num_errors"], stats["outstanding_requests"]) == (True, 0, 0)
+
+
+def test_timed_out_backend_is_left_alone_until_it_is_healthy(clock):
+    ors_client = get_load_balanced_client(2)
+    ors_client.backend_clients[0].errors = [ors_exceptions.Timeout()]
+    with pytest.raises(ors_exceptions.Timeout):
+        request_directions(ors_client)
+    assert [stats["healthy"] for stats in ors_client.get_stats()] == [False, True]
+
+    # All requests go to the other backend meanwhile, even if it is busier
+    ors_client.down_backend_indexes.add(0)
+    for _ in range(3):
+        request_directions(ors_client)
+    assert [backend.num_requests for backend in ors_client.backend_clients] == [1, 3]
+
+    # A failed health check keeps it out for another interval
+    clock.now += HEALTH_CHECK_INTERVAL_SECONDS
+    request_directions(ors_client)
+    assert [stats["healthy"] for stats in ors_client.get_stats()] == [False, True]
+
+    # Once it is healthy, it starts over with the lowest limit
+    ors_client.down_backend_indexes.clear()
+    clock.now += HEALTH_CHECK_INTERVAL_SECONDS
+    assert ors_client._acquire_backend() == 0
+    assert ors_client.get_stats()[0]["healthy"]
+    assert ors_client._get(0, "concurrency_limit") == MIN_CONCURRENCY
+
+
+def test_no_backend_available_after_the_deadline():
+    ors_client = get_load_balanced_client(2, acquire_timeout_seconds=0.2)
+    for backend_index in range(2):
+        ors_client._set(backend_index, "unhealthy_until", time.time() + 60)
+    start_time = time.time()
+    with pytest.raises(NoBackendAvailableError):
+        request_directions(ors_client)
+    assert 0.2 <= time.time() - start_time < 5
+    assert [backend.num_requests for backend in ors_client.backend_clients] == [0, 0]
+
+
+def test_outstanding_requests_of_dead_workers_are_reset():
+    ors_client = get_load_balanced_client(2, acquire_timeout_seconds=0.1)
+    # Requests that were acquired by processes that died before releasing them
+    for _ in range(2 * INITIAL_CONCURRENCY):
+        ors_client._acquire_backend()
+    with pytest.raises(NoBackendAvailableError):
+        ors_client._acquire_backend()
+
+    ors_client.reset_outstanding_requests()
+    assert [stats["outstanding_requests"] for stats in ors_client.get_stats()] == [0, 0]
+    assert request_directions(ors_client) == RESPONSE
@@ -0,0 +1,172 @@
+import pickle
+import datetime
+import numpy as np
+import pytest
+
+from src.lib.local_routing import (
+    STEP_TYPE_ARRIVE,
+    STEP_TYPE_DEPART,
+    LocalRoutingEngine,
+    RoadGraph,
+    RoutingBackend,
+    RoutingError,
+)
+from src.lib.generating_routes import (
+    decode_route_geometry,
+    generate_daily_routes_sequentially,
+    iter_daily_routes_parallel,
+)
+from tests.helpers import get_grid_routing_engine, generate_population
+
+# OSM node id -> (latitude, longitude)
+NODE_COORDINATES = {
+    1: (52.200, 8.000),
+    2: (52.200, 8.010),
+    3: (52.210, 8.010),
+    4: (52.220, 8.010),
+    5: (52.220, 8.020),
+    # Not connected to the others
+    6: (52.250, 8.050),
+    7: (52.250, 8.060),
+}
+WAYS = [
+    # The fast way from 1 to 3 goes around the corner, the short way is slow
+    ([1, 2, 3], {"highway": "primary", "name": "Main Street"}),
+    ([1, 3], {"highway": "living_street", "name": "Shortcut"}),
+    # 4 can be reached from 3, but not the other way around
+    ([3, 4], {"highway": "residential", "name": "One Way", "oneway": "yes"}),
+    ([4, 5], {"highway": "residential", "name": "Dead End"}),
+    ([6, 7], {"highway": "residential", "name": "Island"}),
+]
+
+
+@pytest.fixture
+def engine() -> LocalRoutingEngine:
+    return LocalRoutingEngine(road_graph=RoadGraph.from_ways(NODE_COORDINATES, WAYS))
+
+
+def get_coords(*osm_node_ids) -> list:
+    # (lon, lat) pairs, like ORS expects them
+    return [NODE_COORDINATES[osm_node_id][::-1] for osm_node_id in osm_node_ids]
+
+
+def get_geometry(directions: dict) -> list:
+    return [tuple(point) for point in decode_route_geometry(directions["routes"][0]["geometry"])]
+
+
+def test_routing_backend_is_abstract():
+    with pytest.raises(TypeError):
+        RoutingBackend()
+
+
+def test_find_nearest_node(engine):
+    for latitude, longitude in NODE_COORDINATES.values():
+        node_index = engine.find_nearest_node(latitude + 0.0004, longitude - 0.0003)
+        road_graph = engine._road_graph
+        assert road_graph.node_latitudes[node_index] == latitude
+        assert road_graph.node_longitudes[node_index] == longitude
+    with pytest.raises(RoutingError):
+        engine.find_nearest_node(53.0, 9.0)
+
+
+def test_fastest_and_shortest_paths(engine):
+    fastest_directions = engine.directions(get_coords(1, 3), "driving-car", "fastest")
+    assert get_geometry(fastest_directions) == get_coords(1, 2, 3)
+    shortest_directions = engine.directions(get_coords(1, 3), "driving-car", "shortest")
+    assert get_geometry(shortest_directions) == get_coords(1, 3)
+    fastest_summary = fastest_directions["routes"][0]["summary"]
+    shortest_summary = shortest_directions["routes"][0]["summary"]
+    assert fastest_summary["duration"] < shortest_summary["duration"]
+    assert fastest_summary["distance"] > shortest_summary["distance"]
+
+
+def test_oneway_and_unreachable_nodes(engine):
+    assert get_geometry(engine.directions(get_coords(1, 5), "driving-car", "fastest")) == (
+        get_coords(1, 2, 3, 4, 5)
+    )
+    with pytest.raises(RoutingError):
+        engine.directions(get_coords(5, 1), "driving-car", "fastest")
+    with pytest.raises(RoutingError):
+        engine.directions(get_coords(1, 6), "driving-car", "fastest")
+
+
+def test_response_has_the_shape_of_ors(engine):
+    coords = get_coords(1, 3, 5)
+    directions = engine.directions(coords, "driving-car", "fastest", units="km")
+    route = directions["routes"][0]
+    geometry = decode_route_geometry(route["geometry"])
+    assert len(route["segments"]) == len(coords) - 1
+    assert route["way_points"][0] == 0 and route["way_points"][-1] == len(geometry) - 1
+    for segment, first_index, last_index in zip(
+        route["segments"], route["way_points"], route["way_points"][1:]
+    ):
+        steps = segment["steps"]
+        assert steps[0]["type"] == STEP_TYPE_DEPART
+        assert steps[-1]["type"] == STEP_TYPE_ARRIVE
+        assert steps[-1]["way_points"] == [last_index, last_index]
+        # The steps cover the segment without gaps
+        assert steps[0]["way_points"][0] == first_index
+        for step, next_step in zip(steps, steps[1:]):
+            assert step["way_points"][1] == next_step["way_points"][0]
+        assert segment["duration"] == pytest.approx(sum(step["duration"] for step in steps))
+        assert segment["distance"] == pytest.approx(sum(step["distance"] for step in steps))
+    assert route["summary"]["distance"] == pytest.approx(
+        sum(segment["distance"] for segment in route["segments"])
+    )
+    # From 1 to 3 is about 1.8 km around the corner
+    assert 1.5 < route["segments"][0]["distance"] < 2.0
+    assert directions["metadata"]["query"]["units"] == "km"
+
+
+def test_route_to_the_same_node(engine):
+    directions = engine.directions(get_coords(1, 1), "driving-car", "fastest")
+    route = directions["routes"][0]
+    # Like ORS, a geometry of two points without a summary
+    assert get_geometry(directions) == get_coords(1, 1)
+    assert route["summary"] == {}
+    assert route["way_points"] == [0, 1]
+    assert [step["type"] for step in route["segments"][0]["steps"]] == [STEP_TYPE_ARRIVE]
+
+
+def test_geometry_round_trip(engine):
+    directions = engine.directions(get_coords(1, 5), "driving-car", "fastest")
+    geometry = decode_route_geometry(directions["routes"][0]["geometry"])
+    np.testing.assert_array_equal(geometry, np.array(get_coords(1, 2, 3, 4, 5)))
+    # The same as a GeoJSON geometry
+    np.testing.assert_array_equal(decode_route_geometry(geometry.tolist()), geometry)
+
+
+def test_engine_is_picklable_without_prepared_state(engine, tmp_path):
+    engine.directions(get_coords(1, 3), "driving-car", "fastest")
+    copied_engine = pickle.loads(pickle.dumps(engine))
+    assert not copied_engine._is_prepared
+    assert get_geometry(copied_engine.directions(get_coords(1, 3), "driving-car", "fastest")) == (
+        get_coords(1, 2, 3)
+    )
+
+    engine._road_graph.save(tmp_path / "graph.npz")
+    loaded_engine = LocalRoutingEngine(str(tmp_path / "graph.npz"))
+    assert get_geometry(loaded_engine.directions(get_coords(1, 5), "driving-car", "fastest")) == (
+        get_coords(1, 2, 3, 4, 5)
+    )
+
+
+def test_parallel_and_sequential_generation_give_the_same_routes():
+    start_date = datetime.date(2023, 4, 3)
+    routing_engine = get_grid_routing_engine()
+    people = generate_population(1, 4)
+    generate_daily_routes_sequentially(start_date, 3, people, routing_engine, seed=1)
+
+    parallel_daily_routes = {
+        (person.id, day_index): daily_route
+        for person, day_index, daily_route in iter_daily_routes_parallel(
+            start_date, 3, generate_population(1, 4), routing_engine, num_processes=2, seed=1
+        )
+    }
+    assert len(parallel_daily_routes) == len(people) * 3
+    for person in people:
+        for day_index, daily_route in enumerate(person.get_all_routes()):
+            timestamps = np.asarray(daily_route.get_timestamps())
+            assert len(timestamps) > 1
+            assert np.all(np.diff(timestamps) >= 0)
+            assert daily_route.to_dict() == parallel_daily_routes[(person.id, day_index)].to_dict()
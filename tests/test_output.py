@@ -0,0 +1,70 @@
+import json
+import pytest
+
+from src.models import DailyRoute
+from src.lib.output import JsonLinesRouteWriter, convert_json_lines_to_dataset
+from src.lib.columnar_store import ColumnarRouteWriter, convert_columnar_store_to_dataset
+from src.lib.segment_store import SegmentRouteWriter, convert_segment_store_to_dataset
+
+OUTPUT_FORMATS = [
+    ("routes.jsonl", JsonLinesRouteWriter, convert_json_lines_to_dataset),
+    ("routes.columnar", ColumnarRouteWriter, convert_columnar_store_to_dataset),
+    ("routes.segments", SegmentRouteWriter, convert_segment_store_to_dataset),
+]
+NUM_PEOPLE = 3
+
+
+def get_daily_route(person_id: int, day_index: int) -> DailyRoute:
+    daily_route = DailyRoute()
+    # Rounded like the coordinates of a segment store
+    timestamp = 1680000000.0 + 86400 * day_index
+    daily_route.add_waypoints(
+        [round(52.2 + person_id * 0.01, 7), 52.21],
+        [8.0, round(8.0 + day_index * 0.01, 7)],
+        [timestamp, timestamp + 60],
+    )
+    return daily_route
+
+
+def convert(tmp_path, file_name, writer_class, convert_to_dataset, day_indexes, num_days=None):
+    output_path = tmp_path / file_name
+    with writer_class(output_path) as route_writer:
+        for person_id in range(NUM_PEOPLE):
+            route_writer.write_person_info({"id": person_id})
+        for day_index in day_indexes:
+            for person_id in reversed(range(NUM_PEOPLE)):
+                route_writer.write_daily_route(
+                    person_id, day_index, get_daily_route(person_id, day_index)
+                )
+    convert_to_dataset(output_path, tmp_path / "dataset.json", num_days)
+    with open(tmp_path / "dataset.json", "r") as dataset_file:
+        return json.load(dataset_file)
+
+
+def get_expected_day(day_index: int) -> list:
+    expected_day = list()
+    for person_id in range(NUM_PEOPLE):
+        daily_route_info = get_daily_route(person_id, day_index).to_dict()
+        daily_route_info["person"] = person_id
+        expected_day.append(daily_route_info)
+    return expected_day
+
+
+@pytest.mark.parametrize("file_name, writer_class, convert_to_dataset", OUTPUT_FORMATS)
+def test_convert_to_dataset(tmp_path, file_name, writer_class, convert_to_dataset):
+    dataset = convert(tmp_path, file_name, writer_class, convert_to_dataset, [0, 1])
+    assert dataset["people"] == [{"id": person_id} for person_id in range(NUM_PEOPLE)]
+    assert dataset["daily_routes"] == [get_expected_day(0), get_expected_day(1)]
+
+
+@pytest.mark.parametrize("file_name, writer_class, convert_to_dataset", OUTPUT_FORMATS)
+def test_convert_to_dataset_with_missing_days(
+    tmp_path, file_name, writer_class, convert_to_dataset
+):
+    # None of the daily routes of day 1 and of the last day 3 could be generated
+    dataset = convert(tmp_path, file_name, writer_class, convert_to_dataset, [0, 2], num_days=4)
+    assert dataset["daily_routes"] == [get_expected_day(0), [], get_expected_day(2), []]
+
+    # Without the number of days, all days up to the last one with daily routes are there
+    dataset = convert(tmp_path, file_name, writer_class, convert_to_dataset, [0, 2])
+    assert dataset["daily_routes"] == [get_expected_day(0), [], get_expected_day(2)]
@@ -0,0 +1,69 @@
+import json
+
+from geojson import Point
+
+from src.lib import points_of_interest
+from src.lib.points_of_interest import (
+    POI_TILE_SIZE_DEGREES,
+    get_tile,
+    get_tiles_in_bounding_box,
+    get_filters_key,
+    iter_all_pois,
+)
+
+PLACES_INFO = {
+    "100": {"Name": "Shops", "IsGroupID": True, "WorkInfo": {}, "FreeTimeActivityInfo": {}},
+    "101": {
+        "Name": "Bakery",
+        "IsGroupID": False,
+        "WorkInfo": {"MaxWorkers": 5, "StartTimeFrom": 5, "StartTimeTo": 6},
+        "FreeTimeActivityInfo": {"TypicalStayDurationHours": 0.5},
+    },
+}
+FILTERS = {"category_group_ids": [100], "category_ids": [101]}
+CENTER_LATITUDE, CENTER_LONGITUDE = 52.27, 8.05
+
+
+def get_feature(latitude: float, longitude: float, properties: dict) -> dict:
+    return {
+        "type": "Feature",
+        "geometry": {"type": "Point", "coordinates": [longitude, latitude]},
+        "properties": properties,
+    }
+
+
+def test_tiles_cover_the_bounding_box():
+    south, west, north, east = 52.205, 7.955, 52.295, 8.145
+    tiles = get_tiles_in_bounding_box(south, west, north, east)
+    assert len(tiles) == len(set(tiles))
+    for latitude in (south, north, (south + north) / 2):
+        for longitude in (west, east, (west + east) / 2):
+            assert get_tile(latitude, longitude) in tiles
+    # No tile lies completely outside
+    for tile_x, tile_y in tiles:
+        assert west - POI_TILE_SIZE_DEGREES < tile_x * POI_TILE_SIZE_DEGREES < east
+        assert south - POI_TILE_SIZE_DEGREES < tile_y * POI_TILE_SIZE_DEGREES < north
+
+
+def test_cached_tiles_are_read_and_deduplicated(tmp_path, monkeypatch):
+    # Every tile around the center returns the same POIs, like POIs on the border of tiles are
+    # returned for all of them. The POI that is far away is outside of the square
+    features = [
+        get_feature(CENTER_LATITUDE, CENTER_LONGITUDE, {"osm_type": 1, "osm_id": 7}),
+        get_feature(CENTER_LATITUDE + 0.001, CENTER_LONGITUDE, {}),
+        get_feature(CENTER_LATITUDE + 1.0, CENTER_LONGITUDE, {"osm_type": 1, "osm_id": 8}),
+    ]
+    tile_cache_directory = tmp_path / get_filters_key(FILTERS)
+    tile_cache_directory.mkdir()
+    for tile in get_tiles_in_bounding_box(52.2, 7.95, 52.35, 8.15):
+        with open(tile_cache_directory / f"{tile[0]}_{tile[1]}.json", "w") as tile_cache_file:
+            json.dump({"type": "FeatureCollection", "features": features}, tile_cache_file)
+
+    def fetch_pois_in_tile(tile, filters, cache_file_path):
+        raise AssertionError(f"Tile {tile} should have been read from the cache")
+
+    monkeypatch.setattr(points_of_interest, "fetch_pois_in_tile", fetch_pois_in_tile)
+    pois = list(
+        iter_all_pois(Point((CENTER_LONGITUDE, CENTER_LATITUDE)), PLACES_INFO, 1.0, tmp_path)
+    )
+    assert pois == features[:2]
@@ -0,0 +1,39 @@
+import json
+import random
+import pytest
+
+from pathlib import Path
+from openrouteservice import convert
+
+from src.lib.polyline import encode_polyline, decode_polyline
+
+EXAMPLE_ROUTE_FILE_PATH = Path(__file__).parent.parent / "openrouteservice_example_route.json"
+
+
+def test_decode_polyline_matches_openrouteservice():
+    with open(EXAMPLE_ROUTE_FILE_PATH, "r") as example_route_file:
+        encoded_polyline = json.load(example_route_file)["routes"][0]["geometry"]
+    expected_coordinates = convert.decode_polyline(encoded_polyline)["coordinates"]
+    coordinates = decode_polyline(encoded_polyline)
+    assert coordinates.tolist() == expected_coordinates
+
+
+def test_decode_polyline_matches_openrouteservice_on_random_coordinates():
+    # Both signs and large jumps, which need more chunks per value
+    random_generator = random.Random(1)
+    coords = [
+        (random_generator.uniform(-180, 180), random_generator.uniform(-90, 90)) for _ in range(500)
+    ]
+    encoded_polyline = encode_polyline(coords)
+    expected_coordinates = convert.decode_polyline(encoded_polyline)["coordinates"]
+    assert decode_polyline(encoded_polyline).tolist() == expected_coordinates
+
+
+def test_decode_empty_polyline():
+    assert decode_polyline("").shape == (0, 2)
+
+
+def test_decode_truncated_polyline():
+    encoded_polyline = encode_polyline([(8.0, 52.0), (8.1, 52.1)])
+    with pytest.raises(ValueError):
+        decode_polyline(encoded_polyline[:-1])
@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+from src.models import DailyRoute
+from src.lib.geometry import haversine_distances_m
+from src.lib.resampling import resample_by_time, resample_by_distance, resample_daily_route
+
+# Home -> work, an hour at work, work -> home. The timestamps are multiples of 10 seconds
+LATITUDES = np.array([52.20, 52.21, 52.22, 52.22, 52.21, 52.20])
+LONGITUDES = np.array([8.00, 8.01, 8.01, 8.01, 8.01, 8.00])
+TIMESTAMPS = np.array([0.0, 120.0, 200.0, 3800.0, 3900.0, 4020.0]) + 1680000000.0
+
+
+def test_resample_by_time_keeps_waypoints_and_timestamps():
+    latitudes, longitudes, timestamps = resample_by_time(LATITUDES, LONGITUDES, TIMESTAMPS, 10)
+    np.testing.assert_array_equal(timestamps, np.arange(TIMESTAMPS[0], TIMESTAMPS[-1] + 1, 10))
+    # Every waypoint is sampled exactly, including the first and the last one
+    waypoint_indexes = np.searchsorted(timestamps, TIMESTAMPS)
+    np.testing.assert_allclose(latitudes[waypoint_indexes], LATITUDES, rtol=0, atol=1e-12)
+    np.testing.assert_allclose(longitudes[waypoint_indexes], LONGITUDES, rtol=0, atol=1e-12)
+
+
+def test_resample_by_time_holds_the_position_during_stays():
+    latitudes, longitudes, timestamps = resample_by_time(LATITUDES, LONGITUDES, TIMESTAMPS, 10)
+    is_staying = (timestamps >= TIMESTAMPS[2]) & (timestamps <= TIMESTAMPS[3])
+    assert is_staying.sum() == 361
+    assert np.all(latitudes[is_staying] == LATITUDES[2])
+    assert np.all(longitudes[is_staying] == LONGITUDES[2])
+
+    _, _, moving_timestamps = resample_by_time(
+        LATITUDES, LONGITUDES, TIMESTAMPS, 10, include_stays=False
+    )
+    # Only the moment of arrival is left of the stay, the person sets off again near its end
+    is_staying = (moving_timestamps > TIMESTAMPS[2]) & (moving_timestamps < TIMESTAMPS[3] - 600)
+    assert not is_staying.any()
+    assert TIMESTAMPS[2] in moving_timestamps
+    assert moving_timestamps[-1] == TIMESTAMPS[-1]
+
+
+def test_resample_by_time_stays_within_the_route():
+    timestamps = TIMESTAMPS + 3.5
+    _, _, sampled_timestamps = resample_by_time(LATITUDES, LONGITUDES, timestamps, 7)
+    assert timestamps[0] <= sampled_timestamps[0] < timestamps[0] + 7
+    assert timestamps[-1] - 7 < sampled_timestamps[-1] <= timestamps[-1]
+    assert np.all(sampled_timestamps % 7 == 0)
+
+
+def test_resample_by_distance_keeps_the_start_and_the_timestamps_in_order():
+    latitudes, longitudes, timestamps = resample_by_distance(LATITUDES, LONGITUDES, TIMESTAMPS, 50)
+    assert (latitudes[0], longitudes[0], timestamps[0]) == (
+        LATITUDES[0],
+        LONGITUDES[0],
+        TIMESTAMPS[0],
+    )
+    assert np.all(np.diff(timestamps) >= 0)
+    assert TIMESTAMPS[0] <= timestamps[-1] <= TIMESTAMPS[-1]
+    # Consecutive samples are the interval apart along the route, up to the difference between
+    # interpolating the coordinates linearly and the great circle
+    distances = haversine_distances_m(latitudes, longitudes)
+    assert np.max(distances) == pytest.approx(50, rel=1e-3)
+    total_distance = haversine_distances_m(LATITUDES, LONGITUDES).sum()
+    assert len(timestamps) == int(total_distance // 50) + 1
+
+
+def test_resample_daily_route_needs_exactly_one_interval():
+    daily_route = DailyRoute()
+    daily_route.add_waypoints(LATITUDES, LONGITUDES, TIMESTAMPS)
+    with pytest.raises(ValueError):
+        resample_daily_route(daily_route)
+    with pytest.raises(ValueError):
+        resample_daily_route(daily_route, interval_seconds=10, interval_meters=50)
+    resampled_daily_route = resample_daily_route(daily_route, interval_seconds=10)
+    assert len(resampled_daily_route) == 403
+    assert resampled_daily_route.get_timestamps()[-1] == TIMESTAMPS[-1]
@@ -0,0 +1,99 @@
+from src.lib.geometry import haversine_distance_m
+from src.lib.residential_buildings import (
+    TILE_SIZE_DEGREES,
+    get_all_residential_buildings,
+    get_tile,
+    get_tiles_in_radius,
+)
+
+CENTER_LATITUDE, CENTER_LONGITUDE = 52.27, 8.05
+SQUARE_LENGTH_KM = 1.5
+
+
+class FakeOverpassAPI:
+    # Answers every query with the buildings in its bounding box, like Overpass does with the
+    # buildings on its border as well
+    def __init__(self, buildings: list):
+        # buildings: List of (OSM id, latitude, longitude)
+        self.buildings = buildings
+        self.queries = list()
+        self.returned_osm_ids = list()
+
+    def Get(self, query: str, responseformat: str, verbosity: str) -> dict:
+        self.queries.append(query)
+        south, west, north, east = map(
+            float, query[query.index("(") + 1 : query.index(")")].split(",")
+        )
+        buildings = [
+            (osm_id, latitude, longitude)
+            for osm_id, latitude, longitude in self.buildings
+            # The borders of neighboring tiles might be a rounding error apart
+            if south - 1e-9 <= latitude <= north + 1e-9 and west - 1e-9 <= longitude <= east + 1e-9
+        ]
+        self.returned_osm_ids.extend(osm_id for osm_id, _, _ in buildings)
+        return {
+            "type": "FeatureCollection",
+            "features": [
+                {
+                    "type": "Feature",
+                    "id": osm_id,
+                    "geometry": {
+                        "type": "Polygon",
+                        "coordinates": [[[longitude, latitude], [longitude + 0.0001, latitude]]],
+                    },
+                    "properties": {"building": "residential"},
+                }
+                for osm_id, latitude, longitude in buildings
+            ],
+        }
+
+
+def get_buildings() -> list:
+    # A grid of buildings around the center, with one of them right on a border between tiles
+    buildings = [
+        (
+            index,
+            CENTER_LATITUDE + 0.004 * (index // 20 - 10),
+            CENTER_LONGITUDE + 0.006 * (index % 20 - 10),
+        )
+        for index in range(400)
+    ]
+    buildings.append((1000, CENTER_LATITUDE, 402 * TILE_SIZE_DEGREES))
+    return buildings
+
+
+def test_tiles_cover_the_radius():
+    tiles = get_tiles_in_radius(CENTER_LATITUDE, CENTER_LONGITUDE, 5000)
+    assert len(tiles) == len(set(tiles))
+    for _, latitude, longitude in get_buildings():
+        if haversine_distance_m(CENTER_LATITUDE, CENTER_LONGITUDE, latitude, longitude) <= 5000:
+            assert get_tile(latitude, longitude) in tiles
+
+
+def test_buildings_are_fetched_once_per_tile(tmp_path):
+    cache_file_path = str(tmp_path / "buildings_cache.sqlite")
+    overpass_api = FakeOverpassAPI(get_buildings())
+    building_positions = get_all_residential_buildings(
+        CENTER_LATITUDE, CENTER_LONGITUDE, overpass_api, SQUARE_LENGTH_KM, cache_file_path
+    )
+    tiles = get_tiles_in_radius(CENTER_LATITUDE, CENTER_LONGITUDE, SQUARE_LENGTH_KM * 1000)
+    assert len(overpass_api.queries) == len(tiles)
+
+    # Only the buildings within the square, and the one on the border of two tiles only once
+    expected_positions = {
+        (latitude, longitude)
+        for _, latitude, longitude in get_buildings()
+        if haversine_distance_m(CENTER_LATITUDE, CENTER_LONGITUDE, latitude, longitude)
+        <= SQUARE_LENGTH_KM * 1000
+    }
+    assert overpass_api.returned_osm_ids.count(1000) == 2
+    positions = [(position.lat, position.lon) for position in building_positions]
+    assert len(positions) == len(expected_positions)
+    assert set(positions) == expected_positions
+
+    # The second time, everything comes from the cache
+    cached_positions = get_all_residential_buildings(
+        CENTER_LATITUDE, CENTER_LONGITUDE, overpass_api, SQUARE_LENGTH_KM, cache_file_path
+    )
+    assert len(overpass_api.queries) == len(tiles)
+    assert [(position.lat, position.lon) for position in cached_positions] == positions
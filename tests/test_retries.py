@@ -0,0 +1,230 @@
+import os
+import asyncio
+import datetime
+import aiohttp
+import pytest
+import requests
+
+from openrouteservice import exceptions as ors_exceptions
+
+from src.lib import retries
+from src.lib.retries import (
+    BACKOFF_BASE_SECONDS,
+    DEFAULT_MAX_ATTEMPTS,
+    MAX_BACKOFF_SECONDS,
+    MalformedResponseError,
+    call_with_retries,
+    call_with_retries_async,
+    get_backoff_seconds,
+    is_transient_error,
+)
+from src.lib.generating_routes import MAX_TASK_ATTEMPTS, iter_daily_routes_parallel
+from tests.helpers import StubDirectionsClient, generate_population
+
+START_DATE = datetime.date(2023, 4, 3)
+NUM_PEOPLE = 4
+NUM_DAYS = 3
+
+
+def get_client_response_error(status: int) -> aiohttp.ClientResponseError:
+    return aiohttp.ClientResponseError(None, (), status=status)
+
+
+@pytest.mark.parametrize(
+    "error",
+    [
+        ors_exceptions.Timeout(),
+        ors_exceptions.ApiError(429, "Rate limit exceeded"),
+        ors_exceptions.ApiError(503),
+        ors_exceptions.HTTPError(502),
+        MalformedResponseError("No routes"),
+        requests.exceptions.ConnectionError(),
+        requests.exceptions.ReadTimeout(),
+        get_client_response_error(500),
+        aiohttp.ClientConnectionError(),
+        asyncio.TimeoutError(),
+    ],
+)
+def test_transient_errors(error):
+    assert is_transient_error(error)
+
+
+@pytest.mark.parametrize(
+    "error",
+    [
+        ors_exceptions.ApiError(400, "Invalid coordinates"),
+        ors_exceptions.ApiError(404),
+        ors_exceptions.HTTPError(403),
+        get_client_response_error(400),
+        ValueError("Bug"),
+        KeyError("routes"),
+    ],
+)
+def test_permanent_errors(error):
+    assert not is_transient_error(error)
+
+
+def test_backoff_is_jittered_within_limits():
+    for attempt in range(10):
+        max_backoff_seconds = min(MAX_BACKOFF_SECONDS, BACKOFF_BASE_SECONDS * 2**attempt)
+        backoffs_seconds = [get_backoff_seconds(attempt) for _ in range(200)]
+        assert all(
+            0 <= backoff_seconds <= max_backoff_seconds for backoff_seconds in backoffs_seconds
+        )
+        # Spread over the whole range instead of all the same
+        assert max(backoffs_seconds) - min(backoffs_seconds) > max_backoff_seconds / 2
+    assert max_backoff_seconds == MAX_BACKOFF_SECONDS
+
+
+class FailingFunction:
+    # Raises the given errors one after the other, then returns the number of calls
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.num_calls = 0
+
+    def __call__(self, *args, **kwargs):
+        self.num_calls += 1
+        self.arguments = (args, kwargs)
+        if self.errors:
+            raise self.errors.pop(0)
+        return self.num_calls
+
+
+@pytest.fixture
+def sleeps(monkeypatch) -> list:
+    # Seconds of all sleeps between the attempts, none of which are actually slept
+    sleeps = list()
+    monkeypatch.setattr(retries.time, "sleep", sleeps.append)
+
+    async def sleep(seconds):
+        sleeps.append(seconds)
+
+    monkeypatch.setattr(retries.asyncio, "sleep", sleep)
+    return sleeps
+
+
+def test_transient_errors_are_retried(sleeps):
+    function = FailingFunction(ors_exceptions.Timeout(), ors_exceptions.ApiError(503))
+    assert call_with_retries(function, 1, profile="foot-walking") == 3
+    assert function.arguments == ((1,), {"profile": "foot-walking"})
+    assert len(sleeps) == 2
+    assert 0 <= sleeps[0] <= BACKOFF_BASE_SECONDS
+    assert 0 <= sleeps[1] <= 2 * BACKOFF_BASE_SECONDS
+
+
+def test_permanent_errors_are_raised_at_once(sleeps):
+    function = FailingFunction(ors_exceptions.ApiError(400), ors_exceptions.Timeout())
+    with pytest.raises(ors_exceptions.ApiError):
+        call_with_retries(function)
+    assert function.num_calls == 1
+    assert sleeps == []
+
+
+def test_last_transient_error_is_raised(sleeps):
+    function = FailingFunction(*[ors_exceptions.ApiError(503)] * (DEFAULT_MAX_ATTEMPTS + 1))
+    with pytest.raises(ors_exceptions.ApiError):
+        call_with_retries(function)
+    assert function.num_calls == DEFAULT_MAX_ATTEMPTS
+    assert len(sleeps) == DEFAULT_MAX_ATTEMPTS - 1
+
+    function = FailingFunction(ors_exceptions.Timeout(), ors_exceptions.Timeout())
+    with pytest.raises(ors_exceptions.Timeout):
+        call_with_retries(function, max_attempts=2)
+    assert function.num_calls == 2
+
+
+def test_async_retries(sleeps):
+    function = FailingFunction(get_client_response_error(502), get_client_response_error(404))
+
+    async def coroutine_function(*args, **kwargs):
+        return function(*args, **kwargs)
+
+    with pytest.raises(aiohttp.ClientResponseError):
+        asyncio.run(call_with_retries_async(coroutine_function))
+    assert function.num_calls == 2
+    assert len(sleeps) == 1
+
+    function = FailingFunction(asyncio.TimeoutError())
+    assert asyncio.run(call_with_retries_async(coroutine_function)) == 2
+
+
+class CrashingDirectionsClient(StubDirectionsClient):
+    # Kills the worker process that asks for the routes of the given home, every time or only the
+    # first time if there is a marker file to remember that it crashed already
+    def __init__(self, crashing_home: list, crash_marker_file_path: str = None):
+        super().__init__()
+        self.crashing_home = crashing_home
+        self.crash_marker_file_path = crash_marker_file_path
+        self.num_resets = 0
+
+    def directions(self, coords, *args, **kwargs) -> dict:
+        if list(coords[0]) == self.crashing_home:
+            if self.crash_marker_file_path is None:
+                os._exit(1)
+            try:
+                open(self.crash_marker_file_path, "x").close()
+            except FileExistsError:
+                pass
+            else:
+                os._exit(1)
+        return super().directions(coords, *args, **kwargs)
+
+    def reset_outstanding_requests(self):
+        self.num_resets += 1
+
+
+def generate_daily_routes(people: list, ors_client: StubDirectionsClient) -> (list, list):
+    # Returns the generated and the failed (person id, day index) pairs
+    failed_tasks = list()
+    generated_tasks = [
+        (person.id, day_index)
+        for person, day_index, _ in iter_daily_routes_parallel(
+            START_DATE,
+            NUM_DAYS,
+            people,
+            ors_client,
+            num_processes=2,
+            chunk_size=2,
+            on_task_failed=lambda person, day_index, error_message: failed_tasks.append(
+                (person.id, day_index, error_message)
+            ),
+            seed=1,
+        )
+    ]
+    return generated_tasks, failed_tasks
+
+
+def get_home(person) -> list:
+    return [person.home_location.lon, person.home_location.lat]
+
+
+def test_tasks_of_a_crashed_worker_are_requeued(tmp_path):
+    people = generate_population(1, NUM_PEOPLE)
+    ors_client = CrashingDirectionsClient(get_home(people[1]), str(tmp_path / "crashed"))
+    generated_tasks, failed_tasks = generate_daily_routes(people, ors_client)
+
+    # The pool was restarted and every daily route was generated once nevertheless
+    assert os.path.exists(tmp_path / "crashed")
+    assert ors_client.num_resets == 1
+    assert failed_tasks == []
+    assert sorted(generated_tasks) == sorted(
+        (person.id, day_index) for person in people for day_index in range(NUM_DAYS)
+    )
+
+
+def test_tasks_that_always_crash_fail_alone():
+    people = generate_population(1, NUM_PEOPLE)
+    ors_client = CrashingDirectionsClient(get_home(people[1]))
+    generated_tasks, failed_tasks = generate_daily_routes(people, ors_client)
+
+    # Only the crashing person's daily routes are missing, after trying each of them on its own
+    assert sorted(failed_tasks) == [
+        (people[1].id, day_index, "The worker process crashed") for day_index in range(NUM_DAYS)
+    ]
+    assert ors_client.num_resets >= NUM_DAYS * MAX_TASK_ATTEMPTS
+    assert sorted(generated_tasks) == sorted(
+        (person.id, day_index)
+        for person in people
+        for day_index in range(NUM_DAYS)
+        if person is not people[1]
+    )
@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+from src.lib.columnar_store import ColumnarRouteWriter, ColumnarRouteReader, merge_columnar_stores
+from src.lib.segment_store import SegmentRouteWriter, SegmentRouteReader, merge_segment_stores
+
+STORE_CLASSES = [
+    (ColumnarRouteWriter, ColumnarRouteReader, merge_columnar_stores),
+    (SegmentRouteWriter, SegmentRouteReader, merge_segment_stores),
+]
+
+
+def get_trajectories(num_people: int, num_days: int) -> dict:
+    # Random walks with whole coordinates and timestamps as a segment store keeps them. Every
+    # person goes the same way on every day, so that the segment store has segments to share
+    random_generator = np.random.default_rng(1)
+    trajectories = dict()
+    for person_id in range(num_people):
+        num_points = int(random_generator.integers(2, 200))
+        latitudes = 52.2 + np.cumsum(random_generator.integers(-100, 100, num_points)) * 1e-7
+        longitudes = 8.0 + np.cumsum(random_generator.integers(-100, 100, num_points)) * 1e-7
+        for day_index in range(num_days):
+            start_timestamp = 1680000000 + 86400 * day_index
+            timestamps = start_timestamp + np.cumsum(random_generator.integers(1, 60, num_points))
+            trajectories[(person_id, day_index)] = {
+                "latitudes": np.round(latitudes, 7),
+                "longitudes": np.round(longitudes, 7),
+                "timestamps": timestamps.astype(np.float64),
+            }
+    return trajectories
+
+
+def write_store(writer_class, directory_path, trajectories: dict, person_ids: list):
+    with writer_class(directory_path) as route_writer:
+        for person_id in person_ids:
+            route_writer.write_person_info({"id": person_id})
+        # In no particular order, like the routes come from the workers
+        for person_id, day_index in reversed(list(trajectories)):
+            if person_id in person_ids:
+                trajectory = trajectories[(person_id, day_index)]
+                route_writer.write_trajectory(
+                    person_id,
+                    day_index,
+                    trajectory["latitudes"],
+                    trajectory["longitudes"],
+                    trajectory["timestamps"],
+                )
+
+
+def assert_trajectories_equal(trajectory, expected_trajectory):
+    for column_name in ("latitudes", "longitudes", "timestamps"):
+        np.testing.assert_allclose(
+            trajectory[column_name], expected_trajectory[column_name], rtol=0, atol=1e-9
+        )
+
+
+@pytest.mark.parametrize("writer_class, reader_class, merge_stores", STORE_CLASSES)
+def test_store_round_trip(tmp_path, writer_class, reader_class, merge_stores):
+    trajectories = get_trajectories(num_people=5, num_days=3)
+    write_store(writer_class, tmp_path / "store", trajectories, list(range(5)))
+
+    route_reader = reader_class(tmp_path / "store")
+    assert len(route_reader) == len(trajectories)
+    assert list(route_reader.get_people()) == [{"id": person_id} for person_id in range(5)]
+    read_keys = list()
+    for person_id, day_index, trajectory in route_reader.iter_trajectories():
+        read_keys.append((person_id, day_index))
+        assert_trajectories_equal(trajectory, trajectories[(person_id, day_index)])
+    assert read_keys == sorted(trajectories)
+    assert_trajectories_equal(route_reader.get_trajectory(3, 1), trajectories[(3, 1)])
+    with pytest.raises(KeyError):
+        route_reader.get_trajectory(5, 0)
+
+
+@pytest.mark.parametrize("writer_class, reader_class, merge_stores", STORE_CLASSES)
+def test_merged_stores_equal_single_store(tmp_path, writer_class, reader_class, merge_stores):
+    trajectories = get_trajectories(num_people=6, num_days=2)
+    write_store(writer_class, tmp_path / "shard_0", trajectories, [0, 1, 2])
+    write_store(writer_class, tmp_path / "shard_1", trajectories, [3, 4, 5])
+    merge_stores([tmp_path / "shard_0", tmp_path / "shard_1"], tmp_path / "merged")
+
+    route_reader = reader_class(tmp_path / "merged")
+    assert len(route_reader) == len(trajectories)
+    assert list(route_reader.get_people()) == [{"id": person_id} for person_id in range(6)]
+    for person_id, day_index, trajectory in route_reader.iter_trajectories():
+        assert_trajectories_equal(trajectory, trajectories[(person_id, day_index)])
@@ -0,0 +1,119 @@
+import datetime
+import numpy as np
+
+from src.lib.schedule import (
+    MAX_EXTRA_FREE_TIME_STAY_DURATION_HOURS,
+    MAX_WORK_STAY_DURATION_VARIATION_HOURS,
+    SCHEDULE_COLUMN_NAMES,
+    WEEKEND_START_OF_DAY_FROM,
+    WEEKEND_START_OF_DAY_TO,
+    WORK_STAY_DURATION_HOURS,
+    generate_schedule,
+)
+from tests.helpers import generate_population
+
+SEED = 4
+NUM_PEOPLE = 30
+# A Monday, so that the days include a weekend
+START_DATE = datetime.date(2023, 4, 3)
+NUM_DAYS = 9
+
+
+def get_people() -> list:
+    people = generate_population(SEED, NUM_PEOPLE)
+    # Someone without any favorite free time places
+    people[2].favorite_free_time_place_ids = list()
+    return people
+
+
+def get_midnight_timestamp(day_index: int) -> float:
+    date = START_DATE + datetime.timedelta(days=int(day_index))
+    return datetime.datetime.combine(date, datetime.time()).timestamp()
+
+
+def assert_schedules_equal(schedule, other_schedule, person_indexes=None):
+    for column_name in SCHEDULE_COLUMN_NAMES:
+        column = getattr(schedule, column_name)
+        if person_indexes is not None and column_name != "is_weekend":
+            column = column[person_indexes]
+        np.testing.assert_array_equal(column, getattr(other_schedule, column_name))
+
+
+def test_schedule_is_deterministic_for_a_seed():
+    people = get_people()
+    schedule = generate_schedule(people, START_DATE, NUM_DAYS, SEED)
+    assert_schedules_equal(schedule, generate_schedule(get_people(), START_DATE, NUM_DAYS, SEED))
+    # Any subset of the people gets the same days, e.g. a shard
+    assert_schedules_equal(
+        schedule, generate_schedule(people[10:20], START_DATE, NUM_DAYS, SEED), slice(10, 20)
+    )
+    other_schedule = generate_schedule(people, START_DATE, NUM_DAYS, SEED + 1)
+    assert not np.array_equal(
+        schedule.start_of_day_timestamps, other_schedule.start_of_day_timestamps
+    )
+
+
+def test_schedule_stays_within_its_ranges():
+    people = get_people()
+    schedule = generate_schedule(people, START_DATE, NUM_DAYS, SEED)
+    assert schedule.get_num_days() == NUM_DAYS
+    for day_index in range(NUM_DAYS):
+        date = START_DATE + datetime.timedelta(days=day_index)
+        is_weekend = date.weekday() >= 5
+        assert schedule.is_weekend[day_index] == is_weekend
+        midnight_timestamp = get_midnight_timestamp(day_index)
+        for person_index, person in enumerate(people):
+            if is_weekend:
+                start_hours_from, start_hours_to = (
+                    WEEKEND_START_OF_DAY_FROM,
+                    WEEKEND_START_OF_DAY_TO,
+                )
+            else:
+                start_hours_from = person.workplace.start_time_from
+                start_hours_to = person.workplace.start_time_to
+            start_of_day_seconds = (
+                schedule.start_of_day_timestamps[person_index, day_index] - midnight_timestamp
+            )
+            assert start_hours_from * 3600 <= start_of_day_seconds <= start_hours_to * 3600
+            assert start_of_day_seconds % 60 == 0
+
+            work_stay_duration_hours = (
+                schedule.work_stay_durations_seconds[person_index, day_index] / 3600
+            )
+            assert (
+                abs(work_stay_duration_hours - WORK_STAY_DURATION_HOURS)
+                <= MAX_WORK_STAY_DURATION_VARIATION_HOURS
+            )
+
+            free_time_place_id = schedule.free_time_place_ids[person_index, day_index]
+            free_time_stay_duration_hours = (
+                schedule.free_time_stay_durations_seconds[person_index, day_index] / 3600
+            )
+            if not person.favorite_free_time_place_ids:
+                assert free_time_place_id == -1
+                assert np.isnan(free_time_stay_duration_hours)
+                continue
+            assert free_time_place_id in person.favorite_free_time_place_ids
+            typical_stay_duration_hours = person.place_registry.get_free_time_place(
+                free_time_place_id
+            ).typical_stay_duration_hours
+            assert (
+                typical_stay_duration_hours
+                <= free_time_stay_duration_hours
+                <= typical_stay_duration_hours + MAX_EXTRA_FREE_TIME_STAY_DURATION_HOURS
+            )
+
+
+def test_start_of_day_covers_the_whole_timeframe():
+    people = get_people()
+    schedule = generate_schedule(people, START_DATE, 60, SEED)
+    # The weekend days of all people, relative to local midnight
+    weekend_start_hours = np.concatenate(
+        [
+            (schedule.start_of_day_timestamps[:, day_index] - get_midnight_timestamp(day_index))
+            / 3600
+            for day_index in np.flatnonzero(schedule.is_weekend)
+        ]
+    )
+    assert weekend_start_hours.min() < WEEKEND_START_OF_DAY_FROM + 0.5
+    assert weekend_start_hours.max() > WEEKEND_START_OF_DAY_TO - 0.5
@@ -0,0 +1,55 @@
+import datetime
+import numpy as np
+
+from src.lib.generating_routes import iter_daily_routes_parallel
+from src.lib.columnar_store import ColumnarRouteWriter, ColumnarRouteReader, merge_columnar_stores
+from src.lib.seeding import get_shard_range
+from tests.helpers import get_grid_routing_engine, generate_population
+
+SEED = 3
+NUM_PEOPLE = 6
+NUM_DAYS = 2
+NUM_SHARDS = 2
+START_DATE = datetime.date(2023, 4, 3)
+
+
+def generate_store(directory_path, people: list, routing_engine):
+    with ColumnarRouteWriter(directory_path) as route_writer:
+        for person in people:
+            route_writer.write_person(person)
+        for person, day_index, daily_route in iter_daily_routes_parallel(
+            START_DATE, NUM_DAYS, people, routing_engine, num_processes=1, seed=SEED
+        ):
+            route_writer.write_daily_route(person.id, day_index, daily_route)
+
+
+def test_merged_shards_equal_single_run(tmp_path):
+    routing_engine = get_grid_routing_engine()
+    generate_store(tmp_path / "single", generate_population(SEED, NUM_PEOPLE), routing_engine)
+
+    shard_directory_paths = list()
+    for shard_index in range(NUM_SHARDS):
+        people = generate_population(SEED, NUM_PEOPLE)
+        first_person_index, last_person_index = get_shard_range(
+            len(people), shard_index, NUM_SHARDS
+        )
+        shard_directory_path = tmp_path / f"shard_{shard_index}"
+        generate_store(
+            shard_directory_path, people[first_person_index:last_person_index], routing_engine
+        )
+        shard_directory_paths.append(shard_directory_path)
+    merge_columnar_stores(shard_directory_paths, tmp_path / "merged")
+
+    single_reader = ColumnarRouteReader(tmp_path / "single")
+    merged_reader = ColumnarRouteReader(tmp_path / "merged")
+    assert len(single_reader) == NUM_PEOPLE * NUM_DAYS
+    assert list(merged_reader.get_people()) == list(single_reader.get_people())
+    for (person_id, day_index, trajectory), (
+        merged_person_id,
+        merged_day_index,
+        merged_trajectory,
+    ) in zip(single_reader.iter_trajectories(), merged_reader.iter_trajectories(), strict=True):
+        assert (merged_person_id, merged_day_index) == (person_id, day_index)
+        assert len(trajectory["latitudes"]) > 1
+        for column_name in ("latitudes", "longitudes", "timestamps"):
+            np.testing.assert_array_equal(merged_trajectory[column_name], trajectory[column_name])
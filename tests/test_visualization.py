@@ -0,0 +1,118 @@
+import json
+import numpy as np
+import pytest
+
+from src.lib import visualization
+from src.lib.visualization import (
+    HEATMAP_FILE_NAME_TEMPLATE,
+    VisualizationExporter,
+    simplify_douglas_peucker,
+)
+
+
+def get_distances_to_line(xs, ys, first: int, last: int) -> np.ndarray:
+    # Distances of the points between first and last to the line through them, or to the first
+    # point if both are the same
+    delta_x = xs[last] - xs[first]
+    delta_y = ys[last] - ys[first]
+    offset_xs = xs[first + 1 : last] - xs[first]
+    offset_ys = ys[first + 1 : last] - ys[first]
+    length = np.hypot(delta_x, delta_y)
+    if length == 0:
+        return np.hypot(offset_xs, offset_ys)
+    return np.abs(delta_x * offset_ys - delta_y * offset_xs) / length
+
+
+def simplify_recursively(xs, ys, tolerance: float, first: int, last: int, is_kept: np.ndarray):
+    if last - first < 2:
+        return
+    distances = get_distances_to_line(xs, ys, first, last)
+    farthest = first + 1 + int(np.argmax(distances))
+    if distances.max() > tolerance:
+        is_kept[farthest] = True
+        simplify_recursively(xs, ys, tolerance, first, farthest, is_kept)
+        simplify_recursively(xs, ys, tolerance, farthest, last, is_kept)
+
+
+def get_random_walk(seed: int, num_points: int) -> (np.ndarray, np.ndarray):
+    random_generator = np.random.default_rng(seed)
+    return (
+        np.cumsum(random_generator.normal(size=num_points)),
+        np.cumsum(random_generator.normal(size=num_points)),
+    )
+
+
+@pytest.mark.parametrize("tolerance", [0.1, 1.0, 5.0])
+def test_simplification_respects_tolerance(tolerance):
+    xs, ys = get_random_walk(1, 1000)
+    is_kept = simplify_douglas_peucker(xs, ys, tolerance)
+    assert is_kept[0] and is_kept[-1]
+    assert 2 < is_kept.sum() < len(xs)
+    kept_indexes = np.flatnonzero(is_kept)
+    for first, last in zip(kept_indexes[:-1], kept_indexes[1:]):
+        if last - first > 1:
+            assert get_distances_to_line(xs, ys, first, last).max() <= tolerance
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_simplification_matches_recursive_douglas_peucker(seed):
+    xs, ys = get_random_walk(seed, 500)
+    expected_is_kept = np.zeros(len(xs), dtype=bool)
+    expected_is_kept[[0, -1]] = True
+    simplify_recursively(xs, ys, 1.0, 0, len(xs) - 1, expected_is_kept)
+    np.testing.assert_array_equal(simplify_douglas_peucker(xs, ys, 1.0), expected_is_kept)
+
+
+def test_simplification_of_short_and_closed_lines():
+    assert simplify_douglas_peucker(np.array([]), np.array([]), 1.0).tolist() == []
+    assert simplify_douglas_peucker(np.array([1.0]), np.array([2.0]), 1.0).tolist() == [True]
+    # A straight line only needs its ends
+    xs = np.linspace(0, 10, 11)
+    assert simplify_douglas_peucker(xs, 2 * xs, 0.01).tolist() == [True] + [False] * 9 + [True]
+    # A route back to where it started keeps the point that is farthest away from there
+    xs = np.array([0.0, 1.0, 5.0, 1.0, 0.0])
+    ys = np.zeros(5)
+    assert simplify_douglas_peucker(xs, ys, 0.5).tolist() == [True, False, True, False, True]
+
+
+def export_heatmap(directory_path, trajectories: list, zoom: int) -> dict:
+    # Count of each cell center of the heatmap
+    with VisualizationExporter(directory_path, [zoom]) as visualization_exporter:
+        for trajectory in trajectories:
+            visualization_exporter.add_trajectory(*trajectory)
+    with open(directory_path / HEATMAP_FILE_NAME_TEMPLATE.format(zoom=zoom), "r") as heatmap_file:
+        features = json.load(heatmap_file)["features"]
+    return {
+        tuple(coordinates): feature["properties"]["count"]
+        for feature in features
+        for coordinates in feature["geometry"]["coordinates"]
+    }
+
+
+def get_random_trajectories(seed: int, num_trajectories: int) -> list:
+    trajectories = list()
+    for trajectory_index in range(num_trajectories):
+        xs, ys = get_random_walk(seed + trajectory_index, 200)
+        trajectories.append(
+            (trajectory_index, 0, 52.2 + ys * 0.001, 8.0 + xs * 0.001, np.arange(200.0))
+        )
+    return trajectories
+
+
+def test_heatmap_counts_daily_routes(tmp_path):
+    xs = np.linspace(0.0, 0.01, 50)
+    trajectory = (1, 0, np.full(50, 52.2), 8.0 + xs, np.arange(50.0))
+    # The route passes through each cell many times, but is counted once per cell
+    heatmap = export_heatmap(tmp_path, [trajectory] * 3, 13)
+    assert len(heatmap) > 1
+    assert set(heatmap.values()) == {3}
+
+
+@pytest.mark.parametrize("merge_buffer_size", [1, 150, 1000])
+def test_heatmap_counts_dont_depend_on_merging(tmp_path, monkeypatch, merge_buffer_size):
+    trajectories = get_random_trajectories(1, 20) * 2
+    expected_heatmap = export_heatmap(tmp_path / "unmerged", trajectories, 13)
+    assert max(expected_heatmap.values()) > 2
+
+    monkeypatch.setattr(visualization, "HEATMAP_MERGE_BUFFER_SIZE", merge_buffer_size)
+    assert export_heatmap(tmp_path / "merged", trajectories, 13) == expected_heatmap
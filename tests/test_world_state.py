@@ -0,0 +1,46 @@
+import pytest
+
+from src.lib.world_state import (
+    MAX_CACHED_PEOPLE,
+    WorldState,
+    temporary_world_state,
+    write_world_state,
+)
+from tests.helpers import get_people
+
+
+def test_people_and_places_round_trip():
+    people = get_people(4)
+    with temporary_world_state(people) as directory_path:
+        world_state = WorldState(directory_path)
+        assert len(world_state) == len(people)
+        for person_index, person in enumerate(people):
+            loaded_person = world_state.get_person(person_index)
+            assert loaded_person.to_dict() == person.to_dict()
+            assert loaded_person.workplace.name == person.workplace.name
+            assert loaded_person.workplace.max_workers == person.workplace.max_workers
+            assert [
+                free_time_place.typical_stay_duration_hours
+                for free_time_place in loaded_person.favorite_free_time_places
+            ] == [
+                free_time_place.typical_stay_duration_hours
+                for free_time_place in person.favorite_free_time_places
+            ]
+        # The same object, so that its route templates are reused
+        assert world_state.get_person(3) is world_state.get_person(3)
+
+
+def test_only_the_last_people_are_cached():
+    people = get_people(4)
+    with temporary_world_state(people) as directory_path:
+        world_state = WorldState(directory_path)
+        first_person = world_state.get_person(0)
+        for person_index in range(1, len(people)):
+            world_state.get_person(person_index)
+        assert len(world_state._people) == MAX_CACHED_PEOPLE
+        assert world_state.get_person(0) is not first_person
+
+
+def test_people_must_share_a_place_registry(tmp_path):
+    with pytest.raises(ValueError):
+        write_world_state(tmp_path / "world_state", get_people(2) + get_people(1))